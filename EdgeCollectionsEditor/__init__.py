@@ -1,15 +1,44 @@
 import pathlib
 import sqlite3
+import typing
 
 from EdgeCollectionsEditor.enums import *
-from EdgeCollectionsEditor import utils
+from EdgeCollectionsEditor import blobs, profiling, utils
 from EdgeCollectionsEditor.utils import row_factory
 
-def connect_to_db(file_location: pathlib.Path|str|None = None)-> tuple[sqlite3.Connection, pathlib.Path]:
+def connect_to_db(file_location: pathlib.Path|str|None = None, mode: typing.Literal["rw", "ro"] = "rw", immutable: bool = False,
+                  mmap_size: int|None = None, cache_size: int|None = None, temp_store: str|None = None, query_only: bool|None = None,
+                  check_same_thread: bool = True, mirror: typing.Literal["memory", "file"]|None = None)-> tuple[sqlite3.Connection, pathlib.Path]:
     """ Returns a connection to the Edge Collections database.
     
     If file_location is None, the default location will be used.
+    While profiling is enabled (see profiling.enable), the connection's SQL is captured.
+
+    Args:
+        file_location (pathlib.Path|str|None, optional): The location of the database. Defaults to None.
+        mode (typing.Literal["rw", "ro"], optional): "ro" opens the database read-only (through a file: URI),
+            so the connection can never write to the browser's database. Defaults to "rw".
+        immutable (bool, optional): Only valid with mode="ro". Tells SQLite the file cannot change while it is open,
+            which skips all locking; only use it on a snapshot (e.g. a backup), never on the live database. Defaults to False.
+        mmap_size (int|None, optional): Sets PRAGMA mmap_size (in bytes). Defaults to None (SQLite's default).
+        cache_size (int|None, optional): Sets PRAGMA cache_size (pages if positive, KiB if negative). Defaults to None.
+        temp_store (str|None, optional): Sets PRAGMA temp_store to "default", "file" or "memory". Defaults to None.
+        query_only (bool|None, optional): Sets PRAGMA query_only. Defaults to None.
+        check_same_thread (bool, optional): Passed to sqlite3.connect. Defaults to True.
+        mirror (typing.Literal["memory", "file"]|None, optional): Copy the database into memory or a temporary file, with the
+            indexes Edge's schema lacks, and return a mirror.MirrorConnection to the copy: queries never touch the real file, and
+            changes are written back to it in one transaction on commit (read-only mirrors with mode="ro"). Defaults to None.
+
+    Raises:
+        FileNotFoundError: If the database cannot be found.
+        ValueError: If file_location is not a file or the options are invalid.
     """
+    if mode not in ("rw", "ro"):
+        raise ValueError(f"Invalid mode: {mode}")
+    if immutable and mode != "ro":
+        raise ValueError("immutable requires mode='ro'")
+    if temp_store is not None and temp_store not in utils.TEMP_STORE:
+        raise ValueError(f"temp_store must be one of {utils.TEMP_STORE}")
     f = file_location
 
     if f is None:
@@ -23,7 +52,22 @@ def connect_to_db(file_location: pathlib.Path|str|None = None)-> tuple[sqlite3.C
             raise FileNotFoundError(f"Could not find Edge Collections database at {file_location}")
     if not f.is_file():
         raise ValueError(f"{file_location} is not a file")
-    return sqlite3.connect(f), f
+    if mirror is not None:
+        ## Imported here, as mirror imports this package
+        from EdgeCollectionsEditor import mirror as _mirror
+        conn = _mirror.open_mirror(f, mirror, read_only=mode == "ro", immutable=immutable, check_same_thread=check_same_thread)
+    elif mode == "ro":
+        uri = f"{f.resolve().as_uri()}?mode=ro{'&immutable=1' if immutable else ''}"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=check_same_thread)
+    else:
+        conn = sqlite3.connect(f, check_same_thread=check_same_thread)
+    try:
+        utils.set_pragmas(conn, mmap_size=mmap_size, cache_size=cache_size, temp_store=temp_store, query_only=query_only)
+    except BaseException:
+        conn.close()
+        raise
+    profiling.attach(conn)
+    return conn, f
 
 @row_factory
 def check_syncable_collections(conn: sqlite3.Connection)-> list[sqlite3.Row]:
@@ -35,11 +79,20 @@ LEFT JOIN collections_sync ON collections.id = collections_sync.collection_id
 WHERE collections_sync.is_syncable = 1 OR collections.is_syncable = 1;""").fetchall()
 
 @row_factory
-def get_table(conn: sqlite3.Connection, table_name: Tables)-> list[sqlite3.Row]:
-    """ Returns a list of rows from the specified table. """
+def get_table(conn: sqlite3.Connection, table_name: Tables, lazy: bool = False)-> list[sqlite3.Row]:
+    """ Returns a list of rows from the specified table.
+        If lazy is True, blob columns are returned as blobs.LazyBlob handles.
+    """
+    if table_name not in Tables:
+        raise ValueError(f"Invalid table name: {table_name}")
+    return blobs.execute(conn, table_name, f"FROM {table_name.value}", lazy=lazy).fetchall()
+
+@row_factory
+def iter_table(conn: sqlite3.Connection, table_name: Tables, batch_size: int = utils.DEFAULT_BATCH_SIZE, lazy: bool = False)-> typing.Iterator[sqlite3.Row]:
+    """ Streaming version of get_table: yields the rows of the specified table, fetching batch_size rows at a time. """
     if table_name not in Tables:
         raise ValueError(f"Invalid table name: {table_name}")
-    return conn.execute(f"SELECT * FROM {table_name.value}").fetchall()
+    return utils.iter_rows(blobs.execute(conn, table_name, f"FROM {table_name.value}", lazy=lazy), batch_size)
 
 class ConnectionNamesRow(sqlite3.Row):
     id: str
@@ -50,19 +103,19 @@ def list_collections(conn: sqlite3.Connection)-> list[ConnectionNamesRow]:
     return conn.execute("SELECT id, title FROM collections").fetchall()
 
 @row_factory
-def get_collection_by_id(conn: sqlite3.Connection, collection_id: str)-> sqlite3.Row:
+def get_collection_by_id(conn: sqlite3.Connection, collection_id: str, lazy: bool = False)-> sqlite3.Row:
     """ Returns the collection with the specified id. """
-    return conn.execute("SELECT * FROM collections WHERE id = ?", (collection_id,)).fetchone()
+    return blobs.execute(conn, Tables.COLLECTIONS, "FROM collections WHERE id = ?", (collection_id,), lazy=lazy).fetchone()
 
 @row_factory
-def get_collections_by_title(conn: sqlite3.Connection, collection_title: str)-> list[sqlite3.Row]:
+def get_collections_by_title(conn: sqlite3.Connection, collection_title: str, lazy: bool = False)-> list[sqlite3.Row]:
     """ Returns a list of collections with the specified title. """
-    return conn.execute("SELECT * FROM collections WHERE title = ?", (collection_title,)).fetchall()
+    return blobs.execute(conn, Tables.COLLECTIONS, "FROM collections WHERE title = ?", (collection_title,), lazy=lazy).fetchall()
 
 @row_factory
-def get_collections_by_title_like(conn: sqlite3.Connection, collection_title: str)-> list[sqlite3.Row]:
+def get_collections_by_title_like(conn: sqlite3.Connection, collection_title: str, lazy: bool = False)-> list[sqlite3.Row]:
     """ Returns a list of collections with the specified title. """
-    return conn.execute("SELECT * FROM collections WHERE title LIKE ?", (f"%{collection_title}%",)).fetchall()
+    return blobs.execute(conn, Tables.COLLECTIONS, "FROM collections WHERE title LIKE ?", (f"%{collection_title}%",), lazy=lazy).fetchall()
 
 def delete_collection(conn: sqlite3.Connection, collection_id: str):
     """ Deletes the collection with the specified id. """
@@ -78,59 +131,97 @@ def list_items(conn: sqlite3.Connection)-> list[sqlite3.Row]:
     return conn.execute("SELECT id, title FROM items").fetchall()
 
 @row_factory
-def get_item_by_id(conn: sqlite3.Connection, item_id: str)-> sqlite3.Row:
+def iter_items(conn: sqlite3.Connection, batch_size: int = utils.DEFAULT_BATCH_SIZE)-> typing.Iterator[sqlite3.Row]:
+    """ Streaming version of list_items: yields item titles and ids, fetching batch_size rows at a time. """
+    return utils.iter_rows(conn.execute("SELECT id, title FROM items"), batch_size)
+
+@row_factory
+def get_item_by_id(conn: sqlite3.Connection, item_id: str, lazy: bool = False)-> sqlite3.Row:
     """ Returns the item with the specified id. """
-    return conn.execute("SELECT * FROM items WHERE id = ?", (item_id,)).fetchone()
+    return blobs.execute(conn, Tables.ITEMS, "FROM items WHERE id = ?", (item_id,), lazy=lazy).fetchone()
 
 @row_factory
-def get_items_by_title(conn: sqlite3.Connection, item_title: str)-> list[sqlite3.Row]:
+def get_items_by_title(conn: sqlite3.Connection, item_title: str, lazy: bool = False)-> list[sqlite3.Row]:
     """ Returns a list of items with the specified title. """
-    return conn.execute("SELECT * FROM items WHERE title = ?", (item_title,)).fetchall()
+    return blobs.execute(conn, Tables.ITEMS, "FROM items WHERE title = ?", (item_title,), lazy=lazy).fetchall()
 
 @row_factory
-def get_items_by_title_like(conn: sqlite3.Connection, item_title: str)-> list[sqlite3.Row]:
+def get_items_by_title_like(conn: sqlite3.Connection, item_title: str, lazy: bool = False)-> list[sqlite3.Row]:
     """ Returns a list of items with the specified title. """
-    return conn.execute("SELECT * FROM items WHERE title LIKE ?", (f"%{item_title}%",)).fetchall()
+    return blobs.execute(conn, Tables.ITEMS, "FROM items WHERE title LIKE ?", (f"%{item_title}%",), lazy=lazy).fetchall()
+
+@row_factory
+def iter_items_by_title_like(conn: sqlite3.Connection, item_title: str, batch_size: int = utils.DEFAULT_BATCH_SIZE, lazy: bool = False)-> typing.Iterator[sqlite3.Row]:
+    """ Streaming version of get_items_by_title_like: yields matching items, fetching batch_size rows at a time. """
+    return utils.iter_rows(blobs.execute(conn, Tables.ITEMS, "FROM items WHERE title LIKE ?", (f"%{item_title}%",), lazy=lazy), batch_size)
 
 @row_factory
-def get_items_by_collection(conn: sqlite3.Connection, collection: str|sqlite3.Row)-> list[sqlite3.Row]:
+def get_items_by_collection(conn: sqlite3.Connection, collection: str|sqlite3.Row, lazy: bool = False)-> list[sqlite3.Row]:
     """ Returns a list of items in the specified collection.
     
     Args:
         conn (sqlite3.Connection): The connection to the Edge Collections database.
         collection (str|sqlite3.Row): The collection to get the items from.
             If a string is passed it will be used as the collection id.
+        lazy (bool, optional): Whether to return blob columns as blobs.LazyBlob handles. Defaults to False.
     
     Returns:
         list[sqlite3.Row]: A list of items in the specified collection.
     """
     if isinstance(collection, sqlite3.Row):
         collection = collection["id"]
-    return conn.execute("SELECT items.* FROM items LEFT JOIN collections_items_relationship ON items.id = collections_items_relationship.item_id WHERE parent_id = ?", (collection,)).fetchall()
+    return blobs.execute(conn, Tables.ITEMS, "FROM items LEFT JOIN collections_items_relationship ON items.id = collections_items_relationship.item_id WHERE parent_id = ?", (collection,), lazy=lazy, qualify=True).fetchall()
 
 @row_factory
-def link_items_to_collections(conn: sqlite3.Connection, items: list[sqlite3.Row])-> list[dict]:
+def iter_items_by_collection(conn: sqlite3.Connection, collection: str|sqlite3.Row, batch_size: int = utils.DEFAULT_BATCH_SIZE, lazy: bool = False)-> typing.Iterator[sqlite3.Row]:
+    """ Streaming version of get_items_by_collection: yields the items in the specified collection,
+        fetching batch_size rows at a time.
+    
+    Args:
+        conn (sqlite3.Connection): The connection to the Edge Collections database.
+        collection (str|sqlite3.Row): The collection to get the items from.
+            If a string is passed it will be used as the collection id.
+        batch_size (int, optional): The number of rows to fetch at a time. Defaults to utils.DEFAULT_BATCH_SIZE.
+        lazy (bool, optional): Whether to return blob columns as blobs.LazyBlob handles. Defaults to False.
+    
+    Returns:
+        typing.Iterator[sqlite3.Row]: An iterator over the items in the specified collection.
+    """
+    if isinstance(collection, sqlite3.Row):
+        collection = collection["id"]
+    return utils.iter_rows(blobs.execute(conn, Tables.ITEMS, "FROM items LEFT JOIN collections_items_relationship ON items.id = collections_items_relationship.item_id WHERE parent_id = ?", (collection,), lazy=lazy, qualify=True), batch_size)
+
+@row_factory
+def link_items_to_collections(conn: sqlite3.Connection, items: typing.Iterable[sqlite3.Row])-> list[dict]:
     """ Fetches the collections for each item provided and lists them under the nested keys "collections_items_relationships"->"parent_id".
 
+    Item ids are bound as parameters in chunks that stay under the connection's variable limit, and the results
+        are grouped onto their items in a single pass. Each collection is only fetched (and converted to a dict) once,
+        so relationships to the same collection share the same "parentid" dict.
+
     Args:
         conn (sqlite3.Connection): The connection to the Edge Collections database.
-        items (list[sqlite3.Row]): A list of items to link to collections.
+        items (typing.Iterable[sqlite3.Row]): The items to link to collections.
 
     Returns:
         list[dict]: A list of dictionaries containing the item and its connected collections, by way of collections_items_relationships key.
+            Each item's relationships are ordered by position.
     """
     itemdicts = {item["id"]: item for item in utils.rows_to_dict(*items)}
-    item_list = []
     for item in itemdicts.values():
         item['collections_items_relationships'] = []
-        item_list.append(f'"{item['id']}"')
-    connections = conn.execute(""" SELECT * FROM collections_items_relationship cir
-                               LEFT JOIN collections c ON c.id = cir.parent_id
-                               WHERE item_id IN (""" + ", ".join(item_list) + """)""").fetchall()
-    for connection in connections:
-        collection = list(utils.rows_to_dict(connection))[0]
-        connection = {k: collection.pop(k) for k in ["item_id", "parent_id", "position"]}
-        connection['parentid'] = collection
-        item = itemdicts[connection['item_id']]
-        item['collections_items_relationships'].append(connection)
-    return list(itemdicts.values())
\ No newline at end of file
+    chunksize = utils.max_variables(conn)
+
+    relationships = []
+    for chunk in utils.chunked(list(itemdicts), chunksize):
+        relationships.extend(conn.execute(f"""SELECT item_id, parent_id, position FROM collections_items_relationship
+                                          WHERE item_id IN ({", ".join("?"*len(chunk))}) ORDER BY position""", chunk))
+
+    collections = {}
+    for chunk in utils.chunked(list({relationship["parent_id"] for relationship in relationships}), chunksize):
+        for collection in utils.rows_to_dict(*conn.execute(f"""SELECT * FROM collections WHERE id IN ({", ".join("?"*len(chunk))})""", chunk)):
+            collections[collection["id"]] = collection
+
+    for item_id, parent_id, position in relationships:
+        itemdicts[item_id]['collections_items_relationships'].append({"item_id": item_id, "parent_id": parent_id, "position": position, "parentid": collections.get(parent_id)})
+    return list(itemdicts.values())
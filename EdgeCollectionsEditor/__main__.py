@@ -2,56 +2,308 @@ import argparse
 import pathlib
 from pprint import pprint
 import sqlite3
+import sys
 
 import EdgeCollectionsEditor as ECE
-from EdgeCollectionsEditor import utils
+from EdgeCollectionsEditor import analytics, batch, dedupe, diff, export, profiling, query, search, storage, tags, utils
 
-def query_table(db: sqlite3.Connection, table: ECE.Tables, column: str, value: str, like: bool = False)-> list[sqlite3.Row]:
-    """ Queries the specified table for the specified column and value. """
-    tablename, columnname = utils.sanitize_table_and_column(table.value, column)
-    if like:
-        with utils.RowFactory(db):
-            return db.execute(f'SELECT * FROM {tablename} WHERE {columnname} LIKE ?;', (f"%{value}%",)).fetchall()
-    with utils.RowFactory(db):
-        return db.execute(f"SELECT * FROM {tablename} WHERE {columnname} = ?;", (value,)).fetchall()
+def build_query(args: argparse.Namespace)-> query.Query:
+    """ Builds the query of sample_data from its arguments. """
+    filters = [query.parse_filter(text) for text in args.where]
+    if args.column is not None:
+        if not args.value:
+            raise ValueError("--value must be specified with --column.")
+        filters.append(query.Filter(args.column, "~" if args.like else "=", args.value))
+    for column, text in ((query.DATE_COLUMNS[0], args.created), (query.DATE_COLUMNS[1], args.modified)):
+        if text is not None:
+            filters.extend(query.date_range(column, text))
+    order_by = [query.parse_order(text) for text in args.order_by]
+    tag_filters = [tags.parse_tag_filter(text) for text in args.tag]
+    return query.Query(args.table, columns=args.columns, filters=filters, order_by=order_by, limit=args.limit, offset=args.offset,
+                       tag_filters=tag_filters)
+
+def print_sample(db: sqlite3.Connection, q: query.Query, batch_size: int):
+    print(q.table, query.count(db, q))
+    results = list(utils.rows_to_dict(*query.select(db, q, lazy=True, batch_size=batch_size)))
+    utils.truncate_blobs(*results)
+    pprint(results)
 
 def sample_data(args: argparse.Namespace):
-    """ Prints sample data from the Edge Collections database. """
-    db, _ = ECE.connect_to_db(file_location=args.file_location)
-    limit = 1
-    if args.limit is not None:
-        limit = args.limit
-    if args.column is not None:
-        if not args.value or not args.table:
-            raise ValueError("Both --value and --table must be specified to filter the sample data.")
-        results = query_table(db, args.table, args.column, args.value, like=args.like)
-    elif args.table is not None:
-        results = ECE.get_table(db, args.table)
-    else:
+    """ Prints the number of matching rows and a sample of them, from one table or (without --table) from every table. """
+    db, _ = ECE.connect_to_db(file_location=args.file_location, mode="ro")
+    if args.table is None:
+        if args.where or args.column or args.created or args.modified or args.order_by or args.columns or args.tag:
+            raise ValueError("--table must be specified to filter, order or project the sample data.")
         for table in ECE.Tables:
-            result = ECE.get_table(db, table)
-            print(table, len(result))
-            results = list(utils.rows_to_dict(*result[:limit]))
-            utils.truncate_blobs(*results)
-            pprint(results)
+            print_sample(db, query.Query(table, limit=args.limit, offset=args.offset), args.batch_size)
             print("-----\n")
         return
+    print_sample(db, build_query(args), args.batch_size)
+
+def tag_query(args: argparse.Namespace):
+    """ Lists the paths (or the values at a path) in the tags of a table, or the rows whose tags match filters. """
+    db, file_location = ECE.connect_to_db(file_location=args.file_location, mode="ro")
+    table = ECE.Tables(args.kind)
+    if args.values is not None:
+        for row in tags.tag_values(db, table, args.values, limit=args.top):
+            print(f"{row['rows']:>8}  {row['value']!r}")
+        return
+    if not args.filters:
+        for row in tags.tag_paths(db, table)[:args.top]:
+            print(f"{row['rows']:>8}  {row['path']}")
+        return
+    filters = [tags.parse_tag_filter(text) for text in args.filters]
+    if args.index:
+        index = tags.connect_index(file_location, args.index_location)
+        if not args.no_refresh:
+            tags.refresh_index(index)
+        rows = tags.get_by_ids(db, table, tags.index_lookup(index, table, filters))
+    else:
+        rows = tags.get_by_tags(db, table, filters)
+    for row in rows[:args.top]:
+        print(f"{row['id']}  {row['title']}  {row['tag']}")
+    print(len(rows))
+
+def search_index(args: argparse.Namespace):
+    """ Searches the full-text index of the Edge Collections database, refreshing the index first. """
+    db, file_location = ECE.connect_to_db(file_location=args.file_location)
+    db.close()
+    index = search.connect_index(file_location, args.index)
+    if not args.no_refresh:
+        search.refresh_index(index, full=args.full_refresh)
+    kind = ECE.Tables(args.kind) if args.kind else None
+    results = search.search(index, " ".join(args.text), prefix=args.prefix, phrase=args.phrase, kind=kind, limit=args.limit, raw=args.raw)
+    for result in results:
+        print(f"{result['rank']:8.2f}  {result['kind']:<11} {result['id']}  {result['title']}")
+        print(f"          {result['snippet']}")
     print(len(results))
-    results = list(utils.rows_to_dict(*results[:limit]))
-    utils.truncate_blobs(*results)
-    pprint(results)
+
+def export_data(args: argparse.Namespace):
+    """ Exports the Edge Collections database to NDJSON. """
+    tables = [ECE.Tables(table) for table in args.tables] if args.tables else None
+    results = export.export_database(args.file_location, args.directory, tables=tables, compress=args.gzip, blobs=args.blobs,
+                                     batch_size=args.batch_size, workers=args.workers)
+    for table, (location, rows) in results.items():
+        print(table, rows, location)
+
+def library_stats(args: argparse.Namespace):
+    """ Prints aggregate statistics about the library. """
+    db, _ = ECE.connect_to_db(file_location=args.file_location, mode="ro")
+    stats = analytics.summary(db, period=args.period, stale_days=args.stale_days)
+    for key in ("items", "collections", "relationships", "orphaned_relationships", "syncable", "empty_collections", "stale_items"):
+        print(f"{key}: {stats[key]}")
+    print("types:")
+    pprint(stats["types"])
+    print(f"items created per {args.period} (running total):")
+    for (start, count), (_, total) in zip(stats["created_per_period"], stats["growth"]):
+        print(f"  {start}  {count:>8}  {total:>8}")
+    print("largest collections:")
+    for id, title, size in stats["collection_sizes"][:args.top]:
+        print(f"  {size:>8}  {title} ({id})")
+    if len(stats["stale_rowids"]):
+        print(f"least recently modified items (not modified for {args.stale_days} days):")
+        for rowid in stats["stale_rowids"][:args.top].tolist():
+            id, title = db.execute("SELECT id, title FROM items WHERE rowid = ?", (rowid,)).fetchone()
+            print(f"  {title} ({id})")
+
+def find_duplicates(args: argparse.Namespace):
+    """ Prints clusters of duplicate items, optionally deleting all but one item of each. """
+    db, file_location = ECE.connect_to_db(file_location=args.file_location)
+    clusters = dedupe.find_duplicates(db, near=not args.exact, threshold=args.threshold, batch_size=args.batch_size)
+    titles = {row[0]: row[1] for row in db.execute("SELECT id, title FROM collections")}
+    for cluster in clusters:
+        print(f"{cluster.kind} ({len(cluster.items)} items)")
+        for id, title in zip(cluster.items, cluster.titles):
+            collections = ", ".join(titles.get(collection, collection) for collection in cluster.collections[id])
+            print(f"  {title} ({id})  [{collections}]")
+    print(len(clusters))
+    if args.delete and clusters:
+        utils.backup_database(file_location, skip_unchanged=True)
+        editor = batch.BatchEditor(db)
+        deleted = dedupe.queue_deletes(editor, clusters, keep=args.keep)
+        journal = editor.apply()
+        print(f"Deleted {deleted} items (undo journal: {journal})")
+
+def duplicate_blobs(args: argparse.Namespace):
+    """ Reports the byte-identical image blobs, optionally writing a compacted copy of the database. """
+    if args.compact is not None and args.strip is None:
+        raise ValueError("--strip must be specified with --compact.")
+    db, _ = ECE.connect_to_db(file_location=args.file_location, mode="ro")
+    reports = storage.find_duplicate_blobs(db, batch_size=args.batch_size)
+    for report in reports:
+        print(f"{report.table.value}.{report.column}: {report.blobs} blobs, {report.total_bytes} bytes, "
+              f"{len(report.duplicates)} duplicated, {report.wasted_bytes} bytes wasted")
+        for group in report.duplicates[:args.top]:
+            print(f"  {group.size:>10} x {len(group.keys):<6} {group.sha256[:16]}  {', '.join(map(str, group.keys[:3]))}{', ...' if len(group.keys) > 3 else ''}")
+    if args.compact is not None:
+        stripped = {"repeated": "of every row whose image repeats an earlier row's (only the first row of each group keeps it)",
+                    "all": "of every row"}[args.strip]
+        print(f"WARNING: {args.compact} will have no favicon, thumbnail or image {stripped}. The original database is not changed.",
+              file=sys.stderr)
+        original, compacted = storage.compact_copy(db, args.compact, mode=args.strip, reports=reports)
+        print(f"Wrote {args.compact}: {original} -> {compacted} bytes")
+
+def print_profile(profile: storage.SizeProfile, top: int = 10):
+    print(f"{profile.file_bytes} bytes ({profile.page_count} pages of {profile.page_size} bytes), "
+          f"{profile.free_bytes} bytes free ({profile.free_pages} pages)")
+    if profile.source == "dbstat":
+        print(f"fragmented pages: {profile.fragmented_pages} ({profile.fragmented_pages / max(profile.page_count, 1):.1%})")
+    print(f"tables ({'pages, including indexes' if profile.source == 'dbstat' else 'sum of value lengths'}):")
+    for table, size in sorted(profile.table_bytes.items(), key=lambda item: -item[1]):
+        unused = f"  ({profile.unused_bytes[table]} unused)" if table in profile.unused_bytes else ""
+        print(f"  {size:>12}  {table.value}{unused}")
+    print("largest columns:")
+    for (table, column), size in sorted(profile.column_bytes.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {size:>12}  {table.value}.{column}")
+    print("largest collections:")
+    for id, title, items, size in profile.collections[:top]:
+        print(f"  {size:>12}  {title} ({id}, {items} items)")
+
+def table_column(value: str)-> tuple[ECE.Tables, str]:
+    """ Parses "table.column" for argparse. """
+    table, _, column = value.partition(".")
+    try:
+        tablename, columnname = utils.sanitize_table_and_column(table, column)
+    except KeyError:
+        raise argparse.ArgumentTypeError(f"Invalid column: {value}")
+    return ECE.Tables(tablename), columnname
+
+def profile_size(args: argparse.Namespace):
+    """ Prints where the bytes of the database go. """
+    db, _ = ECE.connect_to_db(file_location=args.file_location, mode="ro")
+    print_profile(storage.profile_size(db, dbstat=False if args.no_dbstat else None), args.top)
+
+def compact_database(args: argparse.Namespace):
+    """ Writes a slimmed, vacuumed copy of the database and compares its size to the original. """
+    db, _ = ECE.connect_to_db(file_location=args.file_location, mode="ro")
+    before, after = storage.compact(db, args.destination, args.clear)
+    print("before:")
+    print_profile(before, args.top)
+    print("\nafter:")
+    print_profile(after, args.top)
+    print(f"\n{before.file_bytes} -> {after.file_bytes} bytes ({1 - after.file_bytes / max(before.file_bytes, 1):.1%} smaller)")
+
+def diff_snapshots(args: argparse.Namespace):
+    """ Prints the rows added, removed and modified between two snapshots of the database. """
+    tables = [ECE.Tables(table) for table in args.tables] if args.tables else None
+    results = diff.diff_databases(args.old, args.new, tables=tables, shortcut=not args.full)
+    for table, result in results.items():
+        missing = " or ".join(name for name, exists in zip(("old", "new"), result.exists) if not exists)
+        print(f"{table.value}: +{len(result.added)} -{len(result.removed)} ~{len(result.modified)} "
+              f"({result.changed_buckets}/{result.buckets} buckets compared){f' (not in {missing})' if missing else ''}")
+        for sign, keys in (("+", result.added), ("-", result.removed), ("~", result.modified)):
+            for key in keys[:args.top]:
+                print(f"  {sign} {' / '.join(key) if isinstance(key, tuple) else key}")
+            if len(keys) > args.top:
+                print(f"  {sign} ... {len(keys) - args.top} more")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
     parser.add_argument("-f", "--file_location", type=pathlib.Path, default=None)
     parser.add_argument("-t", "--table", type=ECE.Tables, default=None)
-    parser.add_argument("-l", "--limit", type=int, default=None)
-    parser.add_argument("-c", "--column", type=str, default=None)
+    parser.add_argument("-l", "--limit", type=int, default=1)
+    parser.add_argument("--offset", type=int, default=0)
+    parser.add_argument("-w", "--where", action="append", default=[], metavar="COLUMN<OP>VALUE",
+                        help=f"Filter the rows (may be repeated); OP is one of {' '.join(query.OPERATORS)} (~ matches substrings)")
+    parser.add_argument("-c", "--column", type=str, default=None, help="Shorthand for --where COLUMN=VALUE (COLUMN~VALUE with --like)")
     parser.add_argument("-v", "--value", type=str, default=None)
     parser.add_argument("--like", action="store_true", default=False)
+    parser.add_argument("--created", type=str, default=None, metavar="START..END",
+                        help="Only rows created in this range of ISO dates or datetimes (either end may be omitted), or on this date")
+    parser.add_argument("--modified", type=str, default=None, metavar="START..END", help="As --created, for date_modified")
+    parser.add_argument("-o", "--order_by", action="append", default=[], metavar="COLUMN[:desc]")
+    parser.add_argument("--columns", nargs="+", default=None, help="Only print these columns")
+    parser.add_argument("--tag", action="append", default=[], metavar="PATH[<OP>VALUE]",
+                        help="Filter on the tag column (may be repeated), e.g. read=false or theme~coffee; a PATH alone requires it to exist")
+    parser.add_argument("-b", "--batch_size", type=int, default=utils.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--profile", action="store_true", default=False, help="Print the time spent in each query function and the SQL executed (to stderr)")
     parser.set_defaults(func=sample_data)
 
+    subparsers = parser.add_subparsers()
+
+    search_parser = subparsers.add_parser("search", help="Full-text search of items and collections")
+    search_parser.add_argument("text", nargs="+")
+    search_parser.add_argument("-l", "--limit", type=int, default=20)
+    search_parser.add_argument("-k", "--kind", choices=[ECE.Tables.ITEMS.value, ECE.Tables.COLLECTIONS.value], default=None)
+    search_parser.add_argument("--prefix", action="store_true", default=False)
+    search_parser.add_argument("--phrase", action="store_true", default=False)
+    search_parser.add_argument("--raw", action="store_true", default=False, help="Use FTS5 query syntax")
+    search_parser.add_argument("--index", type=pathlib.Path, default=None, help="Location of the search index")
+    search_parser.add_argument("--no_refresh", action="store_true", default=False)
+    search_parser.add_argument("--full_refresh", action="store_true", default=False, help="Compare every id with the index when refreshing it")
+    search_parser.set_defaults(func=search_index)
+
+    tags_parser = subparsers.add_parser("tags", help="Query the JSON tags of items or collections")
+    tags_parser.add_argument("filters", nargs="*", metavar="PATH[<OP>VALUE]", help="List the rows whose tags match (see --tag); without filters, list the paths in use")
+    tags_parser.add_argument("-k", "--kind", choices=[table.value for table in tags.TAG_TABLES], default=ECE.Tables.ITEMS.value)
+    tags_parser.add_argument("--values", type=str, default=None, metavar="PATH", help="List the values at PATH and their counts")
+    tags_parser.add_argument("--top", type=int, default=20)
+    tags_parser.add_argument("--index", action="store_true", default=False, help="Look the filters up in the tag index (refreshing it first)")
+    tags_parser.add_argument("--index_location", type=pathlib.Path, default=None, help="Location of the tag index")
+    tags_parser.add_argument("--no_refresh", action="store_true", default=False)
+    tags_parser.set_defaults(func=tag_query)
+
+    export_parser = subparsers.add_parser("export", help="Export tables to NDJSON")
+    export_parser.add_argument("directory", type=pathlib.Path)
+    export_parser.add_argument("--tables", nargs="+", choices=[table.value for table in ECE.Tables], default=None)
+    export_parser.add_argument("--gzip", action="store_true", default=False)
+    export_parser.add_argument("--blobs", choices=export.BLOB_MODES, default="base64")
+    export_parser.add_argument("-w", "--workers", type=int, default=None)
+    export_parser.set_defaults(func=export_data)
+
+    stats_parser = subparsers.add_parser("stats", help="Aggregate statistics (requires numpy)")
+    stats_parser.add_argument("-p", "--period", choices=list(analytics.PERIODS), default="month")
+    stats_parser.add_argument("--stale_days", type=float, default=365)
+    stats_parser.add_argument("--top", type=int, default=10)
+    stats_parser.set_defaults(func=library_stats)
+
+    dedupe_parser = subparsers.add_parser("dedupe", help="Find duplicate items (near-duplicates require numpy)")
+    dedupe_parser.add_argument("--exact", action="store_true", default=False, help="Only find items with the same url")
+    dedupe_parser.add_argument("--threshold", type=float, default=dedupe.DEFAULT_THRESHOLD)
+    dedupe_parser.add_argument("--delete", action="store_true", default=False, help="Delete all but one item of each cluster")
+    dedupe_parser.add_argument("--keep", choices=["oldest", "newest"], default="oldest")
+    dedupe_parser.set_defaults(func=find_duplicates)
+
+    blobs_parser = subparsers.add_parser("blobs", help="Find duplicate favicons, thumbnails and images")
+    blobs_parser.add_argument("--top", type=int, default=10)
+    blobs_parser.add_argument("--compact", type=pathlib.Path, default=None, help="Write a compacted copy of the database here")
+    blobs_parser.add_argument("--strip", choices=storage.STRIP_MODES, default=None,
+                              help="Required with --compact: delete the images of rows which repeat an earlier row's image, or all images, in the copy")
+    blobs_parser.set_defaults(func=duplicate_blobs)
+
+    profile_parser = subparsers.add_parser("profile-size", help="Break the size of the database down by table, column and collection")
+    profile_parser.add_argument("--top", type=int, default=10)
+    profile_parser.add_argument("--no_dbstat", action="store_true", default=False, help="Sum the lengths of values instead of using dbstat")
+    profile_parser.set_defaults(func=profile_size)
+
+    compact_parser = subparsers.add_parser("compact", help="Write a vacuumed copy of the database, optionally clearing columns")
+    compact_parser.add_argument("destination", type=pathlib.Path)
+    compact_parser.add_argument("--clear", nargs="+", type=table_column, default=[], metavar="TABLE.COLUMN",
+                                help="Columns to clear in the copy, e.g. items_offline_data.offline_file_data")
+    compact_parser.add_argument("--top", type=int, default=10)
+    compact_parser.set_defaults(func=compact_database)
+
+    diff_parser = subparsers.add_parser("diff", help="Compare two snapshots of the database (e.g. backups)")
+    diff_parser.add_argument("old", type=pathlib.Path)
+    diff_parser.add_argument("new", type=pathlib.Path)
+    diff_parser.add_argument("--tables", nargs="+", choices=[table.value for table in ECE.Tables], default=None)
+    diff_parser.add_argument("--full", action="store_true", default=False, help="Compare every column, not only date_modified")
+    diff_parser.add_argument("--top", type=int, default=10)
+    diff_parser.set_defaults(func=diff_snapshots)
+
     args = parser.parse_args()
 
-    args.func(args)
\ No newline at end of file
+    try:
+        if args.profile:
+            profiler = profiling.enable()
+            try:
+                args.func(args)
+            finally:
+                print(profiler.report(), file=sys.stderr)
+                profiling.disable()
+        else:
+            args.func(args)
+    except ValueError as e:
+        ## Invalid arguments (e.g. a --where, --order_by or --columns column which the table does not have)
+        parser.error(str(e))
\ No newline at end of file
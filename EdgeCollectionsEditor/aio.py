@@ -0,0 +1,199 @@
+""" asyncio versions of the functions of EdgeCollectionsEditor, for use in async services.
+
+    async with aio.Database(file_location) as db:
+        collections = await db.list_collections()
+        async for item in db.iter_items_by_collection(collections[0]["id"]):
+            ...
+
+Calls run on a pool.ConnectionPool's worker threads (at most workers at a time, each with its own connection), so
+    concurrent queries overlap instead of blocking the event loop or each other. Streaming functions (iter_*) are async
+    iterators which fetch batch_size rows per job, each stream on a connection of its own so that no worker is held between batches.
+    Cancelling a call which is waiting for a worker drops it; cancelling one which is running interrupts its query
+    (sqlite3.Connection.interrupt), and edits are rolled back.
+    Blob columns should not be loaded lazily (lazy=True) through Database, as the handles would be read outside the workers.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import itertools
+import pathlib
+import sqlite3
+import threading
+import typing
+
+import EdgeCollectionsEditor as ECE
+from EdgeCollectionsEditor import pool, utils
+
+R = typing.TypeVar("R")
+
+DEFAULT_WORKERS = 4
+## SQLite virtual machine instructions between checks of whether a running job has been cancelled
+PROGRESS_INTERVAL = 1000
+
+class _Job:
+    """ Tracks the connection a job (or the jobs of a stream) is running on, so that it can be interrupted. """
+    def __init__(self):
+        self.lock = threading.Lock()
+        ## Held while the job runs
+        self.running = threading.Lock()
+        self.conn: sqlite3.Connection|None = None
+        self.cancelled = False
+
+    def start(self, conn: sqlite3.Connection):
+        with self.lock:
+            if self.cancelled:
+                raise concurrent.futures.CancelledError()
+            self.conn = conn
+            ## interrupt() only stops the statement running at the time, so later statements of a cancelled job are stopped by this
+            conn.set_progress_handler(self._progress, PROGRESS_INTERVAL)
+
+    def finish(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.set_progress_handler(None, 0)
+            self.conn = None
+
+    def _progress(self)-> int:
+        return self.cancelled
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.conn is not None:
+                self.conn.interrupt()
+
+def _query(func: typing.Callable[..., R])-> typing.Callable[..., typing.Awaitable[R]]:
+    """ This is a function factory for internal use. Creates a Database method which runs func on a worker. """
+    async def method(self: "Database", *args, **kwargs)-> R:
+        return await self.run(func, *args, **kwargs)
+    method.__name__ = func.__name__
+    method.__doc__ = f""" Runs EdgeCollectionsEditor.{func.__name__} on a worker (see Database.run).\n\n    {func.__doc__.strip()}"""
+    return method
+
+def _mutation(func: typing.Callable[..., R])-> typing.Callable[..., typing.Awaitable[R]]:
+    """ This is a function factory for internal use. Creates a Database method which runs func on a worker and commits. """
+    async def method(self: "Database", *args, **kwargs)-> R:
+        return await self.run(func, *args, commit=True, **kwargs)
+    method.__name__ = func.__name__
+    method.__doc__ = f""" Runs EdgeCollectionsEditor.{func.__name__} on a worker and commits (see Database.run).\n\n    {func.__doc__.strip()}"""
+    return method
+
+def _stream(func: typing.Callable[..., typing.Iterator[R]])-> typing.Callable[..., typing.AsyncIterator[R]]:
+    """ This is a function factory for internal use. Creates a Database method which streams the rows of func (see Database.stream). """
+    def method(self: "Database", *args, batch_size: int = utils.DEFAULT_BATCH_SIZE, **kwargs)-> typing.AsyncIterator[R]:
+        return self.stream(func, *args, batch_size=batch_size, **kwargs)
+    method.__name__ = func.__name__
+    method.__doc__ = f""" Async iterator version of EdgeCollectionsEditor.{func.__name__} (see Database.stream).\n\n    {func.__doc__.strip()}"""
+    return method
+
+class Database:
+    """ An Edge Collections database whose functions are coroutines (see the module docstring).
+
+    Create one per database; it must be closed (or used with async with) to stop its workers and close its connections.
+    """
+    def __init__(self, file_location: pathlib.Path|str|None = None, mode: typing.Literal["rw", "ro"] = "rw", workers: int = DEFAULT_WORKERS, **options):
+        """ Creates the database's pool; options are passed on to connect_to_db (mode="ro" makes the edit functions fail). """
+        if workers < 1:
+            raise ValueError("workers must be at least 1.")
+        self.pool = pool.ConnectionPool(file_location, mode=mode, workers=workers, **options)
+        self.file_location = self.pool.file_location
+        self._streams: set[sqlite3.Connection] = set()
+
+    async def run(self, func: typing.Callable[..., R], *args, commit: bool = False, **kwargs)-> R:
+        """ Calls func(connection, *args, **kwargs) on a worker with the worker's connection and returns the result.
+
+        Args:
+            func (typing.Callable[..., R]): The function to call.
+            commit (bool, optional): Commit once func returns (if func raises or is cancelled, roll back instead). Defaults to False.
+        """
+        def call(conn: sqlite3.Connection)-> R:
+            try:
+                result = func(conn, *args, **kwargs)
+                if commit:
+                    conn.commit()
+                return result
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+        return await self._submit(call)
+
+    async def _submit(self, call: typing.Callable[[sqlite3.Connection], R], conn: sqlite3.Connection|None = None,
+                      job: _Job|None = None)-> R:
+        """ Runs call on a worker, with conn or the worker's connection. """
+        job = job if job is not None else _Job()
+        def work()-> R:
+            with job.running:
+                connection = conn if conn is not None else self.pool.connection()
+                job.start(connection)
+                try:
+                    return call(connection)
+                finally:
+                    job.finish()
+        future = self.pool.executor().submit(work)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            ## wrap_future has cancelled the future if it had not started; otherwise its query is interrupted
+            job.cancel()
+            raise
+
+    async def stream(self, func: typing.Callable[..., typing.Iterator[R]], *args, batch_size: int = utils.DEFAULT_BATCH_SIZE, **kwargs)-> typing.AsyncIterator[R]:
+        """ Yields the rows of func(connection, *args, batch_size=batch_size, **kwargs), fetching batch_size rows per job.
+
+        The stream has a connection of its own, closed when the stream is exhausted, closed (aclose) or cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        conn, _ = await loop.run_in_executor(self.pool.executor(), functools.partial(ECE.connect_to_db, self.file_location, **self.pool.options))
+        self._streams.add(conn)
+        iterator: typing.Iterator[R]|None = None
+        job = _Job()
+        try:
+            iterator = await self._submit(lambda c: func(c, *args, batch_size=batch_size, **kwargs), conn, job)
+            while (batch := await self._submit(lambda _: list(itertools.islice(iterator, batch_size)), conn, job)):
+                for row in batch:
+                    yield row
+        finally:
+            ## The last batch's job may still be running if the stream was cancelled, so the connection is closed on a worker once it is done
+            if not self.pool.closed:
+                self.pool.executor().submit(self._close_stream, conn, iterator, job)
+
+    def _close_stream(self, conn: sqlite3.Connection, iterator: typing.Iterator|None, job: _Job):
+        with job.running:
+            job.cancelled = True
+            if isinstance(iterator, typing.Generator):
+                iterator.close()
+            conn.close()
+            self._streams.discard(conn)
+
+    async def close(self):
+        """ Waits for the running jobs, then stops the workers and closes every connection (including those of unfinished streams). """
+        await asyncio.to_thread(self.pool.close)
+        for conn in list(self._streams):
+            conn.close()
+        self._streams.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    check_syncable_collections = _query(ECE.check_syncable_collections)
+    get_table = _query(ECE.get_table)
+    iter_table = _stream(ECE.iter_table)
+    list_collections = _query(ECE.list_collections)
+    get_collection_by_id = _query(ECE.get_collection_by_id)
+    get_collections_by_title = _query(ECE.get_collections_by_title)
+    get_collections_by_title_like = _query(ECE.get_collections_by_title_like)
+    delete_collection = _mutation(ECE.delete_collection)
+    edit_collection_title = _mutation(ECE.edit_collection_title)
+    list_items = _query(ECE.list_items)
+    iter_items = _stream(ECE.iter_items)
+    get_item_by_id = _query(ECE.get_item_by_id)
+    get_items_by_title = _query(ECE.get_items_by_title)
+    get_items_by_title_like = _query(ECE.get_items_by_title_like)
+    iter_items_by_title_like = _stream(ECE.iter_items_by_title_like)
+    get_items_by_collection = _query(ECE.get_items_by_collection)
+    iter_items_by_collection = _stream(ECE.iter_items_by_collection)
+    link_items_to_collections = _query(ECE.link_items_to_collections)
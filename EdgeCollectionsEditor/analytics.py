@@ -0,0 +1,141 @@
+""" Library statistics computed with NumPy over columns loaded in bulk.
+
+Requires numpy (pip install EdgeCollectionsEditor[analytics]).
+"""
+import sqlite3
+import typing
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from EdgeCollectionsEditor import utils
+
+## Periods accepted by time_histogram and growth_curve, as numpy datetime64 units
+PERIODS = {"year": "Y", "month": "M", "week": "W", "day": "D"}
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("EdgeCollectionsEditor.analytics requires numpy: pip install EdgeCollectionsEditor[analytics]")
+
+class ItemColumns(typing.NamedTuple):
+    """ Columns of the items table as arrays, indexed the same way. """
+    rowid: "np.ndarray"
+    date_created: "np.ndarray"
+    date_modified: "np.ndarray"
+    ## Index into types
+    type: "np.ndarray"
+    ## -1 where is_syncable is NULL
+    is_syncable: "np.ndarray"
+    types: list[str|None]
+
+class Memberships(typing.NamedTuple):
+    """ The collections_items_relationship table as arrays of indices into collection_ids (-1 for unknown collections). """
+    collection_ids: list[str]
+    titles: list[str]
+    parent: "np.ndarray"
+
+def load_items(conn: sqlite3.Connection, batch_size: int = 100_000)-> ItemColumns:
+    """ Loads the date, type and is_syncable columns of every item. """
+    _require_numpy()
+    types = [row[0] for row in conn.execute("SELECT DISTINCT type FROM items")]
+    ## Let SQLite turn type into an index into types, so every row can be read straight into a structured array
+    whens, parameters = [], []
+    for index, type_ in enumerate(types):
+        if type_ is not None:
+            whens.append("WHEN ? THEN ?")
+            parameters += [type_, index]
+    null = types.index(None) if None in types else -1
+    case = f"CASE type {' '.join(whens)} ELSE {null} END" if whens else str(null)
+    dtype = np.dtype([("rowid", "i8"), ("date_created", "f8"), ("date_modified", "f8"), ("type", "i4"), ("is_syncable", "i1")])
+    cursor = conn.execute(f"SELECT rowid, date_created, date_modified, {case}, coalesce(is_syncable, -1) FROM items", parameters)
+    chunks = []
+    while (batch := cursor.fetchmany(batch_size)):
+        chunks.append(np.fromiter(batch, dtype=dtype, count=len(batch)))
+    array = np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)
+    return ItemColumns(array["rowid"], array["date_created"], array["date_modified"], array["type"], array["is_syncable"], types)
+
+def load_memberships(conn: sqlite3.Connection)-> Memberships:
+    """ Loads the collection of every relationship as indices into the list of collections. """
+    _require_numpy()
+    collections = conn.execute("SELECT id, title FROM collections ORDER BY position").fetchall()
+    index = {id: i for i, (id, _) in enumerate(collections)}
+    parent = np.fromiter((index.get(row[0], -1) for row in conn.execute("SELECT parent_id FROM collections_items_relationship")), dtype="i4")
+    return Memberships([id for id, _ in collections], [title for _, title in collections], parent)
+
+def to_datetime(timestamps: "np.ndarray")-> "np.ndarray":
+    """ Converts date_created/date_modified values (see utils.edge_timestamp) to datetime64[ms]. """
+    _require_numpy()
+    return timestamps.astype("i8").astype("datetime64[ms]")
+
+def time_histogram(timestamps: "np.ndarray", period: str = "month")-> tuple["np.ndarray", "np.ndarray"]:
+    """ Counts timestamps per period.
+
+    Args:
+        timestamps (np.ndarray): date_created or date_modified values.
+        period (str, optional): One of PERIODS. Defaults to "month".
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The start of each period (datetime64) and the number of timestamps in it,
+            for every period from the first to the last timestamp (including empty ones).
+    """
+    _require_numpy()
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {tuple(PERIODS)}")
+    if not len(timestamps):
+        return np.empty(0, dtype=f"datetime64[{PERIODS[period]}]"), np.empty(0, dtype="i8")
+    periods = to_datetime(timestamps).astype(f"datetime64[{PERIODS[period]}]")
+    first = periods.min()
+    counts = np.bincount((periods - first).astype("i8"))
+    return first + np.arange(len(counts)), counts
+
+def growth_curve(timestamps: "np.ndarray", period: str = "month")-> tuple["np.ndarray", "np.ndarray"]:
+    """ Returns the running total of time_histogram: the number of timestamps up to the end of each period. """
+    starts, counts = time_histogram(timestamps, period)
+    return starts, np.cumsum(counts)
+
+def collection_sizes(memberships: Memberships)-> list[tuple[str, str, int]]:
+    """ Returns (collection id, title, number of items) for every collection, largest first. """
+    _require_numpy()
+    parents = memberships.parent[memberships.parent >= 0]
+    counts = np.bincount(parents, minlength=len(memberships.collection_ids))
+    order = np.argsort(-counts, kind="stable")
+    return [(memberships.collection_ids[i], memberships.titles[i], int(counts[i])) for i in order]
+
+def stale_items(items: ItemColumns, days: float, now: float|None = None)-> "np.ndarray":
+    """ Returns the rowids of items which have not been modified for days, least recently modified first.
+
+    Args:
+        items (ItemColumns): The items to check.
+        days (float): The number of days without modification after which an item is stale.
+        now (float|None, optional): The current time (see utils.edge_timestamp). Defaults to None (now).
+    """
+    _require_numpy()
+    if now is None:
+        now = utils.edge_timestamp()
+    stale = np.flatnonzero(items.date_modified < now - days * 86_400_000)
+    return items.rowid[stale[np.argsort(items.date_modified[stale], kind="stable")]]
+
+def summary(conn: sqlite3.Connection, period: str = "month", stale_days: float = 365, now: float|None = None)-> dict[str, typing.Any]:
+    """ Computes the statistics shown by the CLI's stats command. """
+    items = load_items(conn)
+    memberships = load_memberships(conn)
+    type_counts = np.bincount(items.type[items.type >= 0], minlength=len(items.types)) if len(items.types) else np.empty(0, dtype="i8")
+    sizes = collection_sizes(memberships)
+    starts, created = time_histogram(items.date_created, period)
+    stale = stale_items(items, stale_days, now)
+    return {
+        "items": len(items.rowid),
+        "collections": len(memberships.collection_ids),
+        "relationships": len(memberships.parent),
+        "orphaned_relationships": int(np.count_nonzero(memberships.parent < 0)),
+        "types": {items.types[i]: int(count) for i, count in enumerate(type_counts)},
+        "syncable": int(np.count_nonzero(items.is_syncable == 1)),
+        "created_per_period": list(zip((str(start) for start in starts), created.tolist())),
+        "growth": list(zip((str(start) for start in starts), np.cumsum(created).tolist())),
+        "collection_sizes": sizes,
+        "empty_collections": sum(1 for *_, size in sizes if not size),
+        "stale_items": len(stale),
+        "stale_rowids": stale,
+    }
@@ -0,0 +1,287 @@
+""" Batched, transactional edits with an undo journal.
+
+A BatchEditor collects edits and applies them all in one transaction. Before anything is changed, every row the batch
+    touches is copied into a journal database so that undo_journal can later restore them (unless the batch is applied
+    with journal=False, as the GUI does for single edits).
+"""
+import itertools
+import os
+import pathlib
+import sqlite3
+import tempfile
+import typing
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import utils
+
+## Name the journal is attached as while applying or undoing a batch
+JOURNAL_SCHEMA = "batch_journal"
+
+## The column each journaled table's rows are saved (and restored) by
+JOURNAL_KEYS: dict[Tables, str] = {
+    Tables.COLLECTIONS: Collections.ID.value,
+    Tables.COLLECTIONS_SYNC: Collections_Sync.COLLECTION_ID.value,
+    Tables.ITEMS: Items.ID.value,
+    Tables.ITEMS_SYNC: Items_Sync.ITEM_ID.value,
+    Tables.COLLECTIONS_ITEMS_RELATIONSHIP: Collections_Items_Relationship.ITEM_ID.value,
+    Tables.COMMENTS: Comments.PARENT_ID.value,
+    Tables.ITEMS_OFFLINE_DATA: Items_Offline_Data.ITEM_ID.value,
+}
+
+## Flags which can be set with BatchEditor.set_flag
+FLAGS = (Collections.IS_MARKED_FOR_DELETION.value, Collections.IS_SYNCABLE.value)
+
+_REMOVE_FROM_COLLECTION = "DELETE FROM collections_items_relationship WHERE item_id = ? AND parent_id = ?"
+## Appends the item unless a position is given
+_ADD_TO_COLLECTION = """INSERT INTO collections_items_relationship (item_id, parent_id, position)
+    SELECT ?, ?, coalesce(?, (SELECT max(position) + 1 FROM collections_items_relationship WHERE parent_id = ?), 0)"""
+
+class BatchEditor:
+    """ Collects edits to collections and items and applies them in a single transaction.
+
+    Example:
+        editor = BatchEditor(conn)
+        for collection in stale:
+            editor.set_flag(Tables.COLLECTIONS, collection["id"], "is_marked_for_deletion", True)
+        editor.rename_collection(keep["id"], "Archive")
+        journal = editor.apply()
+        ...
+        editor.undo()  # or undo_journal(conn, journal)
+
+    The date_modified of every collection and item which is edited (or which an item is moved into or out of) is updated.
+    """
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.journal_location: pathlib.Path|None = None
+        self.clear()
+
+    def clear(self):
+        """ Discards the pending edits. """
+        self.renames: dict[str, str] = {}
+        self.flags: dict[tuple[Tables, str], dict[str, int]] = {}
+        self.moves: list[tuple[str, str|None, str|None, int|None]] = []
+        self.deleted_collections: set[str] = set()
+        self.deleted_items: set[str] = set()
+
+    def __len__(self)-> int:
+        """ Returns the number of pending edits. """
+        return len(self.renames) + sum(map(len, self.flags.values())) + len(self.moves) + len(self.deleted_collections) + len(self.deleted_items)
+
+    def rename_collection(self, collection_id: str, title: str):
+        self.renames[collection_id] = title
+
+    def delete_collection(self, collection_id: str):
+        """ Deletes the collection along with its sync data and relationships (but not its items). """
+        self.deleted_collections.add(collection_id)
+
+    def delete_item(self, item_id: str):
+        """ Deletes the item along with its sync data, relationships, comments and offline data. """
+        self.deleted_items.add(item_id)
+
+    def move_item(self, item_id: str, from_collection: str|None, to_collection: str|None, position: int|None = None):
+        """ Moves an item between collections.
+
+        Args:
+            item_id (str): The item to move.
+            from_collection (str|None): The collection to remove the item from; if None the item is only added to to_collection.
+            to_collection (str|None): The collection to add the item to; if None the item is only removed from from_collection.
+            position (int|None, optional): The item's position in to_collection. Defaults to None (after the last item).
+        """
+        if from_collection is None and to_collection is None:
+            raise ValueError("At least one of from_collection and to_collection is required.")
+        self.moves.append((item_id, from_collection, to_collection, position))
+
+    def set_flag(self, table: Tables, row_id: str, flag: str, value: bool):
+        """ Sets is_marked_for_deletion or is_syncable on a collection or item.
+
+        Raises:
+            ValueError: If table is not Tables.COLLECTIONS or Tables.ITEMS, or flag is not in FLAGS.
+        """
+        if table not in (Tables.COLLECTIONS, Tables.ITEMS):
+            raise ValueError(f"Flags can only be set on collections and items, not {table}")
+        if flag not in FLAGS:
+            raise ValueError(f"Invalid flag: {flag}")
+        self.flags.setdefault((table, flag), {})[row_id] = int(bool(value))
+
+    def journal_keys(self)-> dict[Tables, set[str]]:
+        """ Returns the keys (see JOURNAL_KEYS) of the rows which applying the batch may change. """
+        collections = set(self.renames) | self.deleted_collections
+        items = set(self.deleted_items)
+        for (table, _), values in self.flags.items():
+            (collections if table == Tables.COLLECTIONS else items).update(values)
+        for item_id, from_collection, to_collection, _ in self.moves:
+            items.add(item_id)
+            collections.update(collection for collection in (from_collection, to_collection) if collection is not None)
+        relationships = set(items)
+        for chunk in utils.chunked(list(self.deleted_collections), utils.max_variables(self.conn)):
+            relationships.update(row[0] for row in self.conn.execute(f"""SELECT item_id FROM collections_items_relationship
+                                                                     WHERE parent_id IN ({", ".join("?"*len(chunk))})""", chunk))
+        return {
+            Tables.COLLECTIONS: collections,
+            Tables.COLLECTIONS_SYNC: set(self.deleted_collections),
+            Tables.ITEMS: items,
+            Tables.ITEMS_SYNC: set(self.deleted_items),
+            Tables.COLLECTIONS_ITEMS_RELATIONSHIP: relationships,
+            Tables.COMMENTS: set(self.deleted_items),
+            Tables.ITEMS_OFFLINE_DATA: set(self.deleted_items),
+        }
+
+    def apply(self, journal_location: pathlib.Path|None = None, journal: bool = True)-> pathlib.Path|None:
+        """ Journals and applies every pending edit in one transaction, then clears the pending edits.
+            If any edit fails, the whole batch is rolled back and the exception is re-raised.
+
+        Args:
+            journal_location (pathlib.Path|None, optional): Where to write the undo journal; the file must not exist.
+                Defaults to None (a new temporary file, which the caller is responsible for deleting).
+            journal (bool, optional): Whether to write an undo journal at all; if False the batch cannot be undone. Defaults to True.
+
+        Returns:
+            pathlib.Path|None: The location of the undo journal, or None if journal is False.
+
+        Raises:
+            FileExistsError: If journal_location already exists.
+            RuntimeError: If the connection has a transaction in progress.
+            ValueError: If journal_location is given but journal is False.
+        """
+        if not journal:
+            if journal_location is not None:
+                raise ValueError("journal_location requires journal=True.")
+        elif journal_location is None:
+            handle, name = tempfile.mkstemp(prefix="EdgeCollectionsEditor_", suffix=".journal")
+            ## mkstemp creates an empty file, which SQLite will happily use as a new database
+            os.close(handle)
+            journal_location = pathlib.Path(name)
+        elif journal_location.exists():
+            raise FileExistsError(f"{journal_location} already exists")
+        try:
+            self._apply(journal_location)
+        except BaseException:
+            ## _Transaction has detached the journal by now
+            if journal_location is not None:
+                journal_location.unlink(missing_ok=True)
+            raise
+        self.clear()
+        self.journal_location = journal_location
+        return journal_location
+
+    def _apply(self, journal_location: pathlib.Path|None):
+        now = utils.edge_timestamp()
+        with _Transaction(self.conn, journal_location):
+            if journal_location is not None:
+                keys = self.journal_keys()
+                self.conn.execute(f"CREATE TABLE {JOURNAL_SCHEMA}.keys (table_name TEXT NOT NULL, key TEXT NOT NULL)")
+                for table, column in JOURNAL_KEYS.items():
+                    self.conn.execute(f"CREATE TABLE {JOURNAL_SCHEMA}.{table.value} AS SELECT * FROM main.{table.value} WHERE 0")
+                    self.conn.executemany(f"INSERT INTO {JOURNAL_SCHEMA}.keys (table_name, key) VALUES (?, ?)", ((table.value, key) for key in keys[table]))
+                    self.conn.execute(f"""INSERT INTO {JOURNAL_SCHEMA}.{table.value} SELECT * FROM main.{table.value}
+                                      WHERE {column} IN (SELECT key FROM {JOURNAL_SCHEMA}.keys WHERE table_name = ?)""", (table.value,))
+
+            with _Savepoint(self.conn, "renames"):
+                self.conn.executemany("UPDATE collections SET title = ?, date_modified = ? WHERE id = ?",
+                                      ((title, now, collection_id) for collection_id, title in self.renames.items()))
+            with _Savepoint(self.conn, "flags"):
+                for (table, flag), values in self.flags.items():
+                    self.conn.executemany(f"UPDATE {table.value} SET {flag} = ?, date_modified = ? WHERE id = ?",
+                                          ((value, now, row_id) for row_id, value in values.items()))
+            with _Savepoint(self.conn, "moves"):
+                ## Consecutive removals and additions are each run with one executemany; the runs keep the order of the moves,
+                ##  so an item moved twice ends up where the second move puts it
+                for statement, rows in itertools.groupby(self._move_statements(), key=lambda pair: pair[0]):
+                    self.conn.executemany(statement, (parameters for _, parameters in rows))
+                touched = {collection for _, *collections, _ in self.moves for collection in collections if collection is not None}
+                self.conn.executemany("UPDATE collections SET date_modified = ? WHERE id = ?", ((now, collection_id) for collection_id in touched))
+                self.conn.executemany("UPDATE items SET date_modified = ? WHERE id = ?", ((now, item_id) for item_id, *_ in self.moves))
+            with _Savepoint(self.conn, "deletes"):
+                collections = [(collection_id,) for collection_id in self.deleted_collections]
+                self.conn.executemany("DELETE FROM collections_items_relationship WHERE parent_id = ?", collections)
+                self.conn.executemany("DELETE FROM collections_sync WHERE collection_id = ?", collections)
+                self.conn.executemany("DELETE FROM collections WHERE id = ?", collections)
+                items = [(item_id,) for item_id in self.deleted_items]
+                self.conn.executemany("DELETE FROM collections_items_relationship WHERE item_id = ?", items)
+                self.conn.executemany("DELETE FROM comments WHERE parent_id = ?", items)
+                self.conn.executemany("DELETE FROM items_offline_data WHERE item_id = ?", items)
+                self.conn.executemany("DELETE FROM items_sync WHERE item_id = ?", items)
+                self.conn.executemany("DELETE FROM items WHERE id = ?", items)
+
+    def _move_statements(self)-> typing.Iterator[tuple[str, tuple]]:
+        """ Yields the (statement, parameters) which apply the moves, in order. """
+        for item_id, from_collection, to_collection, position in self.moves:
+            if from_collection is not None:
+                yield _REMOVE_FROM_COLLECTION, (item_id, from_collection)
+            if to_collection is not None:
+                yield _ADD_TO_COLLECTION, (item_id, to_collection, position, to_collection)
+
+    def undo(self):
+        """ Rolls back the last batch applied by this editor. """
+        if self.journal_location is None:
+            raise RuntimeError("No batch has been applied.")
+        undo_journal(self.conn, self.journal_location)
+        self.journal_location = None
+
+def undo_journal(conn: sqlite3.Connection, journal_location: pathlib.Path):
+    """ Restores the rows saved in a journal written by BatchEditor.apply, in one transaction.
+        Note that this also reverts any later changes to those rows.
+    """
+    if not journal_location.is_file():
+        raise FileNotFoundError(f"Could not find journal at {journal_location}")
+    with _Transaction(conn, journal_location):
+        for table, column in JOURNAL_KEYS.items():
+            conn.execute(f"""DELETE FROM main.{table.value}
+                         WHERE {column} IN (SELECT key FROM {JOURNAL_SCHEMA}.keys WHERE table_name = ?)""", (table.value,))
+            conn.execute(f"INSERT INTO main.{table.value} SELECT * FROM {JOURNAL_SCHEMA}.{table.value}")
+
+class _Transaction:
+    """ Attaches the journal (if any) and runs the block in a single transaction, committing on success and rolling back on error. """
+    def __init__(self, conn: sqlite3.Connection, journal_location: pathlib.Path|None):
+        self.conn = conn
+        self.journal_location = journal_location
+        self.isolation_level: str|None = None
+        self.attached = False
+
+    def __enter__(self):
+        if self.conn.in_transaction:
+            raise RuntimeError("The connection has a transaction in progress; commit or roll it back first.")
+        self.isolation_level = self.conn.isolation_level
+        ## Manage the transaction explicitly
+        self.conn.isolation_level = None
+        try:
+            if self.journal_location is not None:
+                self.conn.execute(f"ATTACH DATABASE ? AS {JOURNAL_SCHEMA}", (str(self.journal_location),))
+                self.attached = True
+            ## Fails if the database stays locked (e.g. by Edge); __exit__ is not called then
+            self.conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self._restore()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            ## Through the methods, so that a mirror.MirrorConnection writes the changes back
+            self.conn.rollback() if exc_type else self.conn.commit()
+        finally:
+            self._restore()
+
+    def _restore(self):
+        """ Detaches the journal (so that it can be deleted, even on Windows) and restores the isolation level. """
+        try:
+            if self.attached:
+                self.conn.execute(f"DETACH DATABASE {JOURNAL_SCHEMA}")
+                self.attached = False
+        finally:
+            self.conn.isolation_level = self.isolation_level
+
+class _Savepoint:
+    """ Runs the block in a savepoint, rolling back to it on error. """
+    def __init__(self, conn: sqlite3.Connection, name: str):
+        self.conn = conn
+        self.name = name
+
+    def __enter__(self):
+        self.conn.execute(f"SAVEPOINT {self.name}")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.conn.execute(f"ROLLBACK TO {self.name}")
+        self.conn.execute(f"RELEASE {self.name}")
@@ -0,0 +1,150 @@
+import functools
+import sqlite3
+import typing
+
+from EdgeCollectionsEditor.enums import *
+
+## The BLOB columns of each table, per tables.sql
+BLOB_COLUMNS: dict[Tables, tuple[str, ...]] = {
+    Tables.COLLECTIONS: (Collections.THUMBNAIL.value,),
+    Tables.ITEMS: (Items.SOURCE.value, Items.ENTITY_BLOB.value, Items.CANONICAL_IMAGE_DATA.value, Items.THIRD_PARTY_DATA.value),
+    Tables.FAVICONS: (Favicons.DATA.value,),
+    Tables.COMMENTS: (Comments.PROPERTIES.value,),
+}
+
+## Name of the extra column lazy queries select the rowid as
+ROWID_COLUMN = "_lazy_rowid"
+
+class LazyBlob:
+    """ A handle to a BLOB value which is only read from the database when accessed.
+
+    The value is read with sqlite3.Connection.blobopen, so len() and slicing (e.g. blob[:40])
+        only touch the bytes that are needed instead of loading the whole value.
+    Note that TEXT values stored in a BLOB column are returned as utf-8 bytes.
+    """
+    __slots__ = ("conn", "table", "column", "rowid", "_length")
+
+    def __init__(self, conn: sqlite3.Connection, table: str, column: str, rowid: int):
+        self.conn = conn
+        self.table = table
+        self.column = column
+        self.rowid = rowid
+        self._length: int|None = None
+
+    def open(self)-> sqlite3.Blob:
+        """ Opens a read-only sqlite3.Blob for the value. The caller is responsible for closing it. """
+        return self.conn.blobopen(self.table, self.column, self.rowid, readonly=True)
+
+    def read(self, size: int = -1, offset: int = 0)-> bytes:
+        """ Reads up to size bytes (or the rest of the value if size is negative) starting at offset. """
+        with self.open() as blob:
+            blob.seek(offset)
+            return blob.read(size)
+
+    def load(self)-> bytes:
+        """ Reads and returns the whole value. """
+        return self.read()
+
+    def __bytes__(self)-> bytes:
+        return self.load()
+
+    def __len__(self)-> int:
+        if self._length is None:
+            with self.open() as blob:
+                self._length = len(blob)
+        return self._length
+
+    def __getitem__(self, key: int|slice)-> int|bytes:
+        with self.open() as blob:
+            return blob[key]
+
+    def __repr__(self)-> str:
+        return f"<LazyBlob {self.table}.{self.column} rowid={self.rowid}>"
+
+class LazyRow(sqlite3.Row):
+    """ A sqlite3.Row whose blob columns are returned as LazyBlob handles (or None if the value is NULL).
+
+    Rows of this type are produced by queries built with select_columns(table, lazy=True) and are used as
+        the row_factory of their cursor; use lazy_row_type to get the subclass for a given table.
+    """
+    __slots__ = ("connection",)
+    table: typing.ClassVar[Tables]
+    blob_columns: typing.ClassVar[frozenset[str]] = frozenset()
+
+    def __new__(cls, cursor: sqlite3.Cursor, values: tuple):
+        self = super().__new__(cls, cursor, values)
+        self.connection = cursor.connection
+        return self
+
+    def keys(self)-> list[str]:
+        return [key for key in super().keys() if key != ROWID_COLUMN]
+
+    def __len__(self)-> int:
+        return super().__len__() - 1
+
+    def __iter__(self)-> typing.Iterator[typing.Any]:
+        for key in self.keys():
+            yield self[key]
+
+    def __getitem__(self, key: int|str|slice)-> typing.Any:
+        if isinstance(key, slice):
+            return tuple(self[k] for k in self.keys()[key])
+        if isinstance(key, int):
+            key = self.keys()[key]
+        value = super().__getitem__(key)
+        if key.lower() not in self.blob_columns:
+            return value
+        ## Blob columns are selected as typeof(column)
+        if value == "null":
+            return None
+        return LazyBlob(self.connection, self.table.value, key.lower(), super().__getitem__(ROWID_COLUMN))
+
+@functools.cache
+def lazy_row_type(table: Tables)-> type[LazyRow]:
+    """ Returns the LazyRow subclass for the given table. """
+    return type(f"Lazy{table.name.title().replace('_', '')}Row", (LazyRow,), {"__slots__": (), "table": table, "blob_columns": frozenset(BLOB_COLUMNS.get(table, ()))})
+
+def select_columns(table: Tables, lazy: bool = False, qualify: bool = False, columns: typing.Sequence[str]|None = None)-> str:
+    """ Returns the column list for a SELECT statement against table.
+
+    Args:
+        table (Tables): The table being selected from.
+        lazy (bool, optional): If False, returns "*". If True, blob columns are replaced by typeof(column)
+            and the rowid is appended so that rows can be read with lazy_row_type(table). Defaults to False.
+        qualify (bool, optional): Whether to prefix the columns with the table name (for joins). Defaults to False.
+        columns (typing.Sequence[str]|None, optional): Only select these columns of table (which must be valid names,
+            see utils.sanitize_table_and_column). Defaults to None (all columns).
+
+    Returns:
+        str: The column list.
+    """
+    prefix = f"{table.value}." if qualify else ""
+    if columns is None:
+        if not lazy:
+            return f"{prefix}*"
+        columns = [column.value for column in TABLE_COLUMNS[table]]
+    if not lazy:
+        return ", ".join(f"{prefix}{column}" for column in columns)
+    blobs = BLOB_COLUMNS.get(table, ())
+    selected = [f"typeof({prefix}{column}) AS {column}" if column in blobs else f"{prefix}{column}" for column in columns]
+    selected.append(f"{prefix}rowid AS {ROWID_COLUMN}")
+    return ", ".join(selected)
+
+def execute(conn: sqlite3.Connection, table: Tables, clause: str, parameters: typing.Sequence = (), lazy: bool = False, qualify: bool = False,
+            columns: typing.Sequence[str]|None = None)-> sqlite3.Cursor:
+    """ Executes "SELECT <columns> <clause>" where columns are those of table, and returns the cursor.
+        If lazy is True the cursor's row_factory is set to lazy_row_type(table).
+
+    Args:
+        conn (sqlite3.Connection): The connection to the Edge Collections database.
+        table (Tables): The table whose columns are selected.
+        clause (str): The remainder of the statement, starting with FROM.
+        parameters (typing.Sequence, optional): The parameters for the statement. Defaults to ().
+        lazy (bool, optional): Whether to return blob columns as LazyBlob handles. Defaults to False.
+        qualify (bool, optional): Whether to prefix the columns with the table name (for joins). Defaults to False.
+        columns (typing.Sequence[str]|None, optional): Only select these columns (see select_columns). Defaults to None.
+    """
+    cursor = conn.execute(f"SELECT {select_columns(table, lazy, qualify, columns)} {clause}", parameters)
+    if lazy:
+        cursor.row_factory = lazy_row_type(table)
+    return cursor
@@ -0,0 +1,181 @@
+""" Cached (and optionally parallel) decoding of the JSON stored in the blob and tag columns.
+
+Decoded values are cached by (table, id, column, date_modified), so a row which has not been modified is never parsed twice.
+    Cached values are shared between callers and should be treated as read-only.
+"""
+import collections
+import concurrent.futures
+import functools
+import json
+import os
+import sqlite3
+import threading
+import typing
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor.blobs import LazyBlob, LazyRow
+
+DEFAULT_MAX_ENTRIES = 4096
+## Measured as the size of the encoded values
+DEFAULT_MAX_BYTES = 64 << 20
+## decode_many only starts worker processes when at least this many values need decoding and more than one CPU is available.
+##  Starting a pool costs tens of milliseconds and sending a value to a worker and its result back costs about as much as
+##  decoding it, so smaller batches are faster in this process (compare converters.decode_many and
+##  converters.decode_many(processes) in benchmarks/suite.py, which are timed on this many rows)
+PARALLEL_THRESHOLD = 20_000
+
+CacheKey = tuple[Tables, str, str, float]
+
+_MISSING = object()
+
+class DecodeCache:
+    """ A thread-safe LRU cache of decoded values, capped by number of entries and by the total size of the encoded values. """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: collections.OrderedDict[CacheKey, tuple[typing.Any, int]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self)-> int:
+        return len(self._entries)
+
+    def get(self, key: CacheKey, default: typing.Any = None)-> typing.Any:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def __contains__(self, key: CacheKey)-> bool:
+        return key in self._entries
+
+    def put(self, key: CacheKey, value: typing.Any, size: int):
+        """ Caches value, evicting the least recently used entries as needed. Values larger than max_bytes are not cached. """
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+## The cache used when none is specified
+default_cache = DecodeCache()
+
+def decode_value(raw: str|bytes|LazyBlob|None)-> typing.Any:
+    """ Parses a JSON value from a column; None stays None. """
+    if raw is None:
+        return None
+    if isinstance(raw, LazyBlob):
+        raw = raw.load()
+    return json.loads(raw)
+
+def infer_table(row: sqlite3.Row)-> Tables|None:
+    """ Returns the table a row belongs to: the table of a LazyRow, otherwise the only collections/items table which has all of
+        the row's columns. Returns None if that is ambiguous.
+    """
+    if isinstance(row, LazyRow):
+        return row.table
+    return _infer_table(tuple(row.keys()))
+
+@functools.lru_cache(maxsize=256)
+def _infer_table(keys: tuple[str, ...])-> Tables|None:
+    matches = [table for table in (Tables.COLLECTIONS, Tables.ITEMS) if set(keys) <= {column.value for column in TABLE_COLUMNS[table]}]
+    return matches[0] if len(matches) == 1 else None
+
+def cache_key(row: sqlite3.Row, column: str, table: Tables|None = None)-> CacheKey|None:
+    """ Returns the cache key for a row's column, or None if the row cannot be cached (its table is unknown or it has no
+        id or date_modified column).
+    """
+    if table is None:
+        table = infer_table(row)
+        if table is None:
+            return None
+    try:
+        return (table, row["id"], column, row["date_modified"])
+    except IndexError:
+        return None
+
+def decode(row: sqlite3.Row, column: str, table: Tables|None = None, cache: DecodeCache|None = default_cache)-> typing.Any:
+    """ Returns the decoded JSON value of the row's column, using the cache if possible.
+
+    Args:
+        row (sqlite3.Row): The row to decode. Rows need id and date_modified columns to be cached.
+        column (str): The column to decode.
+        table (Tables|None, optional): The row's table. Defaults to None (see infer_table).
+        cache (DecodeCache|None, optional): The cache to use; None disables caching. Defaults to default_cache.
+    """
+    key = cache_key(row, column, table) if cache is not None else None
+    if key is not None and (value := cache.get(key, _MISSING)) is not _MISSING:
+        return value
+    raw = row[column]
+    value = decode_value(raw)
+    if key is not None:
+        cache.put(key, value, len(raw) if raw is not None else 0)
+    return value
+
+def available_cpus()-> int:
+    """ Returns the number of CPUs this process may run on. """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        ## Only available on some platforms (e.g. not Windows or macOS)
+        return os.cpu_count() or 1
+
+def decode_many(rows: typing.Iterable[sqlite3.Row], column: str, table: Tables|None = None, cache: DecodeCache|None = default_cache,
+                processes: int|None = None, threshold: int = PARALLEL_THRESHOLD, chunksize: int = 256)-> list[typing.Any]:
+    """ Decodes the column of many rows. Cached values are reused; when at least threshold values are left to decode
+        and more than one worker process would be used, they are decoded on a pool of worker processes.
+
+    Args:
+        rows (typing.Iterable[sqlite3.Row]): The rows to decode.
+        column (str): The column to decode.
+        table (Tables|None, optional): The rows' table. Defaults to None (inferred per row, see infer_table).
+        cache (DecodeCache|None, optional): The cache to use; None disables caching. Defaults to default_cache.
+        processes (int|None, optional): The number of worker processes; 1 decodes everything in this process. Defaults to None (one per available CPU, see available_cpus).
+        threshold (int, optional): The number of uncached values needed before worker processes are used. Defaults to PARALLEL_THRESHOLD.
+        chunksize (int, optional): The number of values sent to a worker at a time. Defaults to 256.
+
+    Returns:
+        list[typing.Any]: The decoded values, in the same order as rows.
+    """
+    results = []
+    pending: list[tuple[int, CacheKey|None, str|bytes]] = []
+    for index, row in enumerate(rows):
+        key = cache_key(row, column, table) if cache is not None else None
+        if key is not None and (value := cache.get(key, _MISSING)) is not _MISSING:
+            results.append(value)
+            continue
+        raw = row[column]
+        if isinstance(raw, LazyBlob):
+            raw = raw.load()
+        results.append(None)
+        if raw is not None:
+            pending.append((index, key, raw))
+
+    raws = [raw for _, _, raw in pending]
+    workers = processes if processes is not None else available_cpus()
+    if len(pending) >= threshold and workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            values = list(executor.map(decode_value, raws, chunksize=chunksize))
+    else:
+        values = list(map(decode_value, raws))
+
+    for (index, key, raw), value in zip(pending, values):
+        results[index] = value
+        if key is not None:
+            cache.put(key, value, len(raw))
+    return results
@@ -0,0 +1,223 @@
+""" Finds duplicate items.
+
+Exact duplicates share a normalized source or remote_url. Near-duplicates have similar titles and text, found with
+    MinHash signatures and locality-sensitive hashing so that only items sharing an LSH bucket are compared (rather than
+    every pair of items). Near-duplicate detection requires numpy (pip install EdgeCollectionsEditor[analytics]).
+"""
+import re
+import sqlite3
+import typing
+import urllib.parse
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from EdgeCollectionsEditor.batch import BatchEditor
+from EdgeCollectionsEditor import decoding, utils
+
+## Query parameters which only track where a link came from
+TRACKING_PARAMETERS = re.compile(r"^(utm_.*|fbclid|gclid|msclkid|mc_cid|mc_eid|ref|ref_src)$", re.IGNORECASE)
+
+## MinHash signature length, split into BANDS bands for LSH
+PERMUTATIONS = 64
+BANDS = 16
+SHINGLE_SIZE = 3
+DEFAULT_THRESHOLD = 0.8
+## LSH buckets larger than this are skipped (they are made of boilerplate, not duplicates)
+MAX_BUCKET = 200
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_WORD_RE = re.compile(r"\w+")
+
+class DuplicateCluster(typing.NamedTuple):
+    """ A group of duplicate items. """
+    ## "exact" or "near"
+    kind: str
+    ## The items' ids, oldest first
+    items: list[str]
+    titles: list[str|None]
+    ## The collections each item belongs to
+    collections: dict[str, list[str]]
+
+def normalize_url(url: str|None)-> str|None:
+    """ Normalizes a url for comparison: lowercases the scheme and host, drops "www.", default ports, the fragment,
+        tracking parameters and trailing slashes, and sorts the query parameters.
+    """
+    if not url or not (url := url.strip()):
+        return None
+    try:
+        parts = urllib.parse.urlsplit(url)
+    except ValueError:
+        ## e.g. an unterminated IPv6 address; such urls are not compared
+        return None
+    host = (parts.hostname or "").removeprefix("www.")
+    try:
+        port = parts.port
+    except ValueError:
+        ## A malformed port (e.g. "host:abc"): keep the host and port as written
+        host, port = parts.netloc.rpartition("@")[2].lower().removeprefix("www."), None
+    if port and not (parts.scheme, port) in (("http", 80), ("https", 443)):
+        host = f"{host}:{port}"
+    query = sorted((key, value) for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True) if not TRACKING_PARAMETERS.match(key))
+    scheme = parts.scheme.lower()
+    if scheme == "http":
+        scheme = "https"
+    return urllib.parse.urlunsplit((scheme, host, parts.path.rstrip("/"), urllib.parse.urlencode(query), ""))
+
+def source_url(source: bytes|str|None)-> str|None:
+    """ Returns the url stored in an item's source blob (its "url" key), or None. """
+    if not source:
+        return None
+    try:
+        value = decoding.decode_value(source)
+    except ValueError:
+        return None
+    if isinstance(value, dict) and isinstance(value.get("url"), str):
+        return value["url"]
+    return None
+
+def shingles(text: str, size: int = SHINGLE_SIZE)-> set[int]:
+    """ Returns the crc32s of the lowercased word size-grams of text (or of its words, if it has fewer than size). """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {zlib.crc32(word.encode()) for word in words}
+    return {zlib.crc32(" ".join(words[i:i+size]).encode()) for i in range(len(words) - size + 1)}
+
+class MinHasher:
+    """ Computes MinHash signatures with PERMUTATIONS universal hash functions. """
+    def __init__(self, permutations: int = PERMUTATIONS, seed: int = 0):
+        if np is None:
+            raise ImportError("Near-duplicate detection requires numpy: pip install EdgeCollectionsEditor[analytics]")
+        random = np.random.default_rng(seed)
+        ## a and b are kept below 2**32 so that a*hash + b cannot overflow 64 bits (the hashes are crc32s)
+        self.a = random.integers(1, 1 << 32, permutations, dtype="u8")
+        self.b = random.integers(0, 1 << 32, permutations, dtype="u8")
+
+    def signature(self, hashes: set[int])-> "np.ndarray":
+        """ Returns the signature of a set of shingles (see shingles). """
+        values = np.fromiter(hashes, dtype="u8", count=len(hashes))
+        return ((values[:, None] * self.a + self.b) % _MERSENNE_PRIME).min(axis=0)
+
+class _UnionFind:
+    def __init__(self):
+        self.parent: dict[str, str] = {}
+
+    def find(self, x: str)-> str:
+        parent = self.parent.setdefault(x, x)
+        while parent != x:
+            grandparent = self.parent[parent]
+            self.parent[x] = grandparent
+            x, parent = parent, grandparent
+        return x
+
+    def union(self, x: str, y: str):
+        x, y = self.find(x), self.find(y)
+        if x != y:
+            self.parent[y] = x
+
+    def groups(self)-> list[list[str]]:
+        groups: dict[str, list[str]] = {}
+        for x in self.parent:
+            groups.setdefault(self.find(x), []).append(x)
+        return [group for group in groups.values() if len(group) > 1]
+
+def find_duplicates(conn: sqlite3.Connection, near: bool = True, threshold: float = DEFAULT_THRESHOLD, bands: int = BANDS,
+                    permutations: int = PERMUTATIONS, batch_size: int = utils.DEFAULT_BATCH_SIZE)-> list[DuplicateCluster]:
+    """ Finds clusters of duplicate items in one pass over the items table.
+
+    Args:
+        conn (sqlite3.Connection): The connection to the Edge Collections database.
+        near (bool, optional): Whether to look for near-duplicates as well as exact ones. Defaults to True.
+        threshold (float, optional): The estimated Jaccard similarity of title and text above which items are near-duplicates. Defaults to DEFAULT_THRESHOLD.
+        bands (int, optional): The number of LSH bands; must divide permutations. Defaults to BANDS.
+        permutations (int, optional): The MinHash signature length. Defaults to PERMUTATIONS.
+        batch_size (int, optional): The number of items to read at a time. Defaults to utils.DEFAULT_BATCH_SIZE.
+
+    Returns:
+        list[DuplicateCluster]: The exact clusters followed by the near-duplicate clusters, largest first. Every item is in
+            at most one cluster: a cluster is "near" if any of its items was joined to it as a near-duplicate.
+    """
+    if permutations % bands:
+        raise ValueError("bands must divide permutations")
+    hasher = MinHasher(permutations) if near else None
+    rows = permutations // bands
+
+    ## Exact and near-duplicates are joined in the same groups, so that no item can be kept by one cluster and deleted by another
+    groups = _UnionFind()
+    urls: dict[str, str] = {}
+    signatures: dict[str, "np.ndarray"] = {}
+    buckets: dict[tuple[int, bytes], list[str]] = {}
+    titles: dict[str, str|None] = {}
+    created: dict[str, float] = {}
+    cursor = conn.execute("SELECT id, date_created, title, text_content, remote_url, source FROM items")
+    for id, date_created, title, text_content, remote_url, source in utils.iter_rows(cursor, batch_size):
+        titles[id] = title
+        created[id] = date_created
+        for url in {normalize_url(remote_url), normalize_url(source_url(source))}:
+            if url is None: continue
+            if url in urls:
+                groups.union(urls[url], id)
+            else:
+                urls[url] = id
+        if hasher is not None and (hashes := shingles(f"{title or ''} {text_content or ''}")):
+            signature = signatures[id] = hasher.signature(hashes)
+            for band in range(bands):
+                buckets.setdefault((band, signature[band*rows:(band+1)*rows].tobytes()), []).append(id)
+
+    near_items = []
+    if hasher is not None:
+        for members in buckets.values():
+            if len(members) < 2 or len(members) > MAX_BUCKET: continue
+            first = members[0]
+            for other in members[1:]:
+                if groups.find(first) == groups.find(other): continue
+                if np.count_nonzero(signatures[first] == signatures[other]) / permutations >= threshold:
+                    groups.union(first, other)
+                    near_items.append(first)
+    near_roots = {groups.find(id) for id in near_items}
+    clusters = [("near" if groups.find(group[0]) in near_roots else "exact", group) for group in groups.groups()]
+
+    memberships = _memberships(conn, {id for _, group in clusters for id in group})
+    results = []
+    for kind, group in clusters:
+        group.sort(key=lambda id: (created[id], id))
+        results.append(DuplicateCluster(kind, group, [titles[id] for id in group], {id: memberships.get(id, []) for id in group}))
+    results.sort(key=lambda cluster: (cluster.kind != "exact", -len(cluster.items)))
+    return results
+
+def _memberships(conn: sqlite3.Connection, ids: set[str])-> dict[str, list[str]]:
+    """ Returns the collections (parent_ids) of each of the given items. """
+    result: dict[str, list[str]] = {}
+    for chunk in utils.chunked(list(ids), utils.max_variables(conn)):
+        for item_id, parent_id in conn.execute(f"""SELECT item_id, parent_id FROM collections_items_relationship
+                                               WHERE item_id IN ({", ".join("?"*len(chunk))}) ORDER BY position""", chunk):
+            result.setdefault(item_id, []).append(parent_id)
+    return result
+
+def queue_deletes(editor: BatchEditor, clusters: typing.Iterable[DuplicateCluster], keep: typing.Literal["oldest", "newest"] = "oldest")-> int:
+    """ Queues all but one item of each cluster for deletion on editor (call editor.apply() to delete them).
+        The kept item is added to every collection the deleted items were in. Items already queued for deletion (e.g. by
+        an overlapping cluster) are never kept.
+
+    Returns:
+        int: The number of items queued for deletion.
+    """
+    if keep not in ("oldest", "newest"):
+        raise ValueError("keep must be 'oldest' or 'newest'")
+    deleted = 0
+    for cluster in clusters:
+        items = [id for id in (cluster.items if keep == "oldest" else cluster.items[::-1]) if id not in editor.deleted_items]
+        if not items: continue
+        kept, *duplicates = items
+        collections = set(cluster.collections[kept])
+        for id in duplicates:
+            for collection in cluster.collections[id]:
+                if collection not in collections:
+                    editor.move_item(kept, None, collection)
+                    collections.add(collection)
+            editor.delete_item(id)
+            deleted += 1
+    return deleted
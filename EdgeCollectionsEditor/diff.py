@@ -0,0 +1,161 @@
+""" Compares two snapshots of the Edge Collections database (e.g. two of utils.backup_database's backups).
+
+Rows are compared by key (see DIFF_KEYS) in two levels, merkle-style: rows are grouped into buckets by the low bits of
+    the hash of their key (so that keys such as favicon urls, which share their last characters, are spread as evenly as
+    GUIDs) and each bucket is summarized by its row count and the sums of its rows' hashes. Only buckets whose summaries differ are compared row by row, so unchanged regions of
+    the snapshots are never transferred out of SQLite. Rows of tables with a date_modified column are hashed by
+    date_modified alone unless shortcut is False. A table which only one snapshot has (e.g. collections_prism, which older
+    versions of Edge lack) is reported as wholly added or removed.
+"""
+import pathlib
+import sqlite3
+import typing
+
+import EdgeCollectionsEditor as ECE
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import utils
+
+## The columns identifying the rows of each table
+DIFF_KEYS: dict[Tables, tuple[str, ...]] = {
+    Tables.COLLECTIONS: (Collections.ID.value,),
+    Tables.ITEMS: (Items.ID.value,),
+    Tables.COLLECTIONS_SYNC: (Collections_Sync.COLLECTION_ID.value,),
+    Tables.ITEMS_SYNC: (Items_Sync.ITEM_ID.value,),
+    Tables.COLLECTIONS_ITEMS_RELATIONSHIP: (Collections_Items_Relationship.PARENT_ID.value, Collections_Items_Relationship.ITEM_ID.value),
+    Tables.FAVICONS: (Favicons.URL.value,),
+    Tables.META: (Meta.KEY.value,),
+    Tables.COMMENTS: (Comments.ID.value,),
+    Tables.ITEMS_OFFLINE_DATA: (Items_Offline_Data.ITEM_ID.value,),
+    Tables.COLLECTIONS_PRISM: (Collections_Prism.ID.value,),
+}
+
+## Separates the columns of multi-column keys
+KEY_SEPARATOR = "\x1f"
+## Rows are split into 2**bits buckets
+DEFAULT_BUCKET_BITS = 8
+
+_HASH_FUNCTION = "ece_diff_hash"
+_MASK = 0xFFFFFFFF
+
+Key = str|tuple[str, ...]
+
+class TableDiff(typing.NamedTuple):
+    """ The differences of one table. Keys are strings, or tuples of DIFF_KEYS' columns for multi-column keys. """
+    table: Tables
+    added: list[Key]
+    removed: list[Key]
+    modified: list[Key]
+    buckets: int
+    ## The buckets which had to be compared row by row
+    changed_buckets: int
+    ## Whether each database has the table
+    exists: tuple[bool, bool] = (True, True)
+
+    def __bool__(self)-> bool:
+        return bool(self.added or self.removed or self.modified)
+
+def row_hash(*values: typing.Any)-> int:
+    """ Returns a 64 bit hash of a row's values.
+
+    This is Python's hash(), which is much faster to call per row than hashlib but is salted per process (see
+        PYTHONHASHSEED), so hashes are only comparable within a process.
+    """
+    return hash(values)
+
+def _prepare(conn: sqlite3.Connection):
+    conn.create_function(_HASH_FUNCTION, -1, row_hash, deterministic=True)
+
+def _columns(conn: sqlite3.Connection, table: Tables)-> list[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table.value})")]
+
+def _key_sql(table: Tables)-> str:
+    return f" || '{KEY_SEPARATOR}' || ".join(f"coalesce({column}, '')" for column in DIFF_KEYS[table])
+
+def _bucket_sql(table: Tables, bits: int)-> str:
+    return f"({_HASH_FUNCTION}({', '.join(DIFF_KEYS[table])}) & {(1 << bits) - 1})"
+
+def _has_table(conn: sqlite3.Connection, table: Tables)-> bool:
+    return conn.execute("SELECT 1 FROM sqlite_schema WHERE type = 'table' AND name = ?", (table.value,)).fetchone() is not None
+
+def _hash_sql(conn: sqlite3.Connection, table: Tables, shortcut: bool)-> str:
+    columns = _columns(conn, table)
+    if shortcut and "date_modified" in columns:
+        columns = ["date_modified"]
+    return f"{_HASH_FUNCTION}({', '.join(columns)})"
+
+def _bucket_summaries(conn: sqlite3.Connection, table: Tables, bits: int, shortcut: bool)-> dict[int, tuple[int, int, int]]:
+    """ Returns (rows, sum of low halves, sum of high halves of the row hashes) per bucket. The halves are summed
+        separately so that the sums cannot overflow SQLite's 64 bit integers.
+    """
+    return {bucket: (count, low, high) for bucket, count, low, high in conn.execute(f"""
+        SELECT bucket, count(*), sum(hash & {_MASK}), sum((hash >> 32) & {_MASK})
+        FROM (SELECT {_bucket_sql(table, bits)} AS bucket, {_hash_sql(conn, table, shortcut)} AS hash FROM {table.value})
+        GROUP BY bucket""")}
+
+def _bucket_rows(conn: sqlite3.Connection, table: Tables, buckets: list[int], bits: int, shortcut: bool)-> dict[str, tuple[int, int]]:
+    """ Returns the summary (see _bucket_summaries) of each key of the rows in buckets. """
+    result: dict[str, tuple[int, int]] = {}
+    for chunk in utils.chunked(buckets, utils.max_variables(conn)):
+        for key, count, low, high in conn.execute(f"""
+            SELECT key, count(*), sum(hash & {_MASK}), sum((hash >> 32) & {_MASK})
+            FROM (SELECT {_key_sql(table)} AS key, {_hash_sql(conn, table, shortcut)} AS hash FROM {table.value}
+                  WHERE {_bucket_sql(table, bits)} IN ({", ".join("?"*len(chunk))}))
+            GROUP BY key""", chunk):
+            result[key] = (count, low, high)
+    return result
+
+def diff_table(a: sqlite3.Connection, b: sqlite3.Connection, table: Tables, bits: int = DEFAULT_BUCKET_BITS, shortcut: bool = True)-> TableDiff:
+    """ Compares a table of two databases (see diff_connections). """
+    if table not in DIFF_KEYS:
+        raise ValueError(f"Invalid table: {table}")
+    for conn in (a, b):
+        _prepare(conn)
+    exists = (_has_table(a, table), _has_table(b, table))
+    ## A missing table is compared as an empty one
+    summaries_a = _bucket_summaries(a, table, bits, shortcut) if exists[0] else {}
+    summaries_b = _bucket_summaries(b, table, bits, shortcut) if exists[1] else {}
+    changed = sorted(bucket for bucket in summaries_a.keys() | summaries_b.keys() if summaries_a.get(bucket) != summaries_b.get(bucket))
+    rows_a = _bucket_rows(a, table, [bucket for bucket in changed if bucket in summaries_a], bits, shortcut)
+    rows_b = _bucket_rows(b, table, [bucket for bucket in changed if bucket in summaries_b], bits, shortcut)
+    split = (lambda key: tuple(key.split(KEY_SEPARATOR))) if len(DIFF_KEYS[table]) > 1 else (lambda key: key)
+    return TableDiff(
+        table,
+        added=[split(key) for key in sorted(rows_b.keys() - rows_a.keys())],
+        removed=[split(key) for key in sorted(rows_a.keys() - rows_b.keys())],
+        modified=[split(key) for key in sorted(rows_a.keys() & rows_b.keys()) if rows_a[key] != rows_b[key]],
+        buckets=len(summaries_a.keys() | summaries_b.keys()),
+        changed_buckets=len(changed),
+        exists=exists,
+    )
+
+def diff_connections(a: sqlite3.Connection, b: sqlite3.Connection, tables: typing.Iterable[Tables]|None = None,
+                     bits: int = DEFAULT_BUCKET_BITS, shortcut: bool = True)-> dict[Tables, TableDiff]:
+    """ Compares two databases table by table.
+
+    Args:
+        a (sqlite3.Connection): The older database.
+        b (sqlite3.Connection): The newer database.
+        tables (typing.Iterable[Tables]|None, optional): The tables to compare. Defaults to None (all of Tables).
+        bits (int, optional): The number of bits of the key hashes rows are bucketed by. Defaults to DEFAULT_BUCKET_BITS.
+        shortcut (bool, optional): Whether rows with a date_modified column are only compared by date_modified. Defaults to True.
+
+    Returns:
+        dict[Tables, TableDiff]: The differences of each table; rows are added or removed going from a to b.
+    """
+    return {table: diff_table(a, b, table, bits, shortcut) for table in (Tables if tables is None else tables)}
+
+def diff_databases(a: pathlib.Path|str, b: pathlib.Path|str, tables: typing.Iterable[Tables]|None = None,
+                   bits: int = DEFAULT_BUCKET_BITS, shortcut: bool = True)-> dict[Tables, TableDiff]:
+    """ Compares two database files, opening both read-only (see diff_connections). """
+    a = pathlib.Path(a)
+    b = pathlib.Path(b)
+    for location in (a, b):
+        if not location.is_file():
+            raise FileNotFoundError(location)
+    conn_a, _ = ECE.connect_to_db(a, mode="ro")
+    conn_b, _ = ECE.connect_to_db(b, mode="ro")
+    try:
+        return diff_connections(conn_a, conn_b, tables, bits, shortcut)
+    finally:
+        conn_a.close()
+        conn_b.close()
@@ -87,4 +87,18 @@ class Items_Offline_Data(enum.Enum):
 class Collections_Prism(enum.Enum):
     ID = "id"
     DATE_MODIFIED = "date_modified"
-    TITLE = "title"
\ No newline at end of file
+    TITLE = "title"
+
+## The column enum for each table
+TABLE_COLUMNS: dict[Tables, type[enum.Enum]] = {
+    Tables.COLLECTIONS: Collections,
+    Tables.ITEMS: Items,
+    Tables.COLLECTIONS_SYNC: Collections_Sync,
+    Tables.ITEMS_SYNC: Items_Sync,
+    Tables.COLLECTIONS_ITEMS_RELATIONSHIP: Collections_Items_Relationship,
+    Tables.FAVICONS: Favicons,
+    Tables.META: Meta,
+    Tables.COMMENTS: Comments,
+    Tables.ITEMS_OFFLINE_DATA: Items_Offline_Data,
+    Tables.COLLECTIONS_PRISM: Collections_Prism,
+}
@@ -0,0 +1,115 @@
+""" Streams the Edge Collections database to newline-delimited JSON (one file per table, one row per line).
+
+Blob values are either base64-encoded inline as {"$base64": "..."} or written once to a content-addressed side file
+    (blobs/<first two characters of the sha256>/<sha256>) and referenced as {"$blob": "<sha256>"}.
+Memory use is bounded by the batch size: rows are read with utils.iter_rows and written as they arrive.
+export_database first copies the database to a temporary snapshot (with the online backup API), so that tables exported
+    in parallel all come from the same state of the database even while Edge is writing to it.
+"""
+import base64
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import tempfile
+import threading
+import typing
+
+import EdgeCollectionsEditor as ECE
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor.pool import ConnectionPool
+from EdgeCollectionsEditor import utils
+
+BlobMode = typing.Literal["base64", "files"]
+BLOB_MODES = ("base64", "files")
+
+BLOB_DIRECTORY = "blobs"
+
+def export_filename(table: Tables, compress: bool = False)-> str:
+    return f"{table.value}.ndjson{'.gz' if compress else ''}"
+
+def write_blob(directory: pathlib.Path, value: bytes)-> str:
+    """ Writes value to its content-addressed file under directory (unless it is already there) and returns its sha256. """
+    digest = hashlib.sha256(value).hexdigest()
+    location = directory / BLOB_DIRECTORY / digest[:2] / digest
+    if not location.exists():
+        location.parent.mkdir(parents=True, exist_ok=True)
+        ## Write to a temporary name first so that a concurrent writer never sees a partial file
+        temporary = location.with_name(f"{digest}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temporary.write_bytes(value)
+        temporary.replace(location)
+    return digest
+
+def encode_row(row: sqlite3.Row, directory: pathlib.Path, blobs: BlobMode = "base64")-> str:
+    """ Returns the row as a line of JSON, encoding its bytes values according to blobs. """
+    result = {}
+    for key in row.keys():
+        value = row[key]
+        if isinstance(value, bytes):
+            if blobs == "files":
+                value = {"$blob": write_blob(directory, value)}
+            else:
+                value = {"$base64": base64.b64encode(value).decode("ascii")}
+        result[key] = value
+    return json.dumps(result, ensure_ascii=False)
+
+def export_table(conn: sqlite3.Connection, table: Tables, directory: pathlib.Path, compress: bool = False, blobs: BlobMode = "base64",
+                 batch_size: int = utils.DEFAULT_BATCH_SIZE)-> tuple[pathlib.Path, int]:
+    """ Exports a table to directory/<table>.ndjson (or .ndjson.gz if compress is True).
+
+    Returns:
+        tuple[pathlib.Path, int]: The location of the export and the number of rows written.
+    """
+    if blobs not in BLOB_MODES:
+        raise ValueError(f"blobs must be one of {BLOB_MODES}")
+    location = directory / export_filename(table, compress)
+    rows = 0
+    with (gzip.open(location, "wt", encoding="utf-8") if compress else open(location, "w", encoding="utf-8")) as f:
+        for row in ECE.iter_table(conn, table, batch_size=batch_size):
+            f.write(encode_row(row, directory, blobs))
+            f.write("\n")
+            rows += 1
+    return location, rows
+
+def snapshot(file_location: pathlib.Path|str|None, destination: pathlib.Path)-> pathlib.Path:
+    """ Copies the database (including anything still in its write-ahead log) to destination as one consistent snapshot. """
+    source, _ = ECE.connect_to_db(file_location, mode="ro")
+    try:
+        target = sqlite3.connect(destination)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+    return destination
+
+def export_database(file_location: pathlib.Path|str|None, directory: pathlib.Path, tables: typing.Iterable[Tables]|None = None, compress: bool = False,
+                    blobs: BlobMode = "base64", batch_size: int = utils.DEFAULT_BATCH_SIZE, workers: int|None = None)-> dict[Tables, tuple[pathlib.Path, int]]:
+    """ Exports tables (every table by default) of a snapshot of the database (see snapshot), exporting independent tables
+        in parallel over read-only connections. The snapshot is deleted afterwards.
+
+    Args:
+        file_location (pathlib.Path|str|None): The location of the database (None for the default location).
+        directory (pathlib.Path): The directory to export to; it is created if needed.
+        tables (typing.Iterable[Tables]|None, optional): The tables to export. Defaults to None (all of Tables).
+        compress (bool, optional): Whether to gzip the exports. Defaults to False.
+        blobs (BlobMode, optional): "base64" to encode blobs inline or "files" to write them to side files. Defaults to "base64".
+        batch_size (int, optional): The number of rows read at a time by each worker. Defaults to utils.DEFAULT_BATCH_SIZE.
+        workers (int|None, optional): The number of tables to export at once. Defaults to None (see concurrent.futures.ThreadPoolExecutor).
+
+    Returns:
+        dict[Tables, tuple[pathlib.Path, int]]: The location and row count of each table's export.
+    """
+    if blobs not in BLOB_MODES:
+        raise ValueError(f"blobs must be one of {BLOB_MODES}")
+    tables = list(Tables if tables is None else tables)
+    directory.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="EdgeCollectionsEditor_export_") as temporary:
+        location = snapshot(file_location, pathlib.Path(temporary) / "snapshot.db")
+        ## Nothing else writes to the snapshot, so its connections can skip locking
+        with ConnectionPool(location, workers=workers, immutable=True) as pool:
+            results = pool.map(lambda conn, table: export_table(conn, table, directory, compress, blobs, batch_size), tables)
+    return dict(zip(tables, results))
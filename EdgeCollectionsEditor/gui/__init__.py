@@ -2,14 +2,31 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 
 import EdgeCollectionsEditor as ECE
-from EdgeCollectionsEditor import utils
+from EdgeCollectionsEditor import models, watch
+from EdgeCollectionsEditor.batch import BatchEditor
+from EdgeCollectionsEditor.gui.loader import Loader, Progress
+from EdgeCollectionsEditor.gui.preview import PreviewPane
+from EdgeCollectionsEditor.gui.widgets import VirtualListbox
+import array
+import bisect
+import gc
 import pathlib
+import queue
 import sqlite3
+import time
+import typing
 
-def collection_item_displayname(obj: sqlite3.Row)-> str:
+## The columns of collections and items the viewer loads (date_modified keys the preview cache)
+DISPLAY_COLUMNS = ("id", "title", "date_modified")
+STAGE_LABELS = {"backup": "Backing up", "collections": "Loading collections", "items": "Loading items", "relationships": "Loading relationships"}
+
+def collection_item_displayname(obj: sqlite3.Row|models.Model)-> str:
     return f"{obj['title']}\n {obj['id']}"
 
 class MainWindow(ttk.Frame):
+    ## Milliseconds between checks for changes reported by the Watcher
+    WATCH_INTERVAL = 500
+
     def __init__(self, master: tk.Tk, *args, **kwargs):
         super().__init__(master, *args, **kwargs)
 
@@ -21,6 +38,9 @@ class MainWindow(ttk.Frame):
         self.pack(fill="both", expand=True)
 
         self.file_location = None
+        self.watcher: watch.Watcher | None = None
+        ## ChangeEvents from the Watcher's thread, handled on the Tk thread
+        self.changes: queue.SimpleQueue[list[watch.ChangeEvent]] = queue.SimpleQueue()
 
         self.connect_db()
         self.setup()
@@ -29,13 +49,41 @@ class MainWindow(ttk.Frame):
         try:
             self.db, self.file_location = ECE.connect_to_db(file_location=self.file_location)
             print("DB Loaded from", self.file_location)
-            utils.backup_database(self.file_location)
         except FileNotFoundError:
             result = self.ask_file_location()
             if not result:
                 return self.master.destroy()
             return self.connect_db()
         
+    def watch(self, watcher: watch.Watcher|None = None):
+        """ Starts watching the database for changes made by Edge.
+
+        Args:
+            watcher (watch.Watcher|None, optional): The watcher to start, e.g. one created by the Loader's worker thread.
+                Defaults to None (a new one).
+        """
+        if not self.db: return
+        restart = self.watcher is not None
+        if restart:
+            self.watcher.close()
+        self.watcher = watcher if watcher is not None else watch.Watcher(self.file_location)
+        self.watcher.subscribe(self.changes.put)
+        self.watcher.start()
+        if not restart:
+            self.bind("<Destroy>", lambda e: self.watcher.stop() if e.widget is self else None)
+            self.after(self.WATCH_INTERVAL, self.check_changes)
+
+    def check_changes(self):
+        events = []
+        while True:
+            try:
+                events += self.changes.get_nowait()
+            except queue.Empty:
+                break
+        if events:
+            self.collectionviewer.apply_changes(events)
+        self.after(self.WATCH_INTERVAL, self.check_changes)
+
     def ask_file_location(self):
         messagebox.showerror("Error", "Could not find Edge Collections database.")
         self.file_location = filedialog.askopenfilename(filetypes=[("SQLite Database", ".db")])
@@ -59,24 +107,57 @@ class MainWindow(ttk.Frame):
         if not self.db:
             messagebox.showerror("Error", "No database connection.")
             raise RuntimeError("Lost database connection.")
-        ECE.edit_collection_title(self.db, collection['id'], title)
+        editor = BatchEditor(self.db)
+        editor.rename_collection(collection['id'], title)
+        editor.apply(journal=False)
 
     def delete_collection(self, collection: sqlite3.Row):
         if not self.db:
             messagebox.showerror("Error", "No database connection.")
             raise RuntimeError("Lost database connection.")
-        ECE.delete_collection(self.db, collection['id'])
+        editor = BatchEditor(self.db)
+        editor.delete_collection(collection['id'])
+        editor.apply(journal=False)
 
 class CollectionViewer(ttk.Frame):
+    ## Milliseconds to wait after the last keystroke before filtering
+    FILTER_DELAY = 150
+    ## Milliseconds between checks for rows from the Loader, and the seconds each check may spend adding them
+    LOAD_INTERVAL = 50
+    LOAD_BUDGET = 0.03
+
     def __init__(self, master: MainWindow, *args, **kwargs):
         super().__init__(master, *args, **kwargs)
         self.parent = master
+        self.library: models.Library | None = None
         self.data = {"collections": [], "items": []}
+        ## Lowercased display names, indexed the same as self.data
+        self.searchkeys: dict[str, list[str]] = {"collection": [], "item": []}
+        ## Collection id -> indices of its items in self.data["items"]
+        self.collectionitems: dict[str, array.array] = {}
+        ## filter_type -> (filter text, rows it matched); used to narrow the previous result while typing
+        self.lastfilter: dict[str, tuple[str, typing.Sequence[int]]] = {}
+        self.pendingfilter: dict[str, str] = {}
+        ## id -> index in self.data, per filter_type
+        self.positions: dict[str, dict[str, int]] = {"collection": {}, "item": {}}
+        ## Indices of rows which have been deleted since load_data; they are kept in self.data but not shown
+        self.removed: dict[str, set[int]] = {"collection": set(), "item": set()}
+        self.loader: Loader | None = None
+        ## The item selection at the last itemselect, to tell which item was just selected
+        self.itemselection: set[int] = set()
         self.setup()
-        self.load_data()
+        self.bind("<Destroy>", lambda e: self.loader.cancel() if e.widget is self and self.loader else None)
+        self.start_loading()
 
     def setup(self):
         ttk.Label(self, text="Edge Collections Editor", font=("Arial", 24)).pack(pady=10)
+
+        sf = ttk.Frame(self)
+        self.status = tk.StringVar()
+        ttk.Label(sf, textvariable=self.status).pack(side="left")
+        self.progress = ttk.Progressbar(sf, mode="determinate", length=200)
+        self.loadbutton = ttk.Button(sf)
+        sf.pack(fill="x", padx=10)
         
         f = ttk.Frame(self)
         f.pack(fill="both", expand=True)
@@ -85,17 +166,10 @@ class CollectionViewer(ttk.Frame):
         self.collectionfilter = tk.StringVar()
         self.collectionfilter.trace_add("write", lambda *e: self.updatefilter("collection", *e))
         self.collectionfilterwidget = tk.Entry(lf, textvariable=self.collectionfilter)
-        self.collectionfilterwidget.pack()
         self.collectionfilterwidget.pack(side='top', fill = 'x')
 
-        ff = ttk.Frame(lf)
-        ff.pack(fill="both", expand=True)
-
-        self.collectionlist = tk.Listbox(ff, selectmode="single", exportselection=False)
-        self.collectionlist.pack(side="left", fill="both", expand=True)
-        clscroll = ttk.Scrollbar(ff, command=self.collectionlist.yview)
-        clscroll.pack(side="right", fill="y")
-        self.collectionlist.config(yscrollcommand=clscroll.set)
+        self.collectionlist = VirtualListbox(lf, selectmode="single")
+        self.collectionlist.pack(fill="both", expand=True)
 
         mf = ttk.Frame(f)
 
@@ -104,16 +178,12 @@ class CollectionViewer(ttk.Frame):
         self.itemfilterwidget = tk.Entry(mf, textvariable=self.itemfilter)
         self.itemfilterwidget.pack(side='top', fill = 'x')
 
-        ff = ttk.Frame(mf)
-        ff.pack(fill="both", expand=True)
-
-        self.itemlist = tk.Listbox(ff, selectmode="multiple", exportselection=False)
-        self.itemlist.pack(side="left", fill="both", expand=True)
-        ilscroll = ttk.Scrollbar(ff, command=self.itemlist.yview)
-        ilscroll.pack(side="right", fill="y")
-        self.itemlist.config(yscrollcommand=ilscroll.set)
+        self.itemlist = VirtualListbox(mf, selectmode="multiple")
+        self.itemlist.pack(fill="both", expand=True)
 
         self.commandsframe = rf = ttk.Frame(f)
+        self.preview = PreviewPane(rf, self.parent.file_location)
+        self.preview.pack(fill="x", pady=(0, 10))
         self.collectioncommands = ttk.Frame(rf)
         self.collectioncommands.pack(fill="both", expand=True)
         self.itemscommands = ttk.Frame(rf)
@@ -131,59 +201,227 @@ class CollectionViewer(ttk.Frame):
         self.collectionlist.bind("<<ListboxSelect>>", self.collectionselect)
         self.itemlist.bind("<<ListboxSelect>>", self.itemselect)
 
-    def load_data(self):
-        self.collectionlist.delete(0, "end")
-        self.itemlist.delete(0, "end")
-        
-        for collection in (collections := ECE.list_collections(self.parent.db)):
-            self.collectionlist.insert("end", collection_item_displayname(collection))
-
-        self.data["collections"] = collections
+    def reset_data(self):
+        self.library = None
+        self.data = {"collections": [], "items": []}
+        self.searchkeys = {"collection": [], "item": []}
+        self.collectionlist.set_labels([])
+        self.itemlist.set_labels([])
+        self.itemlist.set_view([])
+        self.collectionitems = {}
+        self.positions = {"collection": {}, "item": {}}
+        self.removed = {"collection": set(), "item": set()}
+        self.lastfilter = {}
+        self.itemselection = set()
+        self.preview.show(None)
+
+    def add_rows(self, filter_type: str, rows: list[models.Model]):
+        """ Appends loaded collections or items to the data and the list's labels (without updating the view). """
+        names = [collection_item_displayname(row) for row in rows]
+        self.data[f"{filter_type}s"].extend(rows)
+        self.searchkeys[filter_type].extend(name.lower() for name in names)
+        (self.collectionlist if filter_type == "collection" else self.itemlist).labels.extend(names)
+
+    def set_library(self, library: models.Library):
+        """ Takes over the relationships of a library whose collections and items have been added with add_rows, in the same order. """
+        library.identity.conn = self.parent.db
+        self.library = library
+        self.data = {"collections": library.collections, "items": library.items}
+        ## The library's relationship arrays are not updated by apply_changes, so the viewer keeps its own (sorted) copy
+        self.collectionitems = {collection.id: array.array("l", sorted(library.item_indices(index))) for index, collection in enumerate(library.collections)}
+        ## Shared with the library: rows added by apply_changes are appended to its lists as well
+        self.positions = {"collection": library.collection_index, "item": library.item_index}
+        self.lastfilter = {}
 
-        items = ECE.list_items(self.parent.db)
-        items = ECE.link_items_to_collections(self.parent.db, items)
-        
-        self.data["items"] = items
+    def load_data(self):
+        """ Loads every collection and item on the calling thread (see start_loading to load them in the background). """
+        self.reset_data()
+        library = models.Library.load(self.parent.db, collection_columns=DISPLAY_COLUMNS, item_columns=DISPLAY_COLUMNS)
+        self.add_rows("collection", library.collections)
+        self.add_rows("item", library.items)
+        self.set_library(library)
+        self.collectionlist.set_view(range(len(library.collections)))
+
+    def start_loading(self):
+        """ Backs up and loads the database on a worker thread (see loader.Loader); the lists fill in as rows arrive. """
+        if self.loader is not None or not self.parent.db: return
+        self.reset_data()
+        ## Lets the rows of an earlier load be collected (see check_loading)
+        gc.unfreeze()
+        self.loader = Loader(self.parent.file_location, DISPLAY_COLUMNS, watch_changes=True)
+        self.loader.start()
+        self.status.set("Loading...")
+        self.progress.configure(value=0)
+        self.progress.pack(side="left", padx=10)
+        self.loadbutton.configure(text="Cancel", command=self.cancel_loading, state="normal")
+        self.loadbutton.pack(side="left")
+        self.after(self.LOAD_INTERVAL, self.check_loading)
+
+    def cancel_loading(self):
+        if self.loader is None: return
+        self.loader.cancel()
+        self.loadbutton.configure(state="disabled")
+
+    def check_loading(self):
+        """ Adds the rows the Loader has sent since the last check, for at most LOAD_BUDGET seconds. """
+        loader = self.loader
+        if loader is None: return
+        deadline = time.perf_counter() + self.LOAD_BUDGET
+        added = False
+        for message in loader.drain():
+            match message.kind:
+                case "progress":
+                    self.show_progress(message.value)
+                case "collections":
+                    self.add_rows("collection", message.value)
+                    added = True
+                case "items":
+                    self.add_rows("item", message.value)
+                    added = True
+                case "library":
+                    self.finish_loading(f"{len(message.value.collections):,} collections, {len(message.value.items):,} items")
+                    refresh = "item" in self.lastfilter
+                    self.set_library(message.value)
+                    self.applyfilter("collection", keep_offset=True)
+                    if refresh:
+                        self.applyfilter("item", keep_offset=True)
+                    ## The library lives as long as the viewer does: moving it to the permanent generation once, here on the
+                    ##  Tk thread, keeps later full collections from scanning millions of rows (and stalling the GUI)
+                    gc.freeze()
+                    if loader.watcher is not None:
+                        self.parent.watch(loader.watcher)
+                    return
+                case "cancelled":
+                    self.finish_loading(f"Loading cancelled ({len(self.data['items']):,} items loaded)", reload=True)
+                    return
+                case "error":
+                    self.finish_loading(f"Loading failed: {message.value}", reload=True)
+                    messagebox.showerror("Error", f"Could not load the database: {message.value}")
+                    return
+            if time.perf_counter() > deadline:
+                break
+        if added:
+            self.applyfilter("collection", keep_offset=True)
+            ## The item list stays empty until it is filtered or a collection is selected
+            if "item" in self.lastfilter:
+                self.applyfilter("item", keep_offset=True)
+        self.after(self.LOAD_INTERVAL, self.check_loading)
+
+    def show_progress(self, progress: Progress):
+        label = STAGE_LABELS[progress.stage]
+        if progress.total:
+            self.progress.configure(maximum=progress.total, value=progress.done)
+            self.status.set(f"{label} {progress.done:,}/{progress.total:,}")
+        else:
+            self.progress.configure(value=0)
+            self.status.set(f"{label}...")
+
+    def finish_loading(self, status: str, reload: bool = False):
+        self.loader = None
+        self.status.set(status)
+        self.progress.pack_forget()
+        if reload:
+            self.loadbutton.configure(text="Reload", command=self.start_loading, state="normal")
+        else:
+            self.loadbutton.pack_forget()
+
+    def apply_changes(self, events: list[watch.ChangeEvent]):
+        """ Updates the changed collections and items in place, keeping the lists' selections and scroll positions. """
+        identity = self.library.identity
+        for event in events:
+            if event.table == ECE.Tables.COLLECTIONS_ITEMS_RELATIONSHIP:
+                for item_id, parent_id in event.removed:
+                    self.unlinkitem(item_id, parent_id)
+                for item_id, parent_id in event.added:
+                    self.linkitem(item_id, parent_id)
+                continue
+            filter_type, cls = ("collection", models.Collection) if event.table == ECE.Tables.COLLECTIONS else ("item", models.Item)
+            for id in event.added + event.modified:
+                row = event.rows[id]
+                self.setrow(filter_type, identity.add(cls, {column: row[column] for column in DISPLAY_COLUMNS}))
+            for id in event.removed:
+                if (index := self.positions[filter_type].get(id)) is not None:
+                    self.removed[filter_type].add(index)
+
+        self.lastfilter = {}
+        self.applyfilter("collection", keep_offset=True)
+        self.applyfilter("item", keep_offset=True)
+
+    def setrow(self, filter_type: str, row: models.Model):
+        """ Adds a collection or item, or updates its label. """
+        data = self.data[f"{filter_type}s"]
+        listbox = self.collectionlist if filter_type == "collection" else self.itemlist
+        name = collection_item_displayname(row)
+        index = self.positions[filter_type].get(row.id)
+        if index is None:
+            index = self.positions[filter_type][row.id] = len(data)
+            data.append(row)
+            listbox.labels.append(name)
+            self.searchkeys[filter_type].append(name.lower())
+        else:
+            listbox.labels[index] = name
+            self.searchkeys[filter_type][index] = name.lower()
+        self.removed[filter_type].discard(index)
+
+    def linkitem(self, item_id: str, collection_id: str):
+        if (index := self.positions["item"].get(item_id)) is None: return
+        indices = self.collectionitems.setdefault(collection_id, array.array("l"))
+        position = bisect.bisect_left(indices, index)
+        if position == len(indices) or indices[position] != index:
+            indices.insert(position, index)
+
+    def unlinkitem(self, item_id: str, collection_id: str):
+        if (index := self.positions["item"].get(item_id)) is None: return
+        indices = self.collectionitems.get(collection_id, array.array("l"))
+        position = bisect.bisect_left(indices, index)
+        if position < len(indices) and indices[position] == index:
+            del indices[position]
 
     def updatefilter(self, filter_type: str, *e):
+        """ Schedules the filter to be applied once the user stops typing. """
+        if (pending := self.pendingfilter.pop(filter_type, None)):
+            self.after_cancel(pending)
+        self.pendingfilter[filter_type] = self.after(self.FILTER_DELAY, self.applyfilter, filter_type)
+
+    def filterbase(self, filter_type: str)-> typing.Sequence[int]:
+        """ Returns the rows the given filter is applied to. """
+        removed = self.removed[filter_type]
         if filter_type == "collection":
-            selection = [self.collectionlist.get(idx) for idx in self.collectionlist.curselection()]
-            collection_names = [collection_item_displayname(collection) for collection in self.data["collections"]]
-            self.collectionlist.delete(0, "end")
-            for name in collection_names:
-                if self.collectionfilter.get() in name:
-                    self.collectionlist.insert("end", name)
-                    if name in selection:
-                        self.collectionlist.selection_set(collection_names.index(name))
-        if filter_type == "item":
-            selection = [self.itemlist.get(idx) for idx in self.itemlist.curselection()]
-            item_names = [collection_item_displayname(item) for item in self.data["items"]]
-            self.itemlist.delete(0, "end")
-            for name in item_names:
-                if self.itemfilter.get() in name:
-                    self.itemlist.insert("end", name)
-                    if name in selection:
-                        self.itemlist.selection_set(item_names.index(name))
+            rows = range(len(self.data["collections"]))
+        elif (selection := self.collectionlist.curselection()):
+            rows = self.collectionitems.get(self.data["collections"][selection[0]]["id"], [])
+        else:
+            rows = range(len(self.data["items"]))
+        return [index for index in rows if index not in removed] if removed else rows
+
+    def applyfilter(self, filter_type: str, keep_offset: bool = False):
+        self.pendingfilter.pop(filter_type, None)
+        text = (self.collectionfilter if filter_type == "collection" else self.itemfilter).get().strip().lower()
+        base = self.filterbase(filter_type)
+        previous, rows = self.lastfilter.get(filter_type, ("", base))
+        ## When the user keeps typing only the previous matches need to be checked again
+        if not (previous and text.startswith(previous)):
+            rows = base
+        if text:
+            keys = self.searchkeys[filter_type]
+            rows = [index for index in rows if text in keys[index]]
+        self.lastfilter[filter_type] = (text, rows)
+        (self.collectionlist if filter_type == "collection" else self.itemlist).set_view(rows, keep_offset=keep_offset)
 
     def collectionselect(self, *e):
         ## Collection Listbox unselects when items are selected
-        if not self.collectionlist.curselection(): return
+        if not (selection := self.collectionlist.curselection()): return
         self.reload_items()
+        self.itemselection = set()
+        self.preview.show(self.data["collections"][selection[0]])
         
         self.load_collection_commands()
 
     def reload_items(self):
-        select = self.collectionlist.get(self.collectionlist.curselection()[0])
-        name,id = select.split("\n", maxsplit=1)
-        id = id.strip()
-        itemfilter = self.itemfilter.get().strip()
-
-        self.itemlist.delete(0, "end")
-        for item in self.data["items"]:
-            for relationship in item['collections_items_relationships']:
-                if relationship["parent_id"] == id and (itemfilter == "" or itemfilter in collection_item_displayname(item)):
-                    self.itemlist.insert("end", collection_item_displayname(item))
-                    break
+        ## The item filter's base changed, so it cannot be narrowed from its last result
+        self.lastfilter.pop("item", None)
+        self.applyfilter("item")
+
     def load_collection_commands(self):
         for child in self.collectioncommands.winfo_children()+self.itemscommands.winfo_children():
             child.destroy()
@@ -194,6 +432,14 @@ class CollectionViewer(ttk.Frame):
     def itemselect(self, *e):
         for child in self.itemscommands.winfo_children():
             child.destroy()
+        selection = self.itemlist.curselection()
+        ## Preview the item which was just selected, or else the first one still selected
+        added = [index for index in selection if index not in self.itemselection]
+        self.itemselection = set(selection)
+        if (shown := added or selection):
+            self.preview.show(self.data["items"][shown[0]])
+        else:
+            self.preview.show(None)
         ## TODO: load commands for this item
 
 ## Commands
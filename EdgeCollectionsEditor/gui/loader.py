@@ -0,0 +1,163 @@
+""" Backs up and loads the database on a worker thread, so that the GUI stays responsive while a large library loads.
+
+The worker uses its own read-only connection and sends its results to the Tk thread through a queue, in batches,
+    which the Tk thread drains with after() (see CollectionViewer.start_loading).
+"""
+import pathlib
+import queue
+import sqlite3
+import threading
+import typing
+
+import EdgeCollectionsEditor as ECE
+from EdgeCollectionsEditor import models, utils, watch
+
+## The number of collections or items sent to the Tk thread at a time
+BATCH_SIZE = 5000
+
+class Cancelled(Exception):
+    """ Raised on the worker thread to stop loading. """
+
+class Progress(typing.NamedTuple):
+    ## "backup", "collections", "items" or "relationships"
+    stage: str
+    done: int
+    ## 0 if not known yet
+    total: int
+
+class Message(typing.NamedTuple):
+    """ Sent from the worker to the Tk thread.
+
+    kind is one of:
+        "progress": value is a Progress.
+        "collections"/"items": value is a list of models (in the order of the Library which follows).
+        "library": value is the models.Library; loading is done.
+        "cancelled": value is None; loading is done.
+        "error": value is the exception; loading is done.
+    """
+    kind: str
+    value: typing.Any
+
+class Loader:
+    """ Loads a Library on a worker thread.
+
+    Example:
+        loader = Loader(file_location, columns)
+        loader.start()
+        ... # on the Tk thread, periodically:
+        for message in loader.drain(): ...
+    """
+    def __init__(self, file_location: pathlib.Path, columns: typing.Sequence[str]|None = None, backup: bool = True, watch_changes: bool = False,
+                 batch_size: int = BATCH_SIZE):
+        """ Creates the loader; call start to start loading.
+
+        Args:
+            file_location (pathlib.Path): The database to load.
+            columns (typing.Sequence[str]|None, optional): The columns of collections and items to load. Defaults to None (all).
+            backup (bool, optional): Back up the database first (see utils.backup_database). Defaults to True.
+            watch_changes (bool, optional): Also create a watch.Watcher (which reads the ids and dates of every row) on the worker,
+                for the Tk thread to start once the library is loaded. It is created before the library is read, so that it
+                reports any changes made while the library loads. Defaults to False.
+            batch_size (int, optional): The number of rows sent at a time. Defaults to BATCH_SIZE.
+        """
+        self.file_location = file_location
+        self.columns = columns
+        self.backup = backup
+        self.watch_changes = watch_changes
+        self.batch_size = batch_size
+        self.watcher: watch.Watcher|None = None
+        self.messages: queue.SimpleQueue[Message] = queue.SimpleQueue()
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="EdgeCollectionsEditor.load", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        """ Asks the worker to stop; it sends a "cancelled" message when it has. """
+        self.cancelled.set()
+
+    def drain(self)-> typing.Iterator[Message]:
+        """ Yields the messages received so far (stop iterating early to leave the rest for later). """
+        while True:
+            try:
+                yield self.messages.get_nowait()
+            except queue.Empty:
+                return
+
+    def _send(self, kind: str, value: typing.Any = None):
+        self.messages.put(Message(kind, value))
+
+    def _check(self):
+        if self.cancelled.is_set():
+            raise Cancelled()
+
+    def _backup_progress(self, status: int, remaining: int, total: int):
+        ## Raising here aborts the backup, which removes the partial file
+        self._check()
+        self._send("progress", Progress("backup", total - remaining, total))
+
+    def _run(self):
+        try:
+            if self.backup:
+                self._send("progress", Progress("backup", 0, 0))
+                utils.backup_database(self.file_location, progress=self._backup_progress, skip_unchanged=True)
+            self._check()
+            if self.watch_changes:
+                self.watcher = watch.Watcher(self.file_location)
+            library = self._load()
+            self._check()
+            self._send("library", library)
+        except Cancelled:
+            self._close_watcher()
+            self._send("cancelled")
+        except Exception as e:
+            self._close_watcher()
+            self._send("error", e)
+        finally:
+            self.finished.set()
+
+    def _close_watcher(self):
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+
+    def _load(self)-> models.Library:
+        conn, _ = ECE.connect_to_db(self.file_location, mode="ro")
+        try:
+            identity = models.IdentityMap(conn)
+            collections = self._stream(conn, identity, models.Collection, "ORDER BY position")
+            items = self._stream(conn, identity, models.Item, "")
+            total = conn.execute("SELECT count(*) FROM collections_items_relationship").fetchone()[0]
+            relationships = []
+            cursor = conn.execute("SELECT item_id, parent_id, position FROM collections_items_relationship")
+            while (batch := cursor.fetchmany(self.batch_size)):
+                self._check()
+                relationships.extend(batch)
+                self._send("progress", Progress("relationships", len(relationships), total))
+            library = models.Library(identity, collections, items, relationships)
+        finally:
+            conn.close()
+        ## The connection is closed; the Tk thread reattaches the identity map to its own
+        identity.conn = None
+        return library
+
+    def _stream(self, conn: sqlite3.Connection, identity: models.IdentityMap, cls: type[models.Model], clause: str)-> list[models.Model]:
+        kind = cls.TABLE.value
+        total = conn.execute(f"SELECT count(*) FROM {kind}").fetchone()[0]
+        rows: list[models.Model] = []
+        batch = []
+        for row in identity.load(cls, clause, columns=self.columns, lazy=True, batch_size=self.batch_size):
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                self._check()
+                rows.extend(batch)
+                self._send(kind, batch)
+                self._send("progress", Progress(kind, len(rows), total))
+                batch = []
+        self._check()
+        rows.extend(batch)
+        self._send(kind, batch)
+        self._send("progress", Progress(kind, len(rows), total))
+        return rows
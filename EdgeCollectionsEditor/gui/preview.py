@@ -0,0 +1,242 @@
+""" A preview of the image of the selected collection (its thumbnail) or item (its canonical image, or else its favicon).
+
+Images are read (through blobs.LazyBlob, on a read-only pool.ConnectionPool), decoded and downscaled on worker threads;
+    the Tk thread only polls for finished jobs and turns their results into PhotoImages. Those are kept in a
+    decoding.DecodeCache keyed by (table, id, column, date_modified) and capped by size, so going back to a row which
+    has not been modified never reads or decodes its image again, while a modified row gets a new key.
+    Requests which have not started when another row is selected are cancelled, so scrolling only ever waits for the last one.
+
+With Pillow (pip install EdgeCollectionsEditor[preview]) any format Pillow reads is decoded and resized on the workers.
+    Without it only PNG and GIF can be shown, and Tk has to decode them on its own thread (the workers still read them
+    and work out how much to subsample them by).
+"""
+import base64
+import binascii
+import concurrent.futures
+import io
+import pathlib
+import sqlite3
+import struct
+import tkinter as tk
+from tkinter import ttk
+import typing
+
+try:
+    from PIL import Image, ImageTk
+except ImportError:  # pragma: no cover
+    Image = ImageTk = None
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import blobs, decoding, models, pool
+
+## The largest width and height of a preview
+PREVIEW_SIZE = (256, 256)
+DEFAULT_WORKERS = 2
+## The cache is measured in decoded bytes (4 per pixel)
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 64 << 20
+
+## The image column previewed for each table
+IMAGE_COLUMNS = {Tables.COLLECTIONS: Collections.THUMBNAIL.value, Tables.ITEMS: Items.CANONICAL_IMAGE_DATA.value}
+
+_PNG = b"\x89PNG\r\n\x1a\n"
+_GIF = (b"GIF87a", b"GIF89a")
+
+class Decoded(typing.NamedTuple):
+    """ A worker's result, turned into a PhotoImage on the Tk thread by PreviewLoader.photo. """
+    ## A downscaled PIL image (with Pillow)
+    image: typing.Any = None
+    ## Otherwise, base64 PNG or GIF data for tk.PhotoImage and the factor to subsample it by
+    data: str|None = None
+    subsample: int = 1
+    ## Why there is no image
+    message: str|None = None
+
+def unwrap_image(raw: bytes)-> bytes:
+    """ Returns the image bytes of a thumbnail or canonical image, which Edge stores as JSON ({"mimeType", "data": base64})
+        or, like favicons, as the image itself.
+    """
+    if raw.startswith(_PNG) or raw.startswith(_GIF):
+        return raw
+    try:
+        value = decoding.decode_value(raw)
+    except (ValueError, UnicodeDecodeError):
+        return raw
+    if isinstance(value, dict) and isinstance(value.get("data"), str):
+        try:
+            return base64.b64decode(value["data"])
+        except binascii.Error:
+            pass
+    return raw
+
+def image_size(data: bytes)-> tuple[int, int]|None:
+    """ Returns the width and height of PNG or GIF data, read from its header, or None for other formats. """
+    if data.startswith(_PNG) and data[12:16] == b"IHDR" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:6] in _GIF and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    return None
+
+def decode_image(data: bytes, size: tuple[int, int] = PREVIEW_SIZE)-> Decoded:
+    """ Decodes and downscales image data to fit within size (see Decoded). """
+    if Image is not None:
+        try:
+            image = Image.open(io.BytesIO(data))
+            ## Lets JPEG decode at a fraction of its size
+            image.draft("RGB", size)
+            image.thumbnail(size)
+            return Decoded(image=image.convert("RGBA"))
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            return Decoded(message=f"Cannot decode image: {e}")
+    if (dimensions := image_size(data)) is None:
+        return Decoded(message="Only PNG and GIF images can be previewed without Pillow")
+    width, height = dimensions
+    subsample = max(1, -(-width // size[0]), -(-height // size[1]))
+    return Decoded(data=base64.b64encode(data).decode("ascii"), subsample=subsample)
+
+def read_preview(conn: sqlite3.Connection, table: Tables, id: str, size: tuple[int, int] = PREVIEW_SIZE)-> Decoded:
+    """ Reads and decodes the image of a collection or item (falling back to an item's favicon). Runs on a worker. """
+    column = IMAGE_COLUMNS[table]
+    columns = [column, Items.FAVICON_URL.value] if table == Tables.ITEMS else [column]
+    row = blobs.execute(conn, table, f"FROM {table.value} WHERE id = ?", (id,), lazy=True, columns=columns).fetchone()
+    if row is None:
+        return Decoded(message="Not found")
+    images = [row[column]]
+    if table == Tables.ITEMS and row[Items.FAVICON_URL.value]:
+        favicon = blobs.execute(conn, Tables.FAVICONS, "FROM favicons WHERE url = ?", (row[Items.FAVICON_URL.value],), lazy=True,
+                                columns=[Favicons.DATA.value]).fetchone()
+        images.append(favicon[Favicons.DATA.value] if favicon else None)
+    result = Decoded(message="No image")
+    for blob in images:
+        if blob is None or not len(blob):
+            continue
+        result = decode_image(unwrap_image(blob.load()), size)
+        if result.message is None:
+            break
+    return result
+
+class PreviewLoader:
+    """ Runs read_preview on worker threads and caches the PhotoImages made from the results.
+
+    Example (on the Tk thread):
+        loader = PreviewLoader(file_location)
+        key = PreviewLoader.key(row)
+        if (cached := loader.get(key)) is None:
+            loader.request(key)
+        ... # periodically
+        for key, photo, message in loader.finished(): ...
+    """
+    def __init__(self, file_location: pathlib.Path, size: tuple[int, int] = PREVIEW_SIZE, workers: int = DEFAULT_WORKERS,
+                 cache: decoding.DecodeCache|None = None):
+        self.size = size
+        self.pool = pool.ConnectionPool(file_location, mode="ro", workers=workers)
+        self.cache = cache if cache is not None else decoding.DecodeCache(DEFAULT_MAX_ENTRIES, DEFAULT_MAX_BYTES)
+        self.jobs: dict[decoding.CacheKey, concurrent.futures.Future[Decoded]] = {}
+
+    @staticmethod
+    def key(row: models.Model)-> decoding.CacheKey:
+        return (row.TABLE, row.id, IMAGE_COLUMNS[row.TABLE], getattr(row, Items.DATE_MODIFIED.value, None))
+
+    def get(self, key: decoding.CacheKey)-> tuple[tk.PhotoImage|None, str|None]|None:
+        """ Returns the cached (image, message) for key, or None. """
+        return self.cache.get(key)
+
+    def request(self, key: decoding.CacheKey):
+        """ Starts a job for key (unless one is running), cancelling the jobs of other keys which have not started. """
+        for other, job in list(self.jobs.items()):
+            if other != key and job.cancel():
+                del self.jobs[other]
+        if key not in self.jobs:
+            table, id, _, _ = key
+            self.jobs[key] = self.pool.submit(read_preview, table, id, self.size)
+
+    def finished(self)-> typing.Iterator[tuple[decoding.CacheKey, tk.PhotoImage|None, str|None]]:
+        """ Yields (key, image, message) for the jobs which are done, caching the images. Call on the Tk thread. """
+        for key, job in list(self.jobs.items()):
+            if not job.done():
+                continue
+            del self.jobs[key]
+            try:
+                photo, message = self.photo(job.result())
+            except Exception as e:
+                ## Not cached, as it may not happen again (e.g. the database was locked)
+                yield key, None, f"Cannot preview: {e}"
+                continue
+            size = photo.width() * photo.height() * 4 if photo is not None else 0
+            self.cache.put(key, (photo, message), size)
+            yield key, photo, message
+
+    def photo(self, decoded: Decoded)-> tuple[tk.PhotoImage|None, str|None]:
+        """ Creates the PhotoImage for a worker's result. """
+        if decoded.image is not None:
+            return ImageTk.PhotoImage(decoded.image), None
+        if decoded.data is not None:
+            photo = tk.PhotoImage(data=decoded.data)
+            return (photo.subsample(decoded.subsample) if decoded.subsample > 1 else photo), None
+        return None, decoded.message
+
+    def close(self):
+        for job in self.jobs.values():
+            job.cancel()
+        self.jobs = {}
+        self.pool.close()
+
+class PreviewPane(ttk.Frame):
+    """ Shows the preview of a collection or item, loaded by a PreviewLoader. """
+    ## Milliseconds between checks for finished jobs (only while one is pending)
+    POLL_INTERVAL = 30
+
+    def __init__(self, master: tk.Misc, file_location: pathlib.Path, size: tuple[int, int] = PREVIEW_SIZE, **kwargs):
+        super().__init__(master, **kwargs)
+        self.file_location = file_location
+        self.size = size
+        ## Created on first use, so that no connection is opened until something is previewed
+        self.loader: PreviewLoader|None = None
+        self.current: decoding.CacheKey|None = None
+        ## The label does not keep a reference to its image, and the cache may evict it
+        self.photo: tk.PhotoImage|None = None
+        self.polling = False
+
+        self.image = ttk.Label(self, anchor="center")
+        self.image.pack(fill="x")
+        self.caption = tk.StringVar()
+        ttk.Label(self, textvariable=self.caption, wraplength=size[0], justify="center").pack(fill="x")
+        self.bind("<Destroy>", lambda e: self.close() if e.widget is self else None)
+
+    def show(self, row: models.Model|None):
+        """ Previews row (a collection or item), or clears the pane if row is None. """
+        if row is None:
+            self.current = None
+            self._display(None, "")
+            return
+        if self.loader is None:
+            self.loader = PreviewLoader(self.file_location, self.size)
+        self.current = key = PreviewLoader.key(row)
+        self.caption.set(getattr(row, Items.TITLE.value, ""))
+        if (cached := self.loader.get(key)) is not None:
+            self._display(*cached)
+            return
+        self._display(None, "Loading...")
+        self.loader.request(key)
+        if not self.polling:
+            self.polling = True
+            self.after(self.POLL_INTERVAL, self.poll)
+
+    def poll(self):
+        self.polling = False
+        if self.loader is None: return
+        for key, photo, message in self.loader.finished():
+            if key == self.current:
+                self._display(photo, message)
+        if self.loader.jobs:
+            self.polling = True
+            self.after(self.POLL_INTERVAL, self.poll)
+
+    def _display(self, photo: tk.PhotoImage|None, message: str|None):
+        self.photo = photo
+        self.image.configure(image=photo if photo is not None else "", text="" if photo is not None else (message or ""))
+
+    def close(self):
+        if self.loader is not None:
+            self.loader.close()
+            self.loader = None
@@ -0,0 +1,156 @@
+import tkinter as tk
+from tkinter import ttk
+import typing
+
+class VirtualListbox(ttk.Frame):
+    """ A scrollable list which only inserts the rows that are currently visible into its tk.Listbox.
+
+    Rows are referred to by their index in labels; set_view chooses which of them are shown (and in what order).
+        curselection returns those indices instead of Listbox positions, and the selection is kept for rows
+        which are scrolled or filtered out of view.
+    Up, Down, Prior, Next, Home and End move the cursor through the whole view, scrolling it into view; the cursor's row
+        is selected, except with selectmode="multiple", where Space toggles it (as in tk.Listbox).
+    Generates <<ListboxSelect>> on itself when the user changes the selection.
+    """
+    def __init__(self, master: tk.Misc, selectmode: str = "browse", **kwargs):
+        super().__init__(master, **kwargs)
+        self.labels: typing.Sequence[str] = []
+        self.view: typing.Sequence[int] = []
+        self.selected: set[int] = set()
+        self.offset = 0
+        self.visible = 1
+        self.selectmode = selectmode
+        ## The keyboard cursor's position in view
+        self.cursor: int|None = None
+
+        ## With selectmode="multiple" the cursor is not the selection, so it is shown
+        self.listbox = tk.Listbox(self, selectmode=selectmode, exportselection=False,
+                                  activestyle="dotbox" if selectmode == "multiple" else "none")
+        self.listbox.pack(side="left", fill="both", expand=True)
+        self.scrollbar = ttk.Scrollbar(self, command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.listbox.bind("<Configure>", self._resize)
+        self.listbox.bind("<<ListboxSelect>>", self._select)
+        self.listbox.bind("<MouseWheel>", lambda e: self._wheel(-1 if e.delta > 0 else 1))
+        self.listbox.bind("<Button-4>", lambda e: self._wheel(-1))
+        self.listbox.bind("<Button-5>", lambda e: self._wheel(1))
+        self.listbox.bind("<Up>", lambda e: self._move(-1))
+        self.listbox.bind("<Down>", lambda e: self._move(1))
+        self.listbox.bind("<Prior>", lambda e: self._move(-self.visible))
+        self.listbox.bind("<Next>", lambda e: self._move(self.visible))
+        self.listbox.bind("<Home>", lambda e: self._move(-len(self.view)))
+        self.listbox.bind("<End>", lambda e: self._move(len(self.view)))
+        self.listbox.bind("<space>", lambda e: self._toggle())
+
+    def set_labels(self, labels: typing.Sequence[str]):
+        """ Replaces the rows of the list; all rows are shown and the selection is cleared. """
+        self.labels = labels
+        self.selected = set()
+        self.set_view(range(len(labels)))
+
+    def set_view(self, view: typing.Sequence[int], keep_offset: bool = False):
+        """ Shows only the rows at the given indices of labels, scrolled to the top unless keep_offset is True. """
+        self.view = view
+        self.cursor = None
+        if not keep_offset:
+            self.offset = 0
+        self.render()
+
+    def curselection(self)-> list[int]:
+        """ Returns the indices (into labels) of the selected rows which are in the current view. """
+        if not self.selected:
+            return []
+        return [index for index in self.view if index in self.selected]
+
+    def selection_clear(self):
+        self.selected = set()
+        self.render()
+
+    def render(self):
+        """ Fills the Listbox with the rows visible at the current offset. """
+        self.offset = max(0, min(self.offset, len(self.view) - self.visible))
+        rows = self.view[self.offset:self.offset+self.visible]
+        self.listbox.delete(0, "end")
+        if rows:
+            self.listbox.insert("end", *(self.labels[index] for index in rows))
+        for position, index in enumerate(rows):
+            if index in self.selected:
+                self.listbox.selection_set(position)
+        if self.cursor is not None and 0 <= self.cursor - self.offset < len(rows):
+            self.listbox.activate(self.cursor - self.offset)
+        if self.view:
+            self.scrollbar.set(self.offset / len(self.view), min(1.0, (self.offset + self.visible) / len(self.view)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def yview(self, *args):
+        """ Scrollbar command: handles "moveto" and "scroll" in the same way as tk.Listbox.yview. """
+        match args:
+            case ("moveto", fraction):
+                self.offset = int(float(fraction) * len(self.view))
+            case ("scroll", number, "pages"):
+                self.offset += int(number) * self.visible
+            case ("scroll", number, _):
+                self.offset += int(number)
+        self.render()
+
+    def _wheel(self, direction: int):
+        self.yview("scroll", direction * 3, "units")
+        return "break"
+
+    def _resize(self, event: tk.Event):
+        linespace = max(1, int(self.listbox.tk.call("font", "metrics", self.listbox.cget("font"), "-linespace")))
+        visible = max(1, event.height // linespace)
+        if visible != self.visible:
+            self.visible = visible
+            self.render()
+
+    def see(self, position: int):
+        """ Scrolls the list so that the row at the given position in view is visible. """
+        if position < self.offset:
+            self.offset = position
+        elif position >= self.offset + self.visible:
+            self.offset = position - self.visible + 1
+        self.render()
+
+    def _move(self, amount: int):
+        if not self.view:
+            return "break"
+        if self.cursor is None:
+            selection = self.curselection()
+            if selection:
+                self.cursor = self.view.index(selection[0])
+            else:
+                ## Up and Down start at the first visible row
+                self.cursor = self.offset
+                if abs(amount) == 1:
+                    amount = 0
+        self.cursor = max(0, min(self.cursor + amount, len(self.view) - 1))
+        if self.selectmode != "multiple":
+            self.selected = {self.view[self.cursor]}
+        self.see(self.cursor)
+        if self.selectmode != "multiple":
+            self.event_generate("<<ListboxSelect>>")
+        return "break"
+
+    def _toggle(self):
+        if self.selectmode == "multiple" and self.cursor is not None and self.cursor < len(self.view):
+            self.selected ^= {self.view[self.cursor]}
+            self.render()
+            self.event_generate("<<ListboxSelect>>")
+        return "break"
+
+    def _select(self, *e):
+        rows = self.view[self.offset:self.offset+self.visible]
+        if rows:
+            ## Clicking moves the cursor (tk.Listbox activates the clicked row before generating <<ListboxSelect>>)
+            self.cursor = self.offset + min(self.listbox.index("active"), len(rows) - 1)
+        current = {rows[position] for position in self.listbox.curselection()}
+        if self.selectmode in ("single", "browse"):
+            if not current:
+                return
+            self.selected = current
+        else:
+            self.selected = (self.selected - set(rows)) | current
+        self.event_generate("<<ListboxSelect>>")
@@ -0,0 +1,199 @@
+""" A copy of the Edge Collections database with the indexes Edge's schema lacks (see connect_to_db's mirror option).
+
+The database is copied with the backup API into memory or a temporary file, and MIRROR_INDEXES are added to the copy,
+    so lookups by collection, item, comment parent and title no longer scan whole tables. The original file is never altered
+    except by write_back.
+Temporary triggers record the key (see diff.DIFF_KEYS) of every row inserted, updated or deleted in the mirror. On commit
+    (MirrorConnection.commit, or leaving a with block) those rows are replaced in the original file in a single transaction,
+    which leaves any other rows Edge has changed in the meantime alone.
+"""
+import contextlib
+import os
+import pathlib
+import sqlite3
+import tempfile
+import typing
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor.diff import DIFF_KEYS
+
+## name -> (table, columns) of the indexes added to the mirror
+MIRROR_INDEXES: dict[str, tuple[Tables, tuple[str, ...]]] = {
+    "ece_mirror_relationship_parent": (Tables.COLLECTIONS_ITEMS_RELATIONSHIP, (Collections_Items_Relationship.PARENT_ID.value, Collections_Items_Relationship.POSITION.value)),
+    "ece_mirror_relationship_item": (Tables.COLLECTIONS_ITEMS_RELATIONSHIP, (Collections_Items_Relationship.ITEM_ID.value,)),
+    "ece_mirror_comments_parent": (Tables.COMMENTS, (Comments.PARENT_ID.value,)),
+    "ece_mirror_items_title": (Tables.ITEMS, (Items.TITLE.value,)),
+    "ece_mirror_collections_title": (Tables.COLLECTIONS, (Collections.TITLE.value,)),
+}
+MirrorLocation = typing.Literal["memory", "file"]
+MIRROR_LOCATIONS = ("memory", "file")
+
+## Temporary table of the changed keys
+CHANGES_TABLE = "ece_mirror_changes"
+## The schema name the original database is attached as while writing back
+SOURCE_SCHEMA = "ece_source"
+
+## The most columns a key of DIFF_KEYS has
+KEY_COLUMNS = max(len(columns) for columns in DIFF_KEYS.values())
+
+def _key_values(table: Tables, prefix: str)-> str:
+    values = [f"{prefix}{column}" for column in DIFF_KEYS[table]]
+    return ", ".join(values + ["''"] * (KEY_COLUMNS - len(values)))
+
+def _changed(table: Tables)-> str:
+    """ The condition which selects table's changed rows (compared column by column, so that the primary keys' indexes are used). """
+    keys = DIFF_KEYS[table]
+    return f"({', '.join(keys)}) IN (SELECT {', '.join(f'key{i}' for i in range(len(keys)))} FROM temp.{CHANGES_TABLE} WHERE table_name = ?)"
+
+class MirrorConnection(sqlite3.Connection):
+    """ A connection to a mirror (see the module docstring); create it with open_mirror or connect_to_db(mirror=...).
+
+    Changes are written back to source by commit(), by leaving a `with conn:` block without an exception, or by calling
+        write_back(). Statements such as conn.execute("COMMIT") bypass this; call write_back() after them.
+    """
+    source: pathlib.Path
+    read_only: bool
+    ## The temporary file the mirror is stored in, if it is not in memory
+    temporary: pathlib.Path|None
+    tables: list[Tables]
+
+    def commit(self):
+        super().commit()
+        self.write_back()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        result = super().__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            self.write_back()
+        return result
+
+    def close(self):
+        super().close()
+        if self.temporary is not None:
+            self.temporary.unlink(missing_ok=True)
+            self.temporary = None
+
+    def pending(self)-> int:
+        """ Returns the number of changed keys (committed to the mirror) which have not been written back. """
+        return self.execute(f"SELECT count(*) FROM temp.{CHANGES_TABLE}").fetchone()[0]
+
+    def write_back(self)-> int:
+        """ Replaces the rows with changed keys in source with the mirror's rows, in a single transaction.
+
+        Returns:
+            int: The number of keys written back.
+
+        Raises:
+            RuntimeError: If the mirror has an uncommitted transaction, or is read-only and has changes.
+            sqlite3.OperationalError: If source stays locked (e.g. by Edge); the changes are kept to be written back later.
+        """
+        if self.in_transaction:
+            raise RuntimeError("The mirror has a transaction in progress; commit or roll it back first.")
+        changes = self.pending()
+        if not changes:
+            return 0
+        if self.read_only:
+            raise RuntimeError("The mirror is read-only; its changes cannot be written back.")
+        self.execute(f"ATTACH DATABASE ? AS {SOURCE_SCHEMA}", (str(self.source),))
+        try:
+            self.execute("BEGIN IMMEDIATE")
+            try:
+                for table in self.tables:
+                    columns = ", ".join(row[1] for row in self.execute(f"PRAGMA main.table_info({table.value})"))
+                    changed = _changed(table)
+                    self.execute(f"DELETE FROM {SOURCE_SCHEMA}.{table.value} WHERE {changed}", (table.value,))
+                    self.execute(f"INSERT INTO {SOURCE_SCHEMA}.{table.value} ({columns}) SELECT {columns} FROM main.{table.value} WHERE {changed}",
+                                 (table.value,))
+                self.execute(f"DELETE FROM temp.{CHANGES_TABLE}")
+                super().commit()
+            except BaseException:
+                super().rollback()
+                raise
+        finally:
+            self.execute(f"DETACH DATABASE {SOURCE_SCHEMA}")
+        return changes
+
+    def refresh(self, immutable: bool = False):
+        """ Copies source into the mirror again (e.g. to see Edge's changes) and rebuilds the indexes.
+
+        Raises:
+            RuntimeError: If the mirror has changes which have not been written back.
+        """
+        ## A failed write to a read-only mirror leaves the implicit BEGIN open, with nothing in it
+        if self.read_only and self.in_transaction:
+            self.rollback()
+        ## The changes table does not exist until open_mirror's first refresh is done
+        if self.in_transaction or (self.tables and self.pending()):
+            raise RuntimeError("The mirror has changes which have not been written back.")
+        source = sqlite3.connect(f"{self.source.resolve().as_uri()}?mode=ro{'&immutable=1' if immutable else ''}", uri=True)
+        try:
+            source.backup(self)
+        finally:
+            source.close()
+        existing = {row[0] for row in self.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'")}
+        self.tables = [table for table in DIFF_KEYS if table.value in existing]
+        with self._writable():
+            for name, (table, columns) in MIRROR_INDEXES.items():
+                if table in self.tables:
+                    self.execute(f"CREATE INDEX IF NOT EXISTS main.{name} ON {table.value} ({', '.join(columns)})")
+            self.execute("ANALYZE main")
+            self.commit_mirror()
+
+    def commit_mirror(self):
+        """ Commits the mirror's transaction without writing back. """
+        super().commit()
+
+    def _track(self):
+        """ Creates the changes table and the triggers which fill it. """
+        keys = ", ".join(f"key{i}" for i in range(KEY_COLUMNS))
+        with self._writable():
+            self.execute(f"CREATE TEMP TABLE IF NOT EXISTS {CHANGES_TABLE} (table_name TEXT NOT NULL, {keys}, UNIQUE (table_name, {keys}))")
+            for table in self.tables:
+                for event, rows in (("INSERT", ("NEW.",)), ("UPDATE", ("OLD.", "NEW.")), ("DELETE", ("OLD.",))):
+                    body = " ".join(f"INSERT OR IGNORE INTO {CHANGES_TABLE} VALUES ('{table.value}', {_key_values(table, prefix)});" for prefix in rows)
+                    self.execute(f"CREATE TEMP TRIGGER IF NOT EXISTS ece_mirror_{table.value}_{event.lower()} AFTER {event} ON main.{table.value} BEGIN {body} END")
+            self.commit_mirror()
+
+    @contextlib.contextmanager
+    def _writable(self):
+        """ Lifts PRAGMA query_only (set on read-only mirrors) while the mirror itself is rebuilt. """
+        query_only = self.execute("PRAGMA query_only").fetchone()[0]
+        self.execute("PRAGMA query_only = OFF")
+        try:
+            yield
+        finally:
+            self.execute(f"PRAGMA query_only = {query_only}")
+
+def open_mirror(source: pathlib.Path, location: MirrorLocation = "memory", read_only: bool = False, immutable: bool = False,
+                check_same_thread: bool = True)-> MirrorConnection:
+    """ Copies the database at source into a mirror and returns a connection to it.
+
+    Args:
+        source (pathlib.Path): The Edge Collections database.
+        location (MirrorLocation, optional): "memory" to keep the mirror in memory, "file" for a temporary file (deleted on close). Defaults to "memory".
+        read_only (bool, optional): Set PRAGMA query_only on the mirror, so that every write fails at once (rather than when it
+            would be written back). Defaults to False.
+        immutable (bool, optional): Open source with immutable=1 while copying (only for snapshots, see connect_to_db). Defaults to False.
+        check_same_thread (bool, optional): Passed to sqlite3.connect. Defaults to True.
+    """
+    if location not in MIRROR_LOCATIONS:
+        raise ValueError(f"Invalid mirror location: {location}")
+    temporary = None
+    if location == "file":
+        handle, name = tempfile.mkstemp(prefix=f"{source.name}.mirror.", suffix=".db")
+        os.close(handle)
+        temporary = pathlib.Path(name)
+    conn = sqlite3.connect(":memory:" if temporary is None else temporary, factory=MirrorConnection, check_same_thread=check_same_thread)
+    conn.source = source.resolve()
+    conn.read_only = read_only
+    conn.temporary = temporary
+    conn.tables = []
+    try:
+        conn.refresh(immutable=immutable)
+        conn._track()
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+    except BaseException:
+        conn.close()
+        raise
+    return conn
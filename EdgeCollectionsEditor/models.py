@@ -0,0 +1,207 @@
+""" Compact objects for collections, items, relationships and comments.
+
+The classes are generated from the column enums, with one __slots__ entry per column, so an object costs a fraction of
+    the equivalent dict and its attributes are read without a dict lookup. Objects also support row-style access
+    (obj["title"]) so they can be used where sqlite3.Rows were.
+An IdentityMap makes each id resolve to a single object per connection, and a Library keeps the relationships between
+    collections and items as arrays of indices rather than as nested dicts.
+"""
+import array
+import sqlite3
+import typing
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import blobs, utils
+
+class Model:
+    """ Base class of the generated models. Columns which were not loaded are unset (reading them raises AttributeError). """
+    __slots__ = ()
+    TABLE: typing.ClassVar[Tables]
+    COLUMNS: typing.ClassVar[tuple[str, ...]]
+
+    def __init__(self, **values: typing.Any):
+        for key, value in values.items():
+            setattr(self, key, value)
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row|dict)-> "Model":
+        self = cls.__new__(cls)
+        self.update(row)
+        return self
+
+    def update(self, row: sqlite3.Row|dict):
+        """ Sets the attributes for the columns of row (other keys are ignored). """
+        columns = self.COLUMNS
+        for key in row.keys():
+            if key in columns:
+                setattr(self, key, row[key])
+
+    def keys(self)-> list[str]:
+        """ Returns the columns which have been loaded. """
+        return [column for column in self.COLUMNS if hasattr(self, column)]
+
+    def __getitem__(self, key: str)-> typing.Any:
+        if key not in self.COLUMNS:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def to_dict(self)-> dict[str, typing.Any]:
+        return {column: getattr(self, column) for column in self.keys()}
+
+    def __repr__(self)-> str:
+        values = " ".join(f"{column}={getattr(self, column)!r}" for column in ("id", "title") if column in self.COLUMNS and hasattr(self, column))
+        return f"<{type(self).__name__} {values}>"
+
+def model(name: str, table: Tables, doc: str)-> type[Model]:
+    """ Generates the Model subclass for a table, with a slot for each of its columns (see TABLE_COLUMNS). """
+    columns = tuple(column.value for column in TABLE_COLUMNS[table])
+    return type(name, (Model,), {"__slots__": columns, "__doc__": doc, "__module__": __name__, "TABLE": table, "COLUMNS": columns})
+
+Collection = model("Collection", Tables.COLLECTIONS, """ A row of the collections table. """)
+Item = model("Item", Tables.ITEMS, """ A row of the items table. """)
+Relationship = model("Relationship", Tables.COLLECTIONS_ITEMS_RELATIONSHIP, """ A row of the collections_items_relationship table. """)
+Comment = model("Comment", Tables.COMMENTS, """ A row of the comments table. """)
+
+## The models which have an id column, and so can be kept in an IdentityMap
+IDENTIFIED = (Collection, Item, Comment)
+
+class IdentityMap:
+    """ Resolves each id of a connection's database to a single model object.
+
+    Loading a row which is already mapped updates the existing object in place, so every holder of the object sees the
+        new values. Objects are kept until clear() is called; create one IdentityMap per connection.
+    """
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.objects: dict[type[Model], dict[str, Model]] = {cls: {} for cls in IDENTIFIED}
+
+    def __len__(self)-> int:
+        return sum(map(len, self.objects.values()))
+
+    def clear(self):
+        for objects in self.objects.values():
+            objects.clear()
+
+    def add(self, cls: type[Model], row: sqlite3.Row|dict)-> Model:
+        """ Returns the object for row's id, creating it or updating it with row's values. """
+        objects = self.objects[cls]
+        if (obj := objects.get(row["id"])) is not None:
+            obj.update(row)
+            return obj
+        obj = objects[row["id"]] = cls.from_row(row)
+        return obj
+
+    def get(self, cls: type[Model], id: str, lazy: bool = False)-> Model|None:
+        """ Returns the object with the given id, loading it if it is not mapped yet (None if it does not exist). """
+        if (obj := self.objects[cls].get(id)) is not None:
+            return obj
+        return next(self.load(cls, "WHERE id = ?", (id,), lazy=lazy), None)
+
+    def load(self, cls: type[Model], clause: str = "", parameters: typing.Sequence = (), columns: typing.Sequence[str]|None = None,
+             lazy: bool = False, batch_size: int = utils.DEFAULT_BATCH_SIZE)-> typing.Iterator[Model]:
+        """ Yields the objects for the rows of "SELECT ... FROM <table> <clause>", batch_size rows at a time.
+
+        Args:
+            cls (type[Model]): The model to load.
+            clause (str, optional): WHERE/ORDER BY/LIMIT clauses. Defaults to "" (every row).
+            parameters (typing.Sequence, optional): The parameters for clause. Defaults to ().
+            columns (typing.Sequence[str]|None, optional): The columns to load; must include id for identified models.
+                Defaults to None (every column).
+            lazy (bool, optional): Whether to load blob columns as blobs.LazyBlob handles (only when columns is None). Defaults to False.
+            batch_size (int, optional): The number of rows to fetch at a time. Defaults to utils.DEFAULT_BATCH_SIZE.
+        """
+        table = cls.TABLE
+        with utils.RowFactory(self.conn):
+            if columns is None:
+                cursor = blobs.execute(self.conn, table, f"FROM {table.value} {clause}", parameters, lazy=lazy)
+            else:
+                names = [utils.sanitize_table_and_column(table.value, column)[1] for column in columns]
+                cursor = self.conn.execute(f"SELECT {', '.join(names)} FROM {table.value} {clause}", parameters)
+        if cls not in self.objects:
+            return (cls.from_row(row) for row in utils.iter_rows(cursor, batch_size))
+        return (self.add(cls, row) for row in utils.iter_rows(cursor, batch_size))
+
+class Library:
+    """ The collections and items of a database, with the relationships between them stored as arrays of indices.
+
+    For each collection, the indices (into items) of its items are stored consecutively in one array, ordered by position,
+        and for each item the indices of its collections likewise; offsets arrays give where each one starts.
+    """
+    def __init__(self, identity: IdentityMap, collections: list[Model], items: list[Model], relationships: typing.Iterable[tuple[str, str, int]]):
+        self.identity = identity
+        self.collections = collections
+        self.items = items
+        self.collection_index = {collection.id: index for index, collection in enumerate(collections)}
+        self.item_index = {item.id: index for index, item in enumerate(items)}
+
+        ## Relationships to collections or items which are not in the library are skipped
+        members: list[list[int]] = [[] for _ in collections]
+        positions: list[list[int]] = [[] for _ in collections]
+        counts = array.array("l", bytes(array.array("l").itemsize * len(items)))
+        for item_id, parent_id, position in relationships:
+            collection, item = self.collection_index.get(parent_id), self.item_index.get(item_id)
+            if collection is None or item is None: continue
+            members[collection].append(item)
+            positions[collection].append(position)
+            counts[item] += 1
+
+        self.collection_offsets = array.array("l", [0])
+        self.collection_members = array.array("l")
+        self.member_positions = array.array("l")
+        for collection_members, collection_positions in zip(members, positions):
+            order = sorted(range(len(collection_members)), key=collection_positions.__getitem__)
+            self.collection_members.extend(collection_members[i] for i in order)
+            self.member_positions.extend(collection_positions[i] for i in order)
+            self.collection_offsets.append(len(self.collection_members))
+
+        self.item_offsets = array.array("l", [0])
+        for count in counts:
+            self.item_offsets.append(self.item_offsets[-1] + count)
+        self.item_parents = array.array("l", bytes(array.array("l").itemsize * len(self.collection_members)))
+        filled = array.array("l", self.item_offsets[:-1])
+        for collection in range(len(collections)):
+            for item in self.collection_members[self.collection_offsets[collection]:self.collection_offsets[collection+1]]:
+                self.item_parents[filled[item]] = collection
+                filled[item] += 1
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection, collection_columns: typing.Sequence[str]|None = None, item_columns: typing.Sequence[str]|None = None,
+             lazy: bool = True, identity: IdentityMap|None = None)-> "Library":
+        """ Loads every collection, item and relationship.
+
+        Args:
+            conn (sqlite3.Connection): The connection to the Edge Collections database.
+            collection_columns (typing.Sequence[str]|None, optional): The collection columns to load. Defaults to None (all).
+            item_columns (typing.Sequence[str]|None, optional): The item columns to load. Defaults to None (all).
+            lazy (bool, optional): Whether to load blob columns as blobs.LazyBlob handles. Defaults to True.
+            identity (IdentityMap|None, optional): The identity map to load through. Defaults to None (a new one).
+        """
+        identity = identity if identity is not None else IdentityMap(conn)
+        collections = list(identity.load(Collection, "ORDER BY position", columns=collection_columns, lazy=lazy))
+        items = list(identity.load(Item, columns=item_columns, lazy=lazy))
+        relationships = conn.execute("SELECT item_id, parent_id, position FROM collections_items_relationship")
+        return cls(identity, collections, items, utils.iter_rows(relationships))
+
+    def item_indices(self, collection: int)-> array.array:
+        """ Returns the indices of the items of the collection at index collection, ordered by position. """
+        return self.collection_members[self.collection_offsets[collection]:self.collection_offsets[collection+1]]
+
+    def collection_indices(self, item: int)-> array.array:
+        """ Returns the indices of the collections of the item at index item. """
+        return self.item_parents[self.item_offsets[item]:self.item_offsets[item+1]]
+
+    def items_of(self, collection: Model)-> list[Model]:
+        return [self.items[index] for index in self.item_indices(self.collection_index[collection.id])]
+
+    def collections_of(self, item: Model)-> list[Model]:
+        return [self.collections[index] for index in self.collection_indices(self.item_index[item.id])]
+
+    def relationships(self)-> typing.Iterator[Model]:
+        """ Yields a Relationship for each relationship in the library. """
+        for collection, parent in enumerate(self.collections):
+            start, end = self.collection_offsets[collection], self.collection_offsets[collection+1]
+            for item, position in zip(self.collection_members[start:end], self.member_positions[start:end]):
+                yield Relationship(item_id=self.items[item].id, parent_id=parent.id, position=position)
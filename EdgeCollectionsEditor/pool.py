@@ -0,0 +1,86 @@
+import concurrent.futures
+import pathlib
+import sqlite3
+import threading
+import typing
+
+import EdgeCollectionsEditor as ECE
+
+T = typing.TypeVar("T")
+R = typing.TypeVar("R")
+
+class ConnectionPool:
+    """ Gives each thread its own connection to the Edge Collections database.
+
+    sqlite3 connections should not be shared between threads, so read-heavy jobs (exports, searches, stats...)
+        can use a pool to run in parallel: each worker calls connection() and gets a connection of its own, opened on first use.
+    By default connections are read-only and query_only so that a job can neither write to nor lock out the browser.
+    submit and map run jobs on the pool's own worker threads (at most workers of them), so the number of connections stays bounded.
+    Connections stay open until close() is called (or the pool is used as a context manager).
+    """
+    def __init__(self, file_location: pathlib.Path|str|None = None, mode: typing.Literal["rw", "ro"] = "ro", workers: int|None = None, **options):
+        """ Creates the pool; options are passed on to connect_to_db. """
+        self.workers = workers
+        self._executor: concurrent.futures.ThreadPoolExecutor|None = None
+        self.options = dict(options, mode=mode)
+        self.options.setdefault("query_only", mode == "ro")
+        ## Connections are closed by whichever thread calls close()
+        self.options["check_same_thread"] = False
+        ## Resolve the file (and validate the options) up front
+        conn, self.file_location = ECE.connect_to_db(file_location, **self.options)
+        self._local = threading.local()
+        self._local.conn = conn
+        self._lock = threading.Lock()
+        self._connections: list[sqlite3.Connection] = [conn]
+        self.closed = False
+
+    def connection(self)-> sqlite3.Connection:
+        """ Returns the calling thread's connection, opening it if needed. """
+        if self.closed:
+            raise RuntimeError("The pool is closed.")
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn, _ = ECE.connect_to_db(self.file_location, **self.options)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def executor(self)-> concurrent.futures.ThreadPoolExecutor:
+        """ Returns the pool's worker threads, starting them if needed. """
+        with self._lock:
+            if self.closed:
+                raise RuntimeError("The pool is closed.")
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ConnectionPool")
+            return self._executor
+
+    def submit(self, func: typing.Callable[..., R], *args, **kwargs)-> concurrent.futures.Future[R]:
+        """ Calls func(connection, *args, **kwargs) on a worker thread, passing the worker's connection. """
+        return self.executor().submit(lambda: func(self.connection(), *args, **kwargs))
+
+    def map(self, func: typing.Callable[[sqlite3.Connection, T], R], values: typing.Iterable[T])-> list[R]:
+        """ Calls func(connection, value) for each value on the worker threads.
+
+        Returns:
+            list[R]: The results, in the same order as values.
+        """
+        return list(self.executor().map(lambda value: func(self.connection(), value), values))
+
+    def close(self):
+        """ Stops the worker threads and closes every connection opened by the pool. """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self.closed = True
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
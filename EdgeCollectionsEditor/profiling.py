@@ -0,0 +1,262 @@
+""" Opt-in profiling of the queries made through utils.row_factory and utils.RowFactory.
+
+    profiler = profiling.enable()
+    ... # use the library
+    print(profiler.report())
+    profiling.disable()
+
+While enabled, each call of a row_factory function (or RowFactory block) is timed and its rows are counted, and the SQL
+    of every connection opened by connect_to_db (or passed to attach) is captured with set_trace_callback. Each distinct
+    statement is run once through EXPLAIN QUERY PLAN, and statements which scan a whole table are flagged.
+    Rows of functions which return iterators are counted as they are consumed, and the time spent fetching them is added
+    to the call's latency once the iterator is exhausted or closed.
+"""
+import bisect
+import re
+import sqlite3
+import threading
+import time
+import typing
+
+## Upper bounds of the latency histogram's buckets, in seconds; the last bucket is unbounded
+LATENCY_BOUNDS = (0.0001, 0.001, 0.01, 0.1, 1.0, 10.0)
+## The name calls are recorded under when the SQL is executed outside any profiled call
+UNATTRIBUTED = "(unattributed)"
+
+_LITERALS = re.compile(r"[xX]?'(?:[^']|'')*'|\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_PARAMETER_LISTS = re.compile(r"\?(?:\s*,\s*\?)+")
+_FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?!.*\bUSING\b)")
+_EXPLAINED = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+def normalize_sql(sql: str)-> str:
+    """ Replaces the literals of an (expanded) statement with ?, so executions with different parameters are grouped together. """
+    sql = _LITERALS.sub("?", " ".join(sql.split()))
+    return _PARAMETER_LISTS.sub("?, ...", sql)
+
+def full_scans(plan: typing.Iterable[str])-> list[str]:
+    """ Returns the tables an EXPLAIN QUERY PLAN's details scan without an index. """
+    return [match.group(1) for detail in plan if (match := _FULL_SCAN.match(detail))]
+
+class Histogram:
+    """ Counts of values per bucket (see LATENCY_BOUNDS). """
+    def __init__(self, bounds: typing.Sequence[float] = LATENCY_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+
+    def add(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+
+    def to_dict(self)-> dict[str, int]:
+        labels = [f"<={bound:g}s" for bound in self.bounds] + [f">{self.bounds[-1]:g}s"]
+        return dict(zip(labels, self.counts))
+
+class CallStats:
+    """ The calls of one function (or RowFactory block). """
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        ## Only counted for functions which return a list or an iterator of rows
+        self.rows = 0
+        self.histogram = Histogram()
+
+    def record(self, elapsed: float, rows: int|None):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.histogram.add(elapsed)
+        if rows:
+            self.rows += rows
+
+    def to_dict(self)-> dict[str, typing.Any]:
+        return {"calls": self.calls, "total": self.total, "mean": self.total / self.calls if self.calls else 0.0, "max": self.max,
+                "rows": self.rows, "histogram": self.histogram.to_dict()}
+
+class StatementStats:
+    """ The executions of one normalized statement (see normalize_sql). """
+    def __init__(self, sql: str, example: str):
+        self.sql = sql
+        ## The first execution, with its parameters; this is what is explained
+        self.example = example
+        self.executions = 0
+        self.callers: dict[str, int] = {}
+        self.plan: list[str]|None = None
+
+    @property
+    def full_scans(self)-> list[str]:
+        return full_scans(self.plan or [])
+
+    def to_dict(self)-> dict[str, typing.Any]:
+        return {"sql": self.sql, "executions": self.executions, "callers": dict(self.callers), "plan": self.plan, "full_scans": self.full_scans}
+
+class Profiler:
+    """ Collects call and statement statistics. Use enable() rather than creating one directly, so that utils records into it. """
+    def __init__(self, explain: bool = True):
+        self.explain = explain
+        self.calls: dict[str, CallStats] = {}
+        self.statements: dict[str, StatementStats] = {}
+        ## Connections are not weak-referenceable, so they are held until detached (or disable is called)
+        self.connections: dict[int, sqlite3.Connection] = {}
+        ## id(connection) -> statements waiting to be explained
+        self._pending: dict[int, list[StatementStats]] = {}
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+    def attach(self, conn: sqlite3.Connection):
+        """ Captures the SQL executed on conn. Replaces any trace callback conn already has. """
+        with self._lock:
+            if id(conn) in self.connections:
+                return
+            self.connections[id(conn)] = conn
+        conn.set_trace_callback(lambda sql: self._trace(conn, sql))
+
+    def detach(self, conn: sqlite3.Connection):
+        with self._lock:
+            if self.connections.pop(id(conn), None) is None:
+                return
+            self._pending.pop(id(conn), None)
+        try:
+            conn.set_trace_callback(None)
+        except sqlite3.ProgrammingError:
+            ## Already closed
+            pass
+
+    def detach_all(self):
+        for conn in list(self.connections.values()):
+            self.detach(conn)
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.statements.clear()
+            self._pending.clear()
+
+    def _stack(self)-> list[str]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def enter(self, name: str, conn: sqlite3.Connection)-> tuple[str, sqlite3.Connection, float]:
+        """ Starts timing a call; pass the result to exit. """
+        self.attach(conn)
+        self._stack().append(name)
+        return name, conn, time.perf_counter()
+
+    def exit(self, token: tuple[str, sqlite3.Connection, float], result: typing.Any = None)-> typing.Any:
+        """ Records a call started with enter and returns its result. Iterators are wrapped so that their rows are counted. """
+        name, conn, start = token
+        elapsed = time.perf_counter() - start
+        stack = self._stack()
+        if stack:
+            stack.pop()
+        self.explain_pending(conn)
+        if isinstance(result, typing.Iterator):
+            return self._count(name, result, elapsed)
+        self._record(name, elapsed, len(result) if isinstance(result, list) else 1 if isinstance(result, sqlite3.Row) else None)
+        return result
+
+    def _record(self, name: str, elapsed: float, rows: int|None):
+        with self._lock:
+            if (stats := self.calls.get(name)) is None:
+                stats = self.calls[name] = CallStats(name)
+            stats.record(elapsed, rows)
+
+    def _count(self, name: str, iterator: typing.Iterator, elapsed: float)-> typing.Iterator:
+        rows = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    row = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                rows += 1
+                yield row
+        finally:
+            if (close := getattr(iterator, "close", None)) is not None:
+                close()
+            self._record(name, elapsed, rows)
+
+    def _trace(self, conn: sqlite3.Connection, sql: str):
+        ## Statements run by triggers are reported with a leading comment
+        if sql.startswith("--") or sql.startswith("EXPLAIN QUERY PLAN"):
+            return
+        stack = self._stack()
+        caller = stack[-1] if stack else UNATTRIBUTED
+        key = normalize_sql(sql)
+        with self._lock:
+            if (stats := self.statements.get(key)) is None:
+                stats = self.statements[key] = StatementStats(key, sql)
+                if self.explain and sql.lstrip().upper().startswith(_EXPLAINED):
+                    self._pending.setdefault(id(conn), []).append(stats)
+            stats.executions += 1
+            stats.callers[caller] = stats.callers.get(caller, 0) + 1
+
+    def explain_pending(self, conn: sqlite3.Connection|None = None):
+        """ Runs EXPLAIN QUERY PLAN for the new statements of conn (or of every attached connection).
+            This is done outside the trace callback, which must not use its connection.
+        """
+        for connection in ([conn] if conn is not None else list(self.connections.values())):
+            with self._lock:
+                pending = self._pending.pop(id(connection), [])
+            for stats in pending:
+                try:
+                    stats.plan = [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {stats.example}").fetchall()]
+                except sqlite3.Error:
+                    ## e.g. the connection was closed, or the statement used a temporary table which no longer exists
+                    stats.plan = None
+
+    def stats(self)-> dict[str, typing.Any]:
+        """ Returns the statistics as JSON-serializable dicts: calls by name and statements by execution count. """
+        self.explain_pending()
+        with self._lock:
+            return {
+                "calls": {name: stats.to_dict() for name, stats in sorted(self.calls.items(), key=lambda item: -item[1].total)},
+                "statements": [stats.to_dict() for stats in sorted(self.statements.values(), key=lambda stats: -stats.executions)],
+            }
+
+    def report(self, top: int = 20)-> str:
+        """ Returns a text summary of the slowest calls and the most executed statements, with their full scans. """
+        stats = self.stats()
+        lines = [f"{'calls':>7} {'total':>9} {'mean':>9} {'max':>9} {'rows':>9}  function"]
+        for name, call in list(stats["calls"].items())[:top]:
+            lines.append(f"{call['calls']:>7} {call['total']:>8.3f}s {call['mean']:>8.4f}s {call['max']:>8.4f}s {call['rows']:>9}  {name}")
+        lines.append("")
+        lines.append(f"{'runs':>7}  statement")
+        for statement in stats["statements"][:top]:
+            sql = statement["sql"] if len(statement["sql"]) <= 120 else statement["sql"][:117] + "..."
+            lines.append(f"{statement['executions']:>7}  {sql}")
+            if statement["full_scans"]:
+                lines.append(f"{'':>7}  FULL SCAN: {', '.join(statement['full_scans'])}")
+        return "\n".join(lines)
+
+## The active profiler, if profiling is enabled
+profiler: Profiler|None = None
+
+def enable(explain: bool = True)-> Profiler:
+    """ Starts profiling (see the module docstring) and returns the profiler. Calling it again returns the active profiler. """
+    global profiler
+    if profiler is None:
+        profiler = Profiler(explain)
+    return profiler
+
+def disable()-> Profiler|None:
+    """ Stops profiling, detaching the profiler from its connections, and returns it (so its stats can still be read). """
+    global profiler
+    active, profiler = profiler, None
+    if active is not None:
+        active.explain_pending()
+        active.detach_all()
+    return active
+
+def attach(conn: sqlite3.Connection):
+    """ Captures conn's SQL if profiling is enabled. """
+    if profiler is not None:
+        profiler.attach(conn)
+
+def stats()-> dict[str, typing.Any]|None:
+    """ Returns the active profiler's statistics (see Profiler.stats), or None if profiling is not enabled. """
+    return None if profiler is None else profiler.stats()
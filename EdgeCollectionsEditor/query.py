@@ -0,0 +1,162 @@
+""" Builds SELECT and COUNT(*) statements for a single table from validated parts, as used by the command line.
+
+Column names are checked with utils.sanitize_table_and_column and values are always passed as parameters, so queries
+    can be built from user input. Filtering, ordering, projection and LIMIT/OFFSET all happen in SQL: only the rows
+    asked for leave SQLite, and totals come from COUNT(*).
+
+    q = query.Query(Tables.ITEMS, filters=[query.parse_filter("title~python")], order_by=[query.parse_order("date_modified:desc")], limit=10)
+    total = query.count(conn, q)
+    rows = list(query.select(conn, q))
+"""
+import datetime
+import re
+import sqlite3
+import typing
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import blobs, tags, utils
+from EdgeCollectionsEditor.utils import OPERATORS, row_factory
+
+## The columns date ranges can be applied to
+DATE_COLUMNS = ("date_created", "date_modified")
+DIRECTIONS = ("asc", "desc")
+
+_FILTER_RE = re.compile(rf"^\s*(\w+)\s*({utils.OPERATOR_PATTERN})(.*)$", re.DOTALL)
+
+class Filter(typing.NamedTuple):
+    column: str
+    ## A key of OPERATORS
+    operator: str
+    value: typing.Any
+
+class Order(typing.NamedTuple):
+    column: str
+    descending: bool = False
+
+class Query(typing.NamedTuple):
+    table: Tables
+    ## None selects every column
+    columns: typing.Sequence[str]|None = None
+    filters: typing.Sequence[Filter] = ()
+    order_by: typing.Sequence[Order] = ()
+    limit: int|None = None
+    offset: int = 0
+    ## Filters on the tag column (collections and items only), see tags.parse_tag_filter
+    tag_filters: typing.Sequence[tags.TagFilter] = ()
+
+def parse_filter(text: str)-> Filter:
+    """ Parses "<column><operator><value>", e.g. "title~python" or "date_modified>=1700000000000" (see OPERATORS).
+
+    Raises:
+        ValueError: If text is not a filter.
+    """
+    if (match := _FILTER_RE.match(text)) is None:
+        raise ValueError(f"Invalid filter (expected <column><{'|'.join(OPERATORS)}><value>): {text}")
+    column, operator, value = match.groups()
+    return Filter(column, operator, value)
+
+def parse_order(text: str)-> Order:
+    """ Parses "<column>" or "<column>:asc|desc".
+
+    Raises:
+        ValueError: If the direction is invalid.
+    """
+    column, _, direction = text.partition(":")
+    direction = direction.lower() or "asc"
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Invalid direction (expected {' or '.join(DIRECTIONS)}): {text}")
+    return Order(column, direction == "desc")
+
+def parse_date(text: str)-> float:
+    """ Converts an ISO 8601 date or datetime (local time unless it has an offset), or a number of milliseconds since
+        the Unix epoch, to the format of the date_created/date_modified columns (see utils.edge_timestamp).
+
+    Raises:
+        ValueError: If text is neither.
+    """
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    return datetime.datetime.fromisoformat(text).timestamp() * 1000
+
+def date_range(column: str, text: str)-> list[Filter]:
+    """ Parses "<start>..<end>" (either may be empty; see parse_date) into filters on column. The start is inclusive and
+        the end exclusive; a single date without ".." selects that day.
+
+    Raises:
+        ValueError: If column is not one of DATE_COLUMNS or the dates are invalid.
+    """
+    if column not in DATE_COLUMNS:
+        raise ValueError(f"Invalid date column (expected {' or '.join(DATE_COLUMNS)}): {column}")
+    if ".." not in text:
+        start = datetime.date.fromisoformat(text)
+        return [Filter(column, ">=", parse_date(start.isoformat())), Filter(column, "<", parse_date((start + datetime.timedelta(days=1)).isoformat()))]
+    start, _, end = text.partition("..")
+    filters = []
+    if start:
+        filters.append(Filter(column, ">=", parse_date(start)))
+    if end:
+        filters.append(Filter(column, "<", parse_date(end)))
+    return filters
+
+def _column(table: Tables, column: str)-> str:
+    try:
+        return utils.sanitize_table_and_column(table.name, column)[1]
+    except KeyError:
+        raise ValueError(f"Invalid column for {table.value}: {column}")
+
+def where_clause(query: Query)-> tuple[str, list[typing.Any]]:
+    """ Returns "FROM <table> WHERE ..." (without ORDER BY or LIMIT) and its parameters.
+
+    Raises:
+        ValueError: If a column or operator is invalid.
+    """
+    conditions, parameters = [], []
+    for filter in query.filters:
+        if filter.operator not in OPERATORS:
+            raise ValueError(f"Invalid operator: {filter.operator}")
+        column = _column(query.table, filter.column)
+        conditions.append(f"{column} {OPERATORS[filter.operator]} ?")
+        parameters.append(f"%{filter.value}%" if filter.operator in ("~", "!~") else filter.value)
+    if query.tag_filters and query.table not in tags.TAG_TABLES:
+        raise ValueError(f"{query.table.value} has no tag column")
+    for filter in query.tag_filters:
+        condition, values = tags.tag_condition(filter)
+        conditions.append(condition)
+        parameters += values
+    clause = f"FROM {query.table.value}"
+    if conditions:
+        clause += " WHERE " + " AND ".join(conditions)
+    return clause, parameters
+
+def select_clause(query: Query)-> tuple[str, list[typing.Any]]:
+    """ Returns where_clause followed by ORDER BY and LIMIT/OFFSET, and its parameters.
+
+    Raises:
+        ValueError: If a column is invalid, or limit or offset is negative.
+    """
+    clause, parameters = where_clause(query)
+    if query.order_by:
+        clause += " ORDER BY " + ", ".join(f"{_column(query.table, order.column)}{' DESC' if order.descending else ''}" for order in query.order_by)
+    if (query.limit is not None and query.limit < 0) or query.offset < 0:
+        raise ValueError("limit and offset cannot be negative.")
+    if query.limit is not None or query.offset:
+        clause += " LIMIT ? OFFSET ?"
+        parameters += [-1 if query.limit is None else query.limit, query.offset]
+    return clause, parameters
+
+@row_factory
+def select(conn: sqlite3.Connection, query: Query, lazy: bool = False, batch_size: int = utils.DEFAULT_BATCH_SIZE)-> typing.Iterator[sqlite3.Row]:
+    """ Yields the rows selected by query, fetching batch_size rows at a time.
+        If lazy is True, blob columns are returned as blobs.LazyBlob handles.
+    """
+    columns = None if query.columns is None else [_column(query.table, column) for column in query.columns]
+    clause, parameters = select_clause(query)
+    return utils.iter_rows(blobs.execute(conn, query.table, clause, parameters, lazy=lazy, columns=columns), batch_size)
+
+@row_factory
+def count(conn: sqlite3.Connection, query: Query)-> int:
+    """ Returns the number of rows matching query's filters (ignoring its limit and offset). """
+    clause, parameters = where_clause(query)
+    return conn.execute(f"SELECT COUNT(*) {clause}", parameters).fetchone()[0]
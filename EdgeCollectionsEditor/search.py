@@ -0,0 +1,216 @@
+""" An optional FTS5 full-text index of items and collections.
+
+The index lives in a sidecar database next to the Edge Collections database (so Edge's own file is never written to)
+    and is refreshed incrementally using the date_modified column of items and collections (see refresh_index).
+"""
+import html
+import pathlib
+import re
+import sqlite3
+import typing
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import utils
+
+## Name the Edge Collections database is attached as on the index connection
+EDGE_SCHEMA = "edge"
+
+## Columns of the fts table; collections only fill in the title
+SEARCH_COLUMNS = ("title", "text_content", "html_content", "remote_url")
+## bm25 weights for SEARCH_COLUMNS
+WEIGHTS = (10.0, 1.0, 1.0, 2.0)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS documents (
+    rowid INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    date_modified REAL NOT NULL,
+    UNIQUE (kind, id)
+    );
+CREATE TABLE IF NOT EXISTS high_water (
+    kind TEXT PRIMARY KEY,
+    date_modified REAL NOT NULL
+    );
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5({", ".join(SEARCH_COLUMNS)}, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3');
+"""
+
+## The queries used to fetch the searchable columns of each indexed table
+SOURCES: dict[Tables, str] = {
+    Tables.ITEMS: f"SELECT id, date_modified, title, text_content, html_content, remote_url FROM {EDGE_SCHEMA}.items",
+    Tables.COLLECTIONS: f"SELECT id, date_modified, title, NULL, NULL, NULL FROM {EDGE_SCHEMA}.collections",
+}
+
+_SCRIPT_RE = re.compile(r"<(script|style)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]*>")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def strip_tags(content: str|None)-> str|None:
+    """ Removes html tags (and the contents of script and style elements) and unescapes entities. """
+    if not content:
+        return content
+    content = _TAG_RE.sub(" ", _SCRIPT_RE.sub(" ", content))
+    return _WHITESPACE_RE.sub(" ", html.unescape(content)).strip()
+
+def default_index_location(file_location: pathlib.Path)-> pathlib.Path:
+    """ Returns the default location of the search index for the given Edge Collections database. """
+    return file_location.with_name(f"{file_location.name}_search")
+
+def connect_index(file_location: pathlib.Path, index_location: pathlib.Path|None = None)-> sqlite3.Connection:
+    """ Opens (creating it if needed) the search index for the given Edge Collections database.
+        The Edge Collections database is attached read-only as EDGE_SCHEMA.
+
+    Args:
+        file_location (pathlib.Path): The location of the Edge Collections database.
+        index_location (pathlib.Path|None, optional): The location of the index. Defaults to default_index_location(file_location).
+
+    Returns:
+        sqlite3.Connection: The connection to the index.
+    """
+    if index_location is None:
+        index_location = default_index_location(file_location)
+    index = sqlite3.connect(pathlib.Path(index_location).resolve().as_uri(), uri=True)
+    index.executescript(SCHEMA)
+    index.execute(f"ATTACH DATABASE ? AS {EDGE_SCHEMA}", (f"{pathlib.Path(file_location).resolve().as_uri()}?mode=ro",))
+    return index
+
+def refresh_index(index: sqlite3.Connection, batch_size: int = utils.DEFAULT_BATCH_SIZE, full: bool = False)-> dict[Tables, tuple[int, int]]:
+    """ Brings the index up to date with the Edge Collections database.
+        Rows whose date_modified is no more than utils.HIGH_WATER_MARGIN before the newest date_modified seen by the last
+        refresh are (re)indexed if it has changed; only those rows are looked up in the index (Edge's tables have no index on
+        date_modified, so the tables themselves are still read, but only as far as date_modified).
+        If the number of indexed rows then differs from the number of rows (or full is True), the ids are compared, using
+        the primary keys' indexes: rows which are not indexed (e.g. synced or restored with an older date_modified) are
+        indexed and rows that no longer exist are removed. As in watch.Watcher, a row deleted and another added with an
+        older date_modified between two refreshes are not noticed until the count changes or a full refresh.
+
+    Args:
+        index (sqlite3.Connection): A connection returned by connect_index.
+        batch_size (int, optional): The number of rows to index at a time. Defaults to utils.DEFAULT_BATCH_SIZE.
+        full (bool, optional): Whether to compare the ids even if the counts match. Defaults to False.
+
+    Returns:
+        dict[Tables, tuple[int, int]]: The number of rows (indexed, removed) for each table.
+    """
+    results = {}
+    now = utils.edge_timestamp()
+    with index:
+        for table, query in SOURCES.items():
+            kind = table.value
+            row = index.execute("SELECT date_modified FROM high_water WHERE kind = ?", (kind,)).fetchone()
+            ## Read before indexing so that rows modified during the refresh are picked up next time
+            latest = index.execute(f"SELECT max(date_modified) FROM {EDGE_SCHEMA}.{kind}").fetchone()[0]
+
+            ## Counted before indexing, which may add rows. On the first refresh every row is missing
+            reconcile = row is None or full or (index.execute(f"SELECT count(*) FROM {EDGE_SCHEMA}.{kind}").fetchone()[0] !=
+                                                 index.execute("SELECT count(*) FROM documents WHERE kind = ?", (kind,)).fetchone()[0])
+
+            indexed = 0
+            if row is not None:
+                since = min(row[0], now) - utils.HIGH_WATER_MARGIN
+                indexed += _index_query(index, kind, f"""SELECT source.* FROM ({query}) AS source
+                                                     LEFT JOIN documents ON documents.kind = ? AND documents.id = source.id
+                                                     WHERE source.date_modified >= ? AND documents.date_modified IS NOT source.date_modified""",
+                                        (kind, since), batch_size)
+            removed = []
+            if reconcile:
+                missing = [id_ for id_, in index.execute(f"""SELECT id FROM {EDGE_SCHEMA}.{kind} AS source
+                                                           WHERE NOT EXISTS (SELECT 1 FROM documents WHERE kind = ? AND id = source.id)""", (kind,))]
+                for chunk in utils.chunked(missing, utils.max_variables(index)):
+                    indexed += _index_query(index, kind, f"SELECT * FROM ({query}) WHERE id IN ({', '.join('?'*len(chunk))})", chunk, batch_size)
+                removed = index.execute(f"""SELECT rowid FROM documents WHERE kind = ?
+                                        AND NOT EXISTS (SELECT 1 FROM {EDGE_SCHEMA}.{kind} AS source WHERE source.id = documents.id)""", (kind,)).fetchall()
+                index.executemany("DELETE FROM search WHERE rowid = ?", removed)
+                index.executemany("DELETE FROM documents WHERE rowid = ?", removed)
+
+            if latest is not None:
+                index.execute("INSERT OR REPLACE INTO high_water (kind, date_modified) VALUES (?, ?)", (kind, latest))
+            results[table] = (indexed, len(removed))
+    return results
+
+def _index_query(index: sqlite3.Connection, kind: str, sql: str, parameters: typing.Sequence, batch_size: int)-> int:
+    """ Indexes the rows selected by sql, batch_size at a time. Returns the number of rows indexed. """
+    indexed = 0
+    batch = []
+    for row in utils.iter_rows(index.execute(sql, parameters), batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            indexed += _index_rows(index, kind, batch)
+            batch = []
+    return indexed + _index_rows(index, kind, batch)
+
+def _index_rows(index: sqlite3.Connection, kind: str, rows: list[tuple])-> int:
+    """ (Re)indexes a batch of (id, date_modified, *SEARCH_COLUMNS) rows. Returns the number of rows indexed. """
+    if not rows:
+        return 0
+    index.executemany("""INSERT INTO documents (kind, id, date_modified) VALUES (?, ?, ?)
+                      ON CONFLICT (kind, id) DO UPDATE SET date_modified = excluded.date_modified""",
+                      ((kind, id, date_modified) for id, date_modified, *_ in rows))
+    rowids: dict[str, int] = {}
+    for chunk in utils.chunked([row[0] for row in rows], utils.max_variables(index) - 1):
+        rowids.update(index.execute(f"SELECT id, rowid FROM documents WHERE kind = ? AND id IN ({', '.join('?'*len(chunk))})", [kind, *chunk]))
+    index.executemany("DELETE FROM search WHERE rowid = ?", ((rowids[row[0]],) for row in rows))
+    index.executemany(f"INSERT INTO search (rowid, {', '.join(SEARCH_COLUMNS)}) VALUES (?, ?, ?, ?, ?)",
+                      ((rowids[id], title, text_content, strip_tags(html_content), remote_url)
+                       for id, _, title, text_content, html_content, remote_url in rows))
+    return len(rows)
+
+def build_query(text: str, prefix: bool = False, phrase: bool = False)-> str:
+    """ Converts plain text into an FTS5 query. Each word is quoted, so FTS5 operators in the text are matched literally.
+
+    Args:
+        text (str): The text to search for.
+        prefix (bool, optional): Whether words (or the end of the phrase) may match as prefixes. Defaults to False.
+        phrase (bool, optional): Whether the words must appear together, in order. Defaults to False.
+
+    Returns:
+        str: The FTS5 query.
+    """
+    words = text.split()
+    if not words:
+        raise ValueError("The search text is empty.")
+    quote = lambda word: '"' + word.replace('"', '""') + '"'
+    if phrase:
+        return quote(" ".join(words)) + (" *" if prefix else "")
+    return " ".join(quote(word) + ("*" if prefix else "") for word in words)
+
+def search(index: sqlite3.Connection, text: str, prefix: bool = False, phrase: bool = False, kind: Tables|None = None, limit: int|None = 50, raw: bool = False)-> list[sqlite3.Row]:
+    """ Searches the index, returning the best matches first.
+
+    Args:
+        index (sqlite3.Connection): A connection returned by connect_index.
+        text (str): The text to search for.
+        prefix (bool, optional): Whether words may match as prefixes. Defaults to False.
+        phrase (bool, optional): Whether the words must appear together, in order. Defaults to False.
+        kind (Tables|None, optional): Only return matches from this table (Tables.ITEMS or Tables.COLLECTIONS). Defaults to None (both).
+        limit (int|None, optional): The maximum number of results. Defaults to 50.
+        raw (bool, optional): If True, text is passed to FTS5 as-is (so its query syntax can be used) and prefix and phrase are ignored. Defaults to False.
+
+    Returns:
+        list[sqlite3.Row]: Rows with the keys kind, id, title, snippet and rank (lower is better).
+
+    Raises:
+        ValueError: If raw is True and text is not a valid FTS5 query.
+    """
+    query = text if raw else build_query(text, prefix, phrase)
+    sql = f"""SELECT documents.kind, documents.id, search.title,
+                  snippet(search, -1, '[', ']', '...', 12) AS snippet,
+                  bm25(search, {", ".join(map(str, WEIGHTS))}) AS rank
+              FROM search JOIN documents ON documents.rowid = search.rowid
+              WHERE search MATCH ?"""
+    parameters: list[typing.Any] = [query]
+    if kind is not None:
+        sql += " AND documents.kind = ?"
+        parameters.append(kind.value)
+    sql += " ORDER BY rank"
+    if limit is not None:
+        sql += " LIMIT ?"
+        parameters.append(limit)
+    with utils.RowFactory(index):
+        try:
+            return index.execute(sql, parameters).fetchall()
+        except sqlite3.OperationalError as e:
+            ## FTS5 reports invalid queries as SQLITE_ERROR (and a locked index as SQLITE_BUSY)
+            if not raw or e.sqlite_errorcode != sqlite3.SQLITE_ERROR:
+                raise
+            raise ValueError(f"Invalid FTS5 query {text!r}: {e}") from e
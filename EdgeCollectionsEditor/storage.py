@@ -0,0 +1,286 @@
+""" Reports on (and reclaims) the space used by the Edge Collections database.
+
+find_duplicate_blobs streams image blobs through sha256 with sqlite3.Connection.blobopen, so whole tables (or even whole
+    blobs) are never loaded into memory. Only blobs whose length is shared with another blob are hashed.
+compact_copy writes a vacuumed copy of the database with repeated (or all) image blobs stripped. Edge's schema has no way
+    for rows to share a blob, so stripping a repeat deletes that row's image in the copy.
+profile_size breaks the size of the database down by table, column and collection; compact writes a vacuumed copy with
+    chosen columns cleared.
+"""
+import hashlib
+import pathlib
+import sqlite3
+import typing
+
+import EdgeCollectionsEditor as ECE
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import utils
+
+## Columns holding images which the browser can fetch again, with the column identifying each row
+IMAGE_COLUMNS: dict[tuple[Tables, str], str] = {
+    (Tables.FAVICONS, Favicons.DATA.value): Favicons.URL.value,
+    (Tables.COLLECTIONS, Collections.THUMBNAIL.value): Collections.ID.value,
+    (Tables.ITEMS, Items.CANONICAL_IMAGE_DATA.value): Items.ID.value,
+}
+
+## Size of the chunks blobs are hashed in
+HASH_CHUNK_SIZE = 1 << 16
+
+## NOT NULL columns which compact clears by deleting their rows (the row only caches the column)
+DELETE_TO_CLEAR: set[tuple[Tables, str]] = {
+    (Tables.ITEMS_OFFLINE_DATA, Items_Offline_Data.OFFLINE_FILE_DATA.value),
+}
+
+StripMode = typing.Literal["repeated", "all"]
+STRIP_MODES = ("repeated", "all")
+
+class DuplicateBlobs(typing.NamedTuple):
+    """ Rows of a column storing the same bytes. """
+    sha256: str
+    size: int
+    ## The key (see IMAGE_COLUMNS) of each row, first stored first
+    keys: list[str]
+    rowids: list[int]
+
+class BlobReport(typing.NamedTuple):
+    """ Blob usage of one column. """
+    table: Tables
+    column: str
+    blobs: int
+    total_bytes: int
+    ## Bytes used by copies beyond the first of each duplicate
+    wasted_bytes: int
+    duplicates: list[DuplicateBlobs]
+
+def hash_blob(conn: sqlite3.Connection, table: str, column: str, rowid: int, chunk_size: int = HASH_CHUNK_SIZE)-> str:
+    """ Returns the sha256 of a blob, reading it chunk_size bytes at a time. """
+    digest = hashlib.sha256()
+    with conn.blobopen(table, column, rowid, readonly=True) as blob:
+        while (chunk := blob.read(chunk_size)):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def column_report(conn: sqlite3.Connection, table: Tables, column: str, key: str, batch_size: int = utils.DEFAULT_BATCH_SIZE)-> BlobReport:
+    """ Groups the byte-identical blobs of a column. """
+    tablename, columnname = utils.sanitize_table_and_column(table.value, column)
+    _, keyname = utils.sanitize_table_and_column(table.value, key)
+    ## Blobs of different lengths cannot be identical, so only lengths shared by more than one blob are hashed
+    sizes = {size: count for size, count in conn.execute(f"""SELECT length({columnname}), count(*) FROM {tablename}
+                                                          WHERE typeof({columnname}) = 'blob' GROUP BY 1""")}
+    blobs, total_bytes = sum(sizes.values()), sum(size * count for size, count in sizes.items())
+    groups: dict[str, DuplicateBlobs] = {}
+    cursor = conn.execute(f"""SELECT rowid, {keyname}, length({columnname}) FROM {tablename}
+                          WHERE typeof({columnname}) = 'blob' ORDER BY rowid""")
+    for rowid, rowkey, size in utils.iter_rows(cursor, batch_size):
+        if sizes[size] < 2: continue
+        digest = hash_blob(conn, tablename, columnname, rowid)
+        group = groups.setdefault(digest, DuplicateBlobs(digest, size, [], []))
+        group.keys.append(rowkey)
+        group.rowids.append(rowid)
+    duplicates = sorted((group for group in groups.values() if len(group.rowids) > 1), key=lambda group: -group.size * (len(group.rowids) - 1))
+    wasted_bytes = sum(group.size * (len(group.rowids) - 1) for group in duplicates)
+    return BlobReport(table, column, blobs, total_bytes, wasted_bytes, duplicates)
+
+def find_duplicate_blobs(conn: sqlite3.Connection, columns: typing.Iterable[tuple[Tables, str]]|None = None,
+                         batch_size: int = utils.DEFAULT_BATCH_SIZE)-> list[BlobReport]:
+    """ Reports the duplicate blobs of each of columns.
+
+    Args:
+        conn (sqlite3.Connection): The connection to the Edge Collections database.
+        columns (typing.Iterable[tuple[Tables, str]]|None, optional): (table, column) pairs from IMAGE_COLUMNS. Defaults to None (all of IMAGE_COLUMNS).
+        batch_size (int, optional): The number of rows read at a time. Defaults to utils.DEFAULT_BATCH_SIZE.
+    """
+    columns = list(IMAGE_COLUMNS if columns is None else columns)
+    return [column_report(conn, table, column, IMAGE_COLUMNS[(table, column)], batch_size) for table, column in columns]
+
+def vacuum_into(conn: sqlite3.Connection, destination: pathlib.Path):
+    """ Writes a vacuumed copy of the database to destination, which must not exist. """
+    if destination.exists():
+        raise FileExistsError(destination)
+    conn.execute("VACUUM INTO ?", (str(destination),))
+
+def compact_copy(conn: sqlite3.Connection, destination: pathlib.Path, mode: StripMode, reports: list[BlobReport]|None = None)-> tuple[int, int]:
+    """ Writes a compacted copy of the database to destination. The original is not changed.
+
+    The copy is made with VACUUM INTO, the blobs are stripped (set to NULL) in the copy, and the copy is vacuumed again
+        to release the freed pages. Every row whose blob is stripped loses its favicon, thumbnail or image in the copy:
+        nothing else holds a copy of it for that row, and whether Edge fetches it again is up to Edge.
+
+    Args:
+        conn (sqlite3.Connection): The connection to the Edge Collections database.
+        destination (pathlib.Path): Where to write the copy; it must not exist.
+        mode (StripMode): "repeated" strips the blob of every row whose blob is byte-identical to that of an earlier row
+            (only the first row of each group keeps it), "all" strips every blob of the columns.
+        reports (list[BlobReport]|None, optional): The columns (and, for "repeated", the duplicates) to strip.
+            Defaults to None (find_duplicate_blobs of all of IMAGE_COLUMNS).
+
+    Returns:
+        tuple[int, int]: The size of the original database and of the copy, in bytes.
+    """
+    if mode not in STRIP_MODES:
+        raise ValueError(f"mode must be one of {STRIP_MODES}")
+    if reports is None:
+        reports = find_duplicate_blobs(conn) if mode == "repeated" else [BlobReport(table, column, 0, 0, 0, []) for table, column in IMAGE_COLUMNS]
+    def strip(copy: sqlite3.Connection):
+        for report in reports:
+            tablename, columnname = utils.sanitize_table_and_column(report.table.value, report.column)
+            if mode == "all":
+                copy.execute(f"UPDATE {tablename} SET {columnname} = NULL")
+                continue
+            ## Rows are found by key because VACUUM may renumber the rowids
+            _, keyname = utils.sanitize_table_and_column(report.table.value, IMAGE_COLUMNS[(report.table, report.column)])
+            keys = [key for group in report.duplicates for key in group.keys[1:]]
+            for chunk in utils.chunked(keys, utils.max_variables(copy)):
+                copy.execute(f"UPDATE {tablename} SET {columnname} = NULL WHERE {keyname} IN ({', '.join('?'*len(chunk))})", chunk)
+    _edit_copy(conn, destination, strip)
+    return database_size(conn), destination.stat().st_size
+
+def _edit_copy(conn: sqlite3.Connection, destination: pathlib.Path, edit: typing.Callable[[sqlite3.Connection], object]):
+    """ Copies the database to destination with VACUUM INTO, applies edit to the copy in a transaction and vacuums the copy. """
+    vacuum_into(conn, destination)
+    copy, _ = ECE.connect_to_db(destination)
+    try:
+        with copy:
+            edit(copy)
+        copy.execute("VACUUM")
+    finally:
+        copy.close()
+
+def database_size(conn: sqlite3.Connection)-> int:
+    """ Returns the size of the main database in bytes (page_count * page_size). """
+    return conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+
+class SizeProfile(typing.NamedTuple):
+    """ Where the bytes of a database go. """
+    page_size: int
+    page_count: int
+    free_pages: int
+    ## "dbstat" if table_bytes are the sizes of the tables' pages (including their indexes),
+    ##  "length" if they are the sums of the lengths of their values (when SQLite lacks the dbstat virtual table)
+    source: str
+    table_bytes: dict[Tables, int]
+    ## Bytes of table_bytes which are allocated but unused (only with dbstat)
+    unused_bytes: dict[Tables, int]
+    ## Pages which do not directly follow the previous page of their table or index (only with dbstat)
+    fragmented_pages: int
+    ## The sum of the lengths (in bytes) of each column's values
+    column_bytes: dict[tuple[Tables, str], int]
+    ## (collection id, title, items, bytes) for each collection, largest first; bytes counts the item rows and their
+    ##  offline data, and items in several collections count towards each of them
+    collections: list[tuple[str, str, int, int]]
+
+    @property
+    def file_bytes(self)-> int:
+        return self.page_size * self.page_count
+
+    @property
+    def free_bytes(self)-> int:
+        return self.page_size * self.free_pages
+
+def has_dbstat(conn: sqlite3.Connection)-> bool:
+    """ Returns whether SQLite was compiled with the dbstat virtual table. """
+    try:
+        conn.execute("SELECT 1 FROM dbstat LIMIT 0")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+def _byte_length(column: str)-> str:
+    ## length() counts characters for TEXT; the cast counts bytes (and is free for UTF-8 databases).
+    ##  Numbers are counted as 8 bytes (SQLite stores integers in 0 to 8)
+    return f"CASE typeof({column}) WHEN 'null' THEN 0 WHEN 'integer' THEN 8 WHEN 'real' THEN 8 ELSE length(CAST({column} AS BLOB)) END"
+
+def column_sizes(conn: sqlite3.Connection, table: Tables)-> dict[str, int]:
+    """ Returns the sum of the lengths (in bytes) of each column of the table, in a single scan of the table. """
+    columns = [column.value for column in TABLE_COLUMNS[table]]
+    tablename, _ = utils.sanitize_table_and_column(table.value, columns[0])
+    row = conn.execute(f"SELECT {', '.join(f'sum({_byte_length(column)})' for column in columns)} FROM {tablename}").fetchone()
+    return {column: value or 0 for column, value in zip(columns, row)}
+
+def _dbstat_sizes(conn: sqlite3.Connection)-> tuple[dict[Tables, int], dict[Tables, int], int]:
+    """ Returns the bytes and unused bytes of each table (including its indexes) and the number of fragmented pages. """
+    known = {table.value for table in Tables}
+    tables = {name: Tables(table) for name, table in conn.execute("SELECT name, tbl_name FROM sqlite_schema WHERE type IN ('table', 'index')")
+              if table in known}
+    table_bytes = dict.fromkeys(Tables, 0)
+    unused_bytes = dict.fromkeys(Tables, 0)
+    for name, size, unused in conn.execute("SELECT name, sum(pgsize), sum(unused) FROM dbstat GROUP BY name"):
+        if name in tables:
+            table_bytes[tables[name]] += size
+            unused_bytes[tables[name]] += unused
+    ## dbstat lists each b-tree's pages (and overflow pages) in traversal order, so a page which is not one after the
+    ##  previous is out of place (as sqlite3_analyzer measures fragmentation)
+    fragmented = conn.execute("""SELECT count(*) FROM (SELECT pageno, lag(pageno) OVER (PARTITION BY name ORDER BY rowid) AS previous FROM dbstat)
+                              WHERE previous IS NOT NULL AND pageno != previous + 1""").fetchone()[0]
+    return table_bytes, unused_bytes, fragmented
+
+def collection_sizes(conn: sqlite3.Connection)-> list[tuple[str, str, int, int]]:
+    """ Returns (collection id, title, items, bytes) for each collection, largest first (see SizeProfile.collections). """
+    item_bytes = " + ".join(_byte_length(f"items.{column.value}") for column in Items)
+    sizes = {parent_id: (count, size) for parent_id, count, size in conn.execute(f"""
+        SELECT relationship.parent_id, count(*), sum({item_bytes} + {_byte_length("offline.offline_file_data")})
+        FROM collections_items_relationship AS relationship
+            JOIN items ON items.id = relationship.item_id
+            LEFT JOIN items_offline_data AS offline ON offline.item_id = items.id
+        GROUP BY relationship.parent_id""")}
+    result = [(id, title, *sizes.get(id, (0, 0))) for id, title in conn.execute("SELECT id, title FROM collections")]
+    result.sort(key=lambda collection: -collection[3])
+    return result
+
+def profile_size(conn: sqlite3.Connection, dbstat: bool|None = None)-> SizeProfile:
+    """ Breaks the size of the database down by table, column and collection.
+
+    Args:
+        conn (sqlite3.Connection): The connection to the Edge Collections database.
+        dbstat (bool|None, optional): Whether to use the dbstat virtual table. Defaults to None (if SQLite has it).
+    """
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    column_bytes = {(table, column): size for table in Tables for column, size in column_sizes(conn, table).items()}
+    if dbstat is None:
+        dbstat = has_dbstat(conn)
+    if dbstat:
+        table_bytes, unused_bytes, fragmented = _dbstat_sizes(conn)
+    else:
+        table_bytes = {table: sum(size for (other, _), size in column_bytes.items() if other == table) for table in Tables}
+        unused_bytes, fragmented = {}, 0
+    return SizeProfile(page_size, page_count, free_pages, "dbstat" if dbstat else "length", table_bytes, unused_bytes, fragmented,
+                       column_bytes, collection_sizes(conn))
+
+def compact(conn: sqlite3.Connection, destination: pathlib.Path, columns: typing.Iterable[tuple[Tables, str]] = ())-> tuple[SizeProfile, SizeProfile]:
+    """ Writes a vacuumed copy of the database to destination with columns cleared. The original is not changed.
+
+    Args:
+        conn (sqlite3.Connection): The connection to the Edge Collections database.
+        destination (pathlib.Path): Where to write the copy; it must not exist.
+        columns (typing.Iterable[tuple[Tables, str]], optional): (table, column) pairs to set to NULL (or, for DELETE_TO_CLEAR,
+            whose rows are deleted). Defaults to () (only vacuum).
+
+    Raises:
+        ValueError: If a column cannot be NULL and is not in DELETE_TO_CLEAR.
+
+    Returns:
+        tuple[SizeProfile, SizeProfile]: The profiles of the database and of the copy.
+    """
+    statements = []
+    for table, column in columns:
+        tablename, columnname = utils.sanitize_table_and_column(table.value, column)
+        if (table, columnname) in DELETE_TO_CLEAR:
+            statements.append(f"DELETE FROM {tablename}")
+            continue
+        notnull = {row[1]: row[3] for row in conn.execute(f"PRAGMA table_info({tablename})")}
+        if notnull.get(columnname):
+            raise ValueError(f"{tablename}.{columnname} cannot be NULL")
+        statements.append(f"UPDATE {tablename} SET {columnname} = NULL")
+    before = profile_size(conn)
+    def clear(copy: sqlite3.Connection):
+        for statement in statements:
+            copy.execute(statement)
+    _edit_copy(conn, destination, clear)
+    copy, _ = ECE.connect_to_db(destination, mode="ro")
+    try:
+        after = profile_size(copy)
+    finally:
+        copy.close()
+    return before, after
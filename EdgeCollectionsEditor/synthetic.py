@@ -0,0 +1,196 @@
+""" Builds synthetic Edge Collections databases from tables.sql, for benchmarks and experiments.
+
+    python -m EdgeCollectionsEditor.synthetic LOCATION [--items N] [--collections N] [--fanout N] ...
+
+The data is random but shaped like a real library: GUID ids, dates spread over the last few years, JSON tag, source,
+    entity and image blobs, page text and HTML, favicons and images shared between items, comments, offline copies and sync rows.
+    The same seed always produces the same database.
+"""
+import argparse
+import base64
+import importlib.resources
+import importlib.resources.abc
+import json
+import pathlib
+import random
+import sqlite3
+import struct
+import typing
+import uuid
+import zlib
+
+## The schema of Edge's Collections database, shipped with the package (see setup.py's package_data)
+SCHEMA = importlib.resources.files("EdgeCollectionsEditor") / "tables.sql"
+
+DAY = 86_400_000
+WORDS = ("edge", "collection", "recipe", "travel", "python", "sqlite", "review", "guide", "news", "music", "garden", "budget",
+         "design", "camera", "history", "science", "running", "coffee", "project", "library", "weekend", "notes", "video", "paper")
+ITEM_TYPES = ("website", "website", "website", "image", "note")
+COLORS = (None, None, "red", "blue", "green", "yellow")
+## Number of distinct images and paragraphs generated; items pick from these, so blobs repeat as they do in real libraries
+POOL_SIZE = 64
+
+class Options(typing.NamedTuple):
+    """ The shape of a synthetic database (see build_database). """
+    items: int = 1000
+    collections: int|None = None
+    fanout: int = 2
+    comments: float = 0.05
+    offline: float = 0.1
+    favicons: int|None = None
+    image_size: int = 2048
+    thumbnail_size: int = 4096
+    text_size: int = 1000
+    seed: int = 0
+
+def _guid(rng: random.Random)-> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def _png_chunk(kind: bytes, data: bytes)-> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+def _image(rng: random.Random, size: int)-> bytes:
+    """ Returns a valid PNG of noise (which does not compress) of about size bytes. """
+    side = max(1, int((size / 3) ** 0.5))
+    rows = b"".join(b"\x00" + rng.randbytes(side * 3) for _ in range(side))
+    return (b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0))
+            + _png_chunk(b"IDAT", zlib.compress(rows, 1)) + _png_chunk(b"IEND", b""))
+
+def _image_blob(rng: random.Random, size: int)-> bytes:
+    """ Returns a JSON image blob (as stored in thumbnail and canonical_image_data, see utils.convert_thumbnail) of about size bytes. """
+    data = base64.b64encode(_image(rng, max(8, (size - 40) * 3 // 4))).decode()
+    return json.dumps({"mimeType": "image/png", "data": data}).encode()
+
+def _paragraph(rng: random.Random, size: int)-> str:
+    words = []
+    length = 0
+    while length < size:
+        words.append(rng.choice(WORDS))
+        length += len(words[-1]) + 1
+    return " ".join(words)[:size]
+
+def _batches(rows: typing.Iterable[tuple], size: int = 10_000)-> typing.Iterator[list[tuple]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def build_database(location: pathlib.Path|str, items: int = 1000, collections: int|None = None, fanout: int = 2, comments: float = 0.05,
+                   offline: float = 0.1, favicons: int|None = None, image_size: int = 2048, thumbnail_size: int = 4096, text_size: int = 1000,
+                   seed: int = 0, schema: pathlib.Path|importlib.resources.abc.Traversable = SCHEMA, now: float = 1_700_000_000_000)-> Options:
+    """ Builds a synthetic Edge Collections database.
+
+    Args:
+        location (pathlib.Path|str): Where to write the database; it must not exist.
+        items (int, optional): The number of items. Defaults to 1000.
+        collections (int|None, optional): The number of collections. Defaults to None (one per 100 items, at least 10).
+        fanout (int, optional): The average number of collections each item is in. Defaults to 2.
+        comments (float, optional): The fraction of items with a comment. Defaults to 0.05.
+        offline (float, optional): The fraction of items with offline data (a copy of their HTML). Defaults to 0.1.
+        favicons (int|None, optional): The number of distinct favicons the items share. Defaults to None (one per 20 items, at least 1).
+        image_size (int, optional): The size of each item's canonical_image_data in bytes (0 for none). Defaults to 2048.
+        thumbnail_size (int, optional): The size of each collection's thumbnail in bytes (0 for none). Defaults to 4096.
+        text_size (int, optional): The length of each item's text_content; html_content is about the same. Defaults to 1000.
+        seed (int, optional): The random seed. Defaults to 0.
+        schema (pathlib.Path|importlib.resources.abc.Traversable, optional): The schema to create the tables with. Defaults to SCHEMA.
+        now (float, optional): The newest date_created/date_modified (see utils.edge_timestamp). Defaults to a fixed date so that databases are reproducible.
+
+    Returns:
+        Options: The options the database was built with.
+    """
+    location = pathlib.Path(location)
+    if location.exists():
+        raise FileExistsError(location)
+    if collections is None:
+        collections = max(10, items // 100)
+    if favicons is None:
+        favicons = max(1, items // 20)
+    options = Options(items, collections, fanout, comments, offline, favicons, image_size, thumbnail_size, text_size, seed)
+    rng = random.Random(seed)
+    images = [_image_blob(rng, image_size) for _ in range(POOL_SIZE)] if image_size else [None]
+    thumbnails = [_image_blob(rng, thumbnail_size) for _ in range(POOL_SIZE)] if thumbnail_size else [None]
+    paragraphs = [_paragraph(rng, text_size) for _ in range(POOL_SIZE)]
+    icons = [(f"https://{rng.choice(WORDS)}{index}.example.com/favicon.ico", _image(rng, rng.randint(200, 2000))) for index in range(favicons)]
+    collection_ids = [_guid(rng) for _ in range(collections)]
+
+    conn = sqlite3.connect(location)
+    try:
+        conn.executescript(schema.read_text())
+        ## Nothing to recover if the build fails part way, so skip the journal
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("BEGIN")
+        conn.executemany("INSERT INTO favicons (url, data) VALUES (?, ?)", icons)
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [("version", "1"), ("synthetic_seed", str(seed))])
+
+        def collection_rows():
+            for position, id in enumerate(collection_ids):
+                created = now - rng.uniform(0, 3 * 365) * DAY
+                yield (id, created, rng.uniform(created, now), f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {position}", position,
+                       rng.choice(thumbnails), json.dumps({"theme": rng.choice(WORDS), "pinned": rng.random() < 0.1}), f"https://{rng.choice(WORDS)}.example.com/thumbnail/{position}.png")
+        for batch in _batches(collection_rows()):
+            conn.executemany("""INSERT INTO collections (id, date_created, date_modified, title, position, thumbnail, tag, thumbnail_url)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", batch)
+        conn.executemany("INSERT INTO collections_sync (collection_id, is_syncable, server_id, date_last_synced) VALUES (?, 1, ?, ?)",
+                         [(id, _guid(rng), now) for id in collection_ids])
+
+        positions = [0] * collections
+        def item_rows():
+            for index in range(items):
+                id = _guid(rng)
+                created = now - rng.uniform(0, 3 * 365) * DAY
+                site = rng.choice(WORDS)
+                url = f"https://www.{site}.example.com/{rng.choice(WORDS)}/{index}"
+                title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 8))).capitalize()
+                text = paragraphs[index % POOL_SIZE]
+                favicon = icons[rng.randrange(favicons)][0]
+                yield (id, created, rng.uniform(created, now), title, json.dumps({"url": url, "websiteName": site}).encode(),
+                        json.dumps({"@type": "WebPage", "name": title, "keywords": rng.sample(WORDS, 3)}).encode(), favicon,
+                        rng.choice(images), f"{url}/image.png", text, f"<html><body><h1>{title}</h1><p>{text}</p></body></html>",
+                        rng.choice(ITEM_TYPES), rng.choice(COLORS), json.dumps({"provider": site}).encode() if rng.random() < 0.2 else None,
+                        url, json.dumps({"read": rng.random() < 0.5}))
+
+        def relationship_rows(id: str):
+            count = max(1, min(collections, round(rng.triangular(1, 2 * fanout - 1, fanout))))
+            for collection in rng.sample(range(collections), count):
+                positions[collection] += 1
+                yield (id, collection_ids[collection], positions[collection])
+
+        for batch in _batches(item_rows()):
+            conn.executemany("""INSERT INTO items (id, date_created, date_modified, title, source, entity_blob, favicon_url, canonical_image_data,
+                             canonical_image_url, text_content, html_content, type, color, third_party_data, remote_url, tag)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", batch)
+            conn.executemany("INSERT INTO items_sync (item_id, is_syncable, server_id, date_last_synced) VALUES (?, 1, ?, ?)",
+                             [(row[0], _guid(rng), now) for row in batch])
+            conn.executemany("INSERT INTO collections_items_relationship (item_id, parent_id, position) VALUES (?, ?, ?)",
+                             [relationship for row in batch for relationship in relationship_rows(row[0])])
+            conn.executemany("INSERT INTO comments (id, parent_id, text, properties) VALUES (?, ?, ?, ?)",
+                             [(_guid(rng), row[0], _paragraph(rng, 120), json.dumps({"date_created": row[1]}).encode())
+                              for row in batch if rng.random() < comments])
+            conn.executemany("INSERT INTO items_offline_data (item_id, offline_file_data) VALUES (?, ?)",
+                             [(row[0], row[10]) for row in batch if rng.random() < offline])
+        conn.commit()
+    finally:
+        conn.close()
+    return options
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a synthetic Edge Collections database")
+    parser.add_argument("location", type=pathlib.Path)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--collections", type=int, default=None)
+    parser.add_argument("--fanout", type=int, default=2)
+    parser.add_argument("--comments", type=float, default=0.05)
+    parser.add_argument("--offline", type=float, default=0.1)
+    parser.add_argument("--favicons", type=int, default=None)
+    parser.add_argument("--image_size", type=int, default=2048)
+    parser.add_argument("--thumbnail_size", type=int, default=4096)
+    parser.add_argument("--text_size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    options = build_database(**vars(args))
+    print(options)
@@ -0,0 +1,278 @@
+""" Queries on the JSON tag column of collections and items, run by SQLite's JSON1 functions instead of decoding every tag in Python.
+
+    items = tags.get_by_tags(conn, Tables.ITEMS, [tags.parse_tag_filter("read=false")])
+
+Paths are JSON paths ("$.theme", "$.a.b", "$.list[0]"); a plain key such as "theme" or "a.b" is converted with json_path.
+    Values are compared as SQLite sees them: true and false are 1 and 0, and strings compare as text.
+    Tags which are not valid JSON never match (json_extract would otherwise fail on them).
+
+An optional sidecar database (see connect_index) holds every tag flattened into (kind, id, path, value) rows, indexed by
+    path and value, and is refreshed incrementally using date_modified like the search index. Looking rows up in it does
+    not read any tag at all, and matches the same rows as the queries above: objects and arrays are stored too, as the
+    minified JSON json_extract returns for them.
+"""
+import json
+import pathlib
+import re
+import sqlite3
+import typing
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import blobs, utils
+from EdgeCollectionsEditor.utils import OPERATORS, row_factory
+
+## The tables with a tag column
+TAG_TABLES = (Tables.COLLECTIONS, Tables.ITEMS)
+
+def valid_tag(column: str = Items.TAG.value)-> str:
+    """ Returns column (a tag column) with invalid JSON replaced by NULL, which the JSON1 functions accept. """
+    return f"CASE WHEN json_valid({column}) THEN {column} END"
+
+VALID_TAG = valid_tag()
+
+## Name the Edge Collections database is attached as on the index connection
+EDGE_SCHEMA = "edge"
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tag_values (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    value,
+    PRIMARY KEY (kind, id, path)
+    ) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tag_values_path ON tag_values (kind, path, value);
+CREATE TABLE IF NOT EXISTS documents (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    date_modified REAL NOT NULL,
+    PRIMARY KEY (kind, id)
+    ) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS high_water (
+    kind TEXT PRIMARY KEY,
+    date_modified REAL NOT NULL
+    );
+"""
+
+## A key which needs no quotes, optionally indexed ("labels[0]")
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(?:\[\d+\])*$")
+_FILTER_RE = re.compile(rf"^(.+?)({utils.OPERATOR_PATTERN})(.*)$", re.DOTALL)
+_MISSING = object()
+
+class TagFilter(typing.NamedTuple):
+    """ Matches rows whose tag has path; if value is given, the value at path must also compare to it with operator. """
+    path: str
+    value: typing.Any = _MISSING
+    ## A key of OPERATORS
+    operator: str = "="
+
+def json_path(key: str)-> str:
+    """ Converts a key ("theme") or dotted keys ("a.b") to a JSON path ("$.theme", "$.a.b"), quoting keys which need it.
+        Paths which already start with "$" are returned unchanged.
+    """
+    if key.startswith("$"):
+        return key
+    return "$" + "".join(f".{part}" if _IDENTIFIER_RE.match(part) else f'."{part}"' for part in key.split("."))
+
+def parse_value(text: str)-> typing.Any:
+    """ Parses text as JSON (so "true", "3" and "null" are not strings), falling back to the text itself.
+        Booleans become 1 and 0, as json_extract returns them.
+    """
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return text
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        ## Compared with the minified JSON json_extract returns for objects and arrays
+        return json.dumps(value, separators=(",", ":"))
+    return value
+
+def parse_tag_filter(text: str)-> TagFilter:
+    """ Parses "<path>" (the path exists) or "<path><operator><value>", e.g. "read=false" or "theme~coffee" (see OPERATORS). """
+    if (match := _FILTER_RE.match(text)) is None:
+        return TagFilter(json_path(text))
+    path, operator, value = match.groups()
+    return TagFilter(json_path(path), value if operator in ("~", "!~") else parse_value(value), operator)
+
+def tag_condition(filter: TagFilter, column: str = VALID_TAG)-> tuple[str, list[typing.Any]]:
+    """ Returns the SQL condition for filter on column (a valid tag) and its parameters.
+
+    Raises:
+        ValueError: If the operator is invalid.
+    """
+    if filter.value is _MISSING:
+        return f"json_type({column}, ?) IS NOT NULL", [filter.path]
+    if filter.operator not in OPERATORS:
+        raise ValueError(f"Invalid operator: {filter.operator}")
+    if filter.value is None:
+        ## The path holds null
+        if filter.operator not in ("=", "!="):
+            raise ValueError("null can only be compared with = or !=.")
+        ## != null, like any other comparison, does not match rows without path
+        return f"json_type({column}, ?) {filter.operator} 'null'", [filter.path]
+    value = f"%{filter.value}%" if filter.operator in ("~", "!~") else filter.value
+    return f"json_extract({column}, ?) {OPERATORS[filter.operator]} ?", [filter.path, value]
+
+def where_clause(table: Tables, filters: typing.Sequence[TagFilter])-> tuple[str, list[typing.Any]]:
+    """ Returns "FROM <table> WHERE ..." for filters (all of which must match) and its parameters.
+
+    Raises:
+        ValueError: If table has no tag column or a filter is invalid.
+    """
+    if table not in TAG_TABLES:
+        raise ValueError(f"{table.value} has no tag column")
+    conditions, parameters = [], []
+    for filter in filters:
+        condition, values = tag_condition(filter)
+        conditions.append(condition)
+        parameters += values
+    clause = f"FROM {table.value}"
+    if conditions:
+        clause += " WHERE " + " AND ".join(conditions)
+    return clause, parameters
+
+@row_factory
+def get_by_tags(conn: sqlite3.Connection, table: Tables, filters: typing.Sequence[TagFilter], lazy: bool = False)-> list[sqlite3.Row]:
+    """ Returns the rows of table (collections or items) whose tags match every filter.
+        If lazy is True, blob columns are returned as blobs.LazyBlob handles.
+    """
+    clause, parameters = where_clause(table, filters)
+    return blobs.execute(conn, table, clause, parameters, lazy=lazy).fetchall()
+
+@row_factory
+def iter_by_tags(conn: sqlite3.Connection, table: Tables, filters: typing.Sequence[TagFilter], batch_size: int = utils.DEFAULT_BATCH_SIZE,
+                 lazy: bool = False)-> typing.Iterator[sqlite3.Row]:
+    """ Streaming version of get_by_tags: yields the matching rows, fetching batch_size rows at a time. """
+    clause, parameters = where_clause(table, filters)
+    return utils.iter_rows(blobs.execute(conn, table, clause, parameters, lazy=lazy), batch_size)
+
+@row_factory
+def count_by_tags(conn: sqlite3.Connection, table: Tables, filters: typing.Sequence[TagFilter])-> int:
+    """ Returns the number of rows of table whose tags match every filter. """
+    clause, parameters = where_clause(table, filters)
+    return conn.execute(f"SELECT count(*) {clause}", parameters).fetchone()[0]
+
+@row_factory
+def tag_paths(conn: sqlite3.Connection, table: Tables)-> list[sqlite3.Row]:
+    """ Returns the path of every scalar value in the tags of table, with the number of rows which have it (most common first). """
+    if table not in TAG_TABLES:
+        raise ValueError(f"{table.value} has no tag column")
+    return conn.execute(f"""SELECT tree.fullkey AS path, count(DISTINCT {table.value}.rowid) AS rows
+                        FROM {table.value}, json_tree({VALID_TAG}) AS tree
+                        WHERE tree.type NOT IN ('object', 'array')
+                        GROUP BY tree.fullkey ORDER BY rows DESC, path""").fetchall()
+
+@row_factory
+def tag_values(conn: sqlite3.Connection, table: Tables, path: str, limit: int|None = None)-> list[sqlite3.Row]:
+    """ Returns the distinct values at path (see json_path) in the tags of table, with the number of rows with each (most common first). """
+    if table not in TAG_TABLES:
+        raise ValueError(f"{table.value} has no tag column")
+    return conn.execute(f"""SELECT json_extract({VALID_TAG}, ?1) AS value, count(*) AS rows FROM {table.value}
+                        WHERE json_type({VALID_TAG}, ?1) IS NOT NULL
+                        GROUP BY value ORDER BY rows DESC, value LIMIT ?2""", (json_path(path), -1 if limit is None else limit)).fetchall()
+
+def default_index_location(file_location: pathlib.Path)-> pathlib.Path:
+    """ Returns the default location of the tag index for the given Edge Collections database. """
+    return file_location.with_name(f"{file_location.name}_tags")
+
+def connect_index(file_location: pathlib.Path, index_location: pathlib.Path|None = None)-> sqlite3.Connection:
+    """ Opens (creating it if needed) the tag index for the given Edge Collections database.
+        The Edge Collections database is attached read-only as EDGE_SCHEMA.
+
+    Args:
+        file_location (pathlib.Path): The location of the Edge Collections database.
+        index_location (pathlib.Path|None, optional): The location of the index. Defaults to default_index_location(file_location).
+
+    Returns:
+        sqlite3.Connection: The connection to the index.
+    """
+    if index_location is None:
+        index_location = default_index_location(file_location)
+    index = sqlite3.connect(pathlib.Path(index_location).resolve().as_uri(), uri=True)
+    index.executescript(INDEX_SCHEMA)
+    index.execute(f"ATTACH DATABASE ? AS {EDGE_SCHEMA}", (f"{pathlib.Path(file_location).resolve().as_uri()}?mode=ro",))
+    return index
+
+def refresh_index(index: sqlite3.Connection)-> dict[Tables, tuple[int, int]]:
+    """ Brings the index up to date with the Edge Collections database.
+        Rows are flattened again (by json_tree, inside SQLite) if they are not in the index yet, or if their date_modified
+        has changed and is no more than utils.HIGH_WATER_MARGIN before the newest date_modified seen by the last refresh;
+        rows that no longer exist are removed.
+
+    Args:
+        index (sqlite3.Connection): A connection returned by connect_index.
+
+    Returns:
+        dict[Tables, tuple[int, int]]: The number of rows (indexed, removed) for each table.
+    """
+    results = {}
+    now = utils.edge_timestamp()
+    size = utils.max_variables(index) - 1
+    with index:
+        for table in TAG_TABLES:
+            kind = table.value
+            row = index.execute("SELECT date_modified FROM high_water WHERE kind = ?", (kind,)).fetchone()
+            ## Rows synced or restored with an older date_modified are still found by their id, if they are new
+            since = None if row is None else min(row[0], now) - utils.HIGH_WATER_MARGIN
+            ## Read before indexing so that rows modified during the refresh are picked up next time
+            latest = index.execute(f"SELECT max(date_modified) FROM {EDGE_SCHEMA}.{kind}").fetchone()[0]
+
+            changed = [row[0] for row in index.execute(f"""SELECT source.id FROM {EDGE_SCHEMA}.{kind} AS source
+                                                       LEFT JOIN documents ON documents.kind = ? AND documents.id = source.id
+                                                       WHERE (documents.id IS NULL OR source.date_modified >= ?)
+                                                           AND documents.date_modified IS NOT source.date_modified""", (kind, since))]
+            for chunk in utils.chunked(changed, size):
+                ids = ", ".join("?" * len(chunk))
+                index.execute(f"DELETE FROM tag_values WHERE kind = ? AND id IN ({ids})", [kind, *chunk])
+                index.execute(f"""INSERT INTO tag_values (kind, id, path, value)
+                              SELECT ?, source.id, tree.fullkey, tree.value
+                              FROM {EDGE_SCHEMA}.{kind} AS source, json_tree({valid_tag(f'source.{Items.TAG.value}')}) AS tree
+                              WHERE source.id IN ({ids})""", [kind, *chunk])
+                index.execute(f"""INSERT OR REPLACE INTO documents (kind, id, date_modified)
+                              SELECT ?, id, date_modified FROM {EDGE_SCHEMA}.{kind} WHERE id IN ({ids})""", [kind, *chunk])
+
+            index.execute(f"DELETE FROM tag_values WHERE kind = ? AND id NOT IN (SELECT id FROM {EDGE_SCHEMA}.{kind})", (kind,))
+            removed = index.execute(f"DELETE FROM documents WHERE kind = ? AND id NOT IN (SELECT id FROM {EDGE_SCHEMA}.{kind})", (kind,)).rowcount
+
+            if latest is not None:
+                index.execute("INSERT OR REPLACE INTO high_water (kind, date_modified) VALUES (?, ?)", (kind, latest))
+            results[table] = (len(changed), removed)
+    return results
+
+def index_lookup(index: sqlite3.Connection, table: Tables, filters: typing.Sequence[TagFilter])-> list[str]:
+    """ Returns the ids of the rows of table whose tags match every filter, according to the index (refresh it first).
+
+    Raises:
+        ValueError: If table has no tag column or a filter is invalid.
+    """
+    if table not in TAG_TABLES:
+        raise ValueError(f"{table.value} has no tag column")
+    if not filters:
+        return [row[0] for row in index.execute("SELECT id FROM documents WHERE kind = ?", (table.value,))]
+    selects, parameters = [], []
+    for filter in filters:
+        if filter.value is _MISSING:
+            selects.append("SELECT id FROM tag_values WHERE kind = ? AND path = ?")
+            parameters += [table.value, filter.path]
+            continue
+        if filter.operator not in OPERATORS:
+            raise ValueError(f"Invalid operator: {filter.operator}")
+        if filter.value is None:
+            if filter.operator not in ("=", "!="):
+                raise ValueError("null can only be compared with = or !=.")
+            ## A stored NULL is a JSON null (objects and arrays are stored as text)
+            selects.append(f"SELECT id FROM tag_values WHERE kind = ? AND path = ? AND value {'IS' if filter.operator == '=' else 'IS NOT'} NULL")
+            parameters += [table.value, filter.path]
+            continue
+        value = f"%{filter.value}%" if filter.operator in ("~", "!~") else filter.value
+        selects.append(f"SELECT id FROM tag_values WHERE kind = ? AND path = ? AND value {OPERATORS[filter.operator]} ?")
+        parameters += [table.value, filter.path, value]
+    ## (kind, id, path) is unique, so a single SELECT returns each id once
+    return [row[0] for row in index.execute(" INTERSECT ".join(selects), parameters)]
+
+@row_factory
+def get_by_ids(conn: sqlite3.Connection, table: Tables, ids: typing.Sequence[str], lazy: bool = False)-> list[sqlite3.Row]:
+    """ Returns the rows of table with the given ids (e.g. from index_lookup), passed to SQLite as one JSON array. """
+    return blobs.execute(conn, table, f"FROM {table.value} WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(list(ids)),), lazy=lazy).fetchall()
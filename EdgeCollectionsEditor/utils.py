@@ -1,35 +1,144 @@
 import functools
+import glob
+import hashlib
 import inspect
 import json
 import os.path
 import pathlib
-import shutil
+import re
 import sqlite3
 from subprocess import Popen
+import sys
+import time
 import typing
 
 from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor.blobs import LazyBlob
+from EdgeCollectionsEditor import decoding, profiling
 
 T = typing.TypeVar("T")
 
+DEFAULT_BATCH_SIZE = 500
+## Incremental readers (watch.Watcher, the search and tag indexes) re-read rows whose date_modified is up to this many
+##  milliseconds before their high-water mark, so that rows written with a slightly earlier date_modified than the last
+##  row seen (e.g. by a transaction which committed late) or with a date_modified in the future (e.g. synced from a
+##  device whose clock is ahead) are still found
+HIGH_WATER_MARGIN = 60_000
+
+## Filter operators (of query.parse_filter and tags.parse_tag_filter) -> SQL; "~" is a (case-insensitive) substring match
+OPERATORS = {"=": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">=", "~": "LIKE", "!~": "NOT LIKE"}
+## A regular expression matching any of OPERATORS, longest first (so that "<=" is not read as "<")
+OPERATOR_PATTERN = "|".join(re.escape(operator) for operator in sorted(OPERATORS, key=len, reverse=True))
+
 def default_file_location()-> pathlib.Path:
     """ Returns the default location of the Edge Collections database file. """
     return (pathlib.Path(os.path.expandvars("$localappdata")) / "Microsoft/Edge/User Data/Default/Collections/collectionsSQLite").resolve()
 
+def edge_timestamp()-> float:
+    """ Returns the current time in the format of the date_created/date_modified columns (milliseconds since the Unix epoch). """
+    return time.time() * 1000
+
 def reveal_default_file_location():
     location = default_file_location()
     Popen(f'explorer /select,"{location}"')
 
-def backup_database(file_location: pathlib.Path)-> pathlib.Path:
-    """ Creates a backup of the Edge Collections database at the specified location. """
-    i = 0
-    newname = file_location.parent / f"{file_location.stem}_backup{i if i else ''}{file_location.suffix}"
-    while newname.exists():
-        i += 1
-        newname = file_location.parent / f"{file_location.stem}_backup{i}{file_location.suffix}"
-    shutil.copy(file_location, newname)
+def backup_name(file_location: pathlib.Path, number: int)-> pathlib.Path:
+    """ Returns the location of the given backup of file_location; backup 0 has no number. """
+    return file_location.parent / f"{file_location.stem}_backup{number if number else ''}{file_location.suffix}"
+
+def list_backups(file_location: pathlib.Path)-> list[tuple[int, pathlib.Path]]:
+    """ Returns the existing (number, location) backups of file_location, oldest first. """
+    pattern = re.compile(rf"{re.escape(file_location.stem)}_backup(\d*){re.escape(file_location.suffix)}")
+    backups = []
+    for path in file_location.parent.glob(f"{glob.escape(file_location.stem)}_backup*{glob.escape(file_location.suffix)}"):
+        if (match := pattern.fullmatch(path.name)):
+            backups.append((int(match.group(1) or 0), path))
+    return sorted(backups)
+
+def hash_database(file_location: pathlib.Path, chunk_size: int = 1 << 20)-> str:
+    """ Returns a sha256 hexdigest of the database file and its write-ahead log (if any), read chunk_size bytes at a time. """
+    digest = hashlib.sha256()
+    for path in (file_location, file_location.with_name(f"{file_location.name}-wal")):
+        if not path.exists(): continue
+        with open(path, "rb") as f:
+            while (chunk := f.read(chunk_size)):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def backup_database(file_location: pathlib.Path, pages: int = 1024, progress: typing.Callable[[int, int, int], object]|None = None,
+                    skip_unchanged: bool = False, keep: int|None = None)-> pathlib.Path:
+    """ Creates a backup of the Edge Collections database at the specified location.
+
+    The backup is made with the SQLite online backup API from a read-only connection, so it is a consistent snapshot
+        (including anything still in the write-ahead log) even if Edge is writing to the database.
+    The last backup's content hash is recorded in a "<name>_backup.json" manifest next to the database.
+
+    Args:
+        file_location (pathlib.Path): The database to back up.
+        pages (int, optional): The number of pages to copy at a time. Defaults to 1024.
+        progress (typing.Callable[[int, int, int], object]|None, optional): Called as progress(status, remaining, total)
+            after each batch of pages (see sqlite3.Connection.backup). Defaults to None.
+        skip_unchanged (bool, optional): If the database's hash matches the last backup, return that backup instead of
+            making a new one. Defaults to False.
+        keep (int|None, optional): The number of backups to keep; older ones are deleted. Defaults to None (keep all).
+
+    Returns:
+        pathlib.Path: The location of the backup.
+    """
+    if keep is not None and keep < 1:
+        raise ValueError("keep must be at least 1.")
+    manifest_location = file_location.parent / f"{file_location.name}_backup.json"
+    manifest = {}
+    if manifest_location.exists():
+        manifest = json.loads(manifest_location.read_text())
+
+    digest = hash_database(file_location) if skip_unchanged else None
+    if skip_unchanged and manifest.get("hash") == digest and (last := file_location.parent / manifest.get("backup", "")).is_file():
+        return last
+
+    backups = list_backups(file_location)
+    newname = backup_name(file_location, backups[-1][0] + 1 if backups else 0)
+    partial = newname.with_name(f"{newname.name}.partial")
+    source = sqlite3.connect(f"{file_location.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        destination = sqlite3.connect(partial)
+        try:
+            source.backup(destination, pages=pages, progress=progress)
+        finally:
+            destination.close()
+        partial.replace(newname)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    finally:
+        source.close()
+
+    manifest_location.write_text(json.dumps({"hash": digest, "backup": newname.name}))
+
+    if keep is not None:
+        for _, old in list_backups(file_location)[:-keep]:
+            old.unlink()
     return newname
 
+TEMP_STORE = ("default", "file", "memory")
+
+def set_pragmas(conn: sqlite3.Connection, mmap_size: int|None = None, cache_size: int|None = None, temp_store: str|None = None, query_only: bool|None = None)-> None:
+    """ Sets the given tuning pragmas on the connection; pragmas which are None are left unchanged.
+
+    Raises:
+        ValueError: If temp_store is not one of TEMP_STORE.
+    """
+    if mmap_size is not None:
+        conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    if cache_size is not None:
+        conn.execute(f"PRAGMA cache_size = {int(cache_size)}")
+    if temp_store is not None:
+        if temp_store not in TEMP_STORE:
+            raise ValueError(f"temp_store must be one of {TEMP_STORE}")
+        conn.execute(f"PRAGMA temp_store = {temp_store}")
+    if query_only is not None:
+        conn.execute(f"PRAGMA query_only = {int(bool(query_only))}")
+
 def bytes_to_json(byteobj)-> str:
     """
     Utility function for converting bytes for json.dump/s(default=bytes_to_json).
@@ -49,7 +158,7 @@ def bytes_to_json(byteobj)-> str:
 
 def convert_tag(collection_or_item: sqlite3.Row)-> dict[str, typing.Any]:
     """ Converts a collection or item's tag string to a dictionary and returns it.
-        Note that this does not mutate the input.
+        Note that this does not mutate the input. The result is cached (see decoding.decode), so it should not be mutated either.
     
     Args:
         collection_or_item (sqlite3.Row): The collection or item to convert.
@@ -57,13 +166,15 @@ def convert_tag(collection_or_item: sqlite3.Row)-> dict[str, typing.Any]:
     Returns:
         dict: The converted dictionary.
     """
-    return json.loads(collection_or_item["tag"])
+    return decoding.decode(collection_or_item, "tag")
 
-def _convert_byte_blob(key: str, object: str, returntype: typing.Type[T]=dict[str,str])-> typing.Callable[[sqlite3.Row],T]:
+def _convert_byte_blob(key: str, table: Tables, returntype: typing.Type[T]=dict[str,str])-> typing.Callable[[sqlite3.Row],T]:
     """ This is a function factory for internal use. Used to create a funciton which converts a particular key's blob value to a dictionary and return it."""
     def convert(row: sqlite3.Row)-> returntype:
-        f""" Converts the {key} of a {object} row to a dictionary and returns it.
-            Note that this does not mutate the input.
+        return decoding.decode(row, key, table)
+    convert.__name__ = f"convert_{key}"
+    convert.__doc__ = f""" Converts the {key} of a {table.value} row to a dictionary and returns it.
+            Note that this does not mutate the input. The result is cached (see decoding.decode), so it should not be mutated either.
         
         Args:
             row (sqlite3.Row): The row to convert.
@@ -71,23 +182,23 @@ def _convert_byte_blob(key: str, object: str, returntype: typing.Type[T]=dict[st
         Returns:
             dict: The converted dictionary.
         """
-        return json.loads(row[key], default = bytes_to_json)
     return convert
 
-convert_thumbnail = _convert_byte_blob("thumbnail", "collection")
-convert_canonical_image_data = _convert_byte_blob("canonical_image_data", "item")
-convert_entity_blob = _convert_byte_blob("entity_blob", "item")
-convert_source = _convert_byte_blob("source", "item")
-convert_third_party_data = _convert_byte_blob("third_party_data", "item")
+convert_thumbnail = _convert_byte_blob("thumbnail", Tables.COLLECTIONS)
+convert_canonical_image_data = _convert_byte_blob("canonical_image_data", Tables.ITEMS)
+convert_entity_blob = _convert_byte_blob("entity_blob", Tables.ITEMS)
+convert_source = _convert_byte_blob("source", Tables.ITEMS)
+convert_third_party_data = _convert_byte_blob("third_party_data", Tables.ITEMS)
 
-def truncate_blobs(*dicts: dict, trunc = 40, blobs = ["thumbnail", "canonical_image_data", "canonical_image_url", "entity_blob", "source", "third_party_data"])-> None:
+def truncate_blobs(*dicts: dict, trunc = 40, blobs = ["thumbnail", "canonical_image_data", "canonical_image_url", "entity_blob", "source", "third_party_data", "data", "properties"])-> None:
     """ Truncates the specified blobs in the provided dicts.
+        blobs.LazyBlob values are replaced by bytes, reading no more than trunc bytes of long values.
     
     Args:
         *dicts (dict): The dicts to truncate.
         trunc (int, optional): The number of characters to truncate to.
         Defaults to 60. Note that an elipsis (...) will be appended to truncated values.
-        blobs (list[str], optional): The blobs to truncate. Defaults to ["thumbnail", "canonical_image_data", "canonical_image_url", "entity_blob", "source", "third_party_data"].
+        blobs (list[str], optional): The blobs to truncate. Defaults to ["thumbnail", "canonical_image_data", "canonical_image_url", "entity_blob", "source", "third_party_data", "data", "properties"].
 
     Raises:
         ValueError: If any of the dicts are not dicts.
@@ -96,8 +207,10 @@ def truncate_blobs(*dicts: dict, trunc = 40, blobs = ["thumbnail", "canonical_im
         if not isinstance(row, dict): raise ValueError("All rows must be dicts.")
         for key in blobs:
             if key in row and (v:= row[key]):
-                if len(v) <= trunc: continue
-                if isinstance(v, bytes):
+                if len(v) <= trunc:
+                    if isinstance(v, LazyBlob): row[key] = v.load()
+                    continue
+                if isinstance(v, (bytes, LazyBlob)):
                     row[key] = v[:trunc]+b"..."
                 else:
                     row[key] = v[:trunc]+"..."
@@ -106,16 +219,27 @@ def row_factory(func: typing.Callable[..., T])-> typing.Callable[..., T]:
     """
     Wraps a function so that the connection's row_factory is set to sqlite3.Row
         while the function is executed and restores it afterwards.
+        While profiling is enabled the call is recorded (see profiling).
     """
     sig = inspect.signature(func)
     if "conn" not in sig.parameters:
         raise ValueError("The function must take a 'conn' parameter.")
+    name = f"{func.__module__}.{func.__qualname__}"
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         applied = sig.bind(*args, **kwargs)
         conn = applied.arguments["conn"]
         rf = conn.row_factory
         conn.row_factory = sqlite3.Row
+        if (profiler := profiling.profiler) is not None:
+            token = profiler.enter(name, conn)
+            result = None
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                conn.row_factory = rf
+                result = profiler.exit(token, result)
+            return result
         try:
             return func(*args, **kwargs)
         except Exception as e:
@@ -125,15 +249,60 @@ def row_factory(func: typing.Callable[..., T])-> typing.Callable[..., T]:
     return wrapper
 
 class RowFactory:
-    def __init__(self, conn: sqlite3.Connection) -> None:
+    """ Context manager version of row_factory. While profiling is enabled the block is recorded under name
+        (by default the module and name of the function using it).
+    """
+    def __init__(self, conn: sqlite3.Connection, name: str|None = None) -> None:
         self.conn = conn
         self.original = conn.row_factory
+        self.name = name
+        self.token = None
     def __enter__(self):
         self.original = self.conn.row_factory
         self.conn.row_factory = sqlite3.Row
+        if (profiler := profiling.profiler) is not None:
+            name = self.name
+            if name is None:
+                frame = sys._getframe(1)
+                name = f"{frame.f_globals.get('__name__')}.{frame.f_code.co_qualname}"
+            self.token = (profiler, profiler.enter(name, self.conn))
         return self
     def __exit__(self, exc_type, exc_value, traceback):
         self.conn.row_factory = self.original
+        if self.token is not None:
+            profiler, token = self.token
+            self.token = None
+            profiler.exit(token)
+
+def iter_rows(cursor: sqlite3.Cursor, batch_size: int = DEFAULT_BATCH_SIZE)-> typing.Generator[sqlite3.Row, None, None]:
+    """ Yields the rows of an executed cursor, fetching them in batches with fetchmany.
+        The cursor is closed once it is exhausted (or the generator is closed).
+
+    Args:
+        cursor (sqlite3.Cursor): The executed cursor to read from.
+        batch_size (int, optional): The number of rows to fetch at a time. Defaults to DEFAULT_BATCH_SIZE.
+
+    Raises:
+        ValueError: If batch_size is less than 1.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1.")
+    try:
+        while (batch := cursor.fetchmany(batch_size)):
+            yield from batch
+    finally:
+        cursor.close()
+
+def max_variables(conn: sqlite3.Connection)-> int:
+    """ Returns the maximum number of parameters that can be bound to a single statement on the connection. """
+    return conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+
+def chunked(values: typing.Sequence[T], size: int)-> typing.Generator[typing.Sequence[T], None, None]:
+    """ Yields successive slices of values with at most size elements each. """
+    if size < 1:
+        raise ValueError("size must be at least 1.")
+    for i in range(0, len(values), size):
+        yield values[i:i+size]
 
 def rows_to_dict(*rows: sqlite3.Row)-> typing.Generator[dict, None, None]:
     """ Converts a list of sqlite3.Row objects to a list of dictionaries."""
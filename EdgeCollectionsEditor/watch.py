@@ -0,0 +1,211 @@
+""" Watches the Edge Collections database for changes made by Edge (or anything else).
+
+The database file and its -wal file are polled with os.stat; when either changes, only the collections and items whose
+    date_modified is at or after the last high-water mark are read, along with the relationships table (which has no
+    date_modified).
+    Subscribers receive a ChangeEvent for each table which changed.
+"""
+import os
+import pathlib
+import sqlite3
+import threading
+import typing
+
+import EdgeCollectionsEditor as ECE
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import utils
+
+DEFAULT_INTERVAL = 1.0
+## The high-water mark is kept at least this many milliseconds in the past (see utils.HIGH_WATER_MARGIN)
+HIGH_WATER_MARGIN = utils.HIGH_WATER_MARGIN
+
+## Key of a row in collections_items_relationship
+RelationshipKey = tuple[str, str]
+
+class ChangeEvent(typing.NamedTuple):
+    """ The changes to one table since the last poll.
+
+    Collections and items are identified by id, relationships by (item_id, parent_id); a relationship is modified when its
+        position changes. rows holds the current rows of the added and modified collections and items.
+    """
+    table: Tables
+    added: list[typing.Any]
+    modified: list[typing.Any]
+    removed: list[typing.Any]
+    rows: dict[str, sqlite3.Row]
+
+Subscriber = typing.Callable[[list[ChangeEvent]], object]
+
+class Watcher:
+    """ Tracks the collections, items and relationships of the database and reports what changes.
+
+    Example:
+        watcher = Watcher(file_location)
+        watcher.subscribe(lambda events: print(events))
+        watcher.start()  # or call watcher.poll() periodically
+        ...
+        watcher.stop()
+
+    Only id and date_modified are cached for collections and items, so edits which do not update date_modified are not seen.
+        Rows added with a date_modified before the high-water mark are found by comparing ids when the number of rows
+        changes, so one which is added while another is deleted (between two polls) is only reported once the counts differ.
+    """
+    TABLES = (Tables.COLLECTIONS, Tables.ITEMS)
+
+    def __init__(self, file_location: pathlib.Path|str|None = None, interval: float = DEFAULT_INTERVAL):
+        self.conn, self.file_location = ECE.connect_to_db(file_location, mode="ro", check_same_thread=False)
+        self.interval = interval
+        ## id -> date_modified of each of TABLES
+        self.known: dict[Tables, dict[str, float]] = {}
+        self.high_water: dict[Tables, float|None] = {}
+        ## (item_id, parent_id) -> position
+        self.relationships: dict[RelationshipKey, int] = {}
+        self.subscribers: list[Subscriber] = []
+        self._signature = self.file_signature()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread|None = None
+        self.load()
+
+    def load(self):
+        """ Caches the current state of the database, without reporting changes. """
+        now = utils.edge_timestamp()
+        for table in self.TABLES:
+            self.known[table] = dict(self.conn.execute(f"SELECT id, date_modified FROM {table.value}"))
+            self.high_water[table] = self._cap(max(self.known[table].values(), default=None), now)
+        self.relationships = self._read_relationships()
+
+    def file_signature(self)-> tuple[tuple[int, int]|None, ...]:
+        """ Returns the modification time and size of the database and its -wal file (None if a file does not exist). """
+        signature = []
+        for location in (self.file_location, self.file_location.with_name(f"{self.file_location.name}-wal")):
+            try:
+                stat = os.stat(location)
+            except FileNotFoundError:
+                signature.append(None)
+                continue
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def subscribe(self, subscriber: Subscriber)-> typing.Callable[[], None]:
+        """ Calls subscriber with the list of ChangeEvents whenever something changes (on the polling thread if start was used).
+
+        Returns:
+            typing.Callable[[], None]: A function which unsubscribes subscriber.
+        """
+        self.subscribers.append(subscriber)
+        return lambda: self.subscribers.remove(subscriber)
+
+    def poll(self, force: bool = False)-> list[ChangeEvent]:
+        """ Checks for changes and notifies the subscribers of any.
+
+        Args:
+            force (bool, optional): Query the database even if its files have not changed. Defaults to False.
+
+        Returns:
+            list[ChangeEvent]: The changes since the last poll.
+        """
+        with self._lock:
+            signature = self.file_signature()
+            if signature == self._signature and not force:
+                return []
+            self._signature = signature
+            events = self._changes()
+        if events:
+            for subscriber in list(self.subscribers):
+                subscriber(events)
+        return events
+
+    def start(self):
+        """ Polls every interval seconds on a daemon thread until stop is called. """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="EdgeCollectionsEditor.watch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def close(self):
+        self.stop()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def _read_relationships(self)-> dict[RelationshipKey, int]:
+        return {(item_id, parent_id): position for item_id, parent_id, position in
+                self.conn.execute("SELECT item_id, parent_id, position FROM collections_items_relationship")}
+
+    def _read_rows(self, table: Tables, ids: list[str])-> typing.Iterator[sqlite3.Row]:
+        for chunk in utils.chunked(ids, utils.max_variables(self.conn)):
+            with utils.RowFactory(self.conn):
+                cursor = self.conn.execute(f"SELECT * FROM {table.value} WHERE id IN ({', '.join('?'*len(chunk))})", chunk)
+            yield from cursor
+
+    @staticmethod
+    def _cap(high_water: float|None, now: float)-> float|None:
+        return None if high_water is None else min(high_water, now - HIGH_WATER_MARGIN)
+
+    def _changes(self)-> list[ChangeEvent]:
+        events = []
+        now = utils.edge_timestamp()
+        for table in self.TABLES:
+            known = self.known[table]
+            added, modified, rows = [], [], {}
+            high_water = self.high_water[table]
+            ## Rows at or after the high-water mark are read again (see HIGH_WATER_MARGIN); those which have not changed are skipped
+            with utils.RowFactory(self.conn):
+                if high_water is None:
+                    cursor = self.conn.execute(f"SELECT * FROM {table.value}")
+                else:
+                    cursor = self.conn.execute(f"SELECT * FROM {table.value} WHERE date_modified >= ?", (high_water,))
+            for row in utils.iter_rows(cursor):
+                id, date_modified = row["id"], row["date_modified"]
+                if id not in known:
+                    added.append(id)
+                elif known[id] != date_modified:
+                    modified.append(id)
+                else:
+                    continue
+                known[id] = date_modified
+                rows[id] = row
+                if high_water is None or date_modified > high_water:
+                    high_water = date_modified
+            self.high_water[table] = self._cap(high_water, now)
+            ## Deleted rows, and rows added with a date_modified before the high-water mark, are not found by date, so the
+            ##  ids are compared whenever the row count shows that the cache is missing something
+            removed = []
+            if self.conn.execute(f"SELECT count(*) FROM {table.value}").fetchone()[0] != len(known):
+                ids = {row[0] for row in self.conn.execute(f"SELECT id FROM {table.value}")}
+                removed = [id for id in known if id not in ids]
+                for id in removed:
+                    del known[id]
+                missing = [id for id in ids if id not in known]
+                for row in self._read_rows(table, missing):
+                    added.append(row["id"])
+                    known[row["id"]] = row["date_modified"]
+                    rows[row["id"]] = row
+            if added or modified or removed:
+                events.append(ChangeEvent(table, added, modified, removed, rows))
+
+        relationships = self._read_relationships()
+        added = [key for key in relationships if key not in self.relationships]
+        removed = [key for key in self.relationships if key not in relationships]
+        modified = [key for key, position in relationships.items() if key in self.relationships and self.relationships[key] != position]
+        self.relationships = relationships
+        if added or modified or removed:
+            events.append(ChangeEvent(Tables.COLLECTIONS_ITEMS_RELATIONSHIP, added, modified, removed, {}))
+        return events
@@ -0,0 +1,28 @@
+""" Times link_items_to_collections against synthetic databases of increasing size.
+
+    python benchmarks/link_items_to_collections.py [SIZE ...]
+"""
+import pathlib
+import sys
+import tempfile
+import time
+
+import EdgeCollectionsEditor as ECE
+from EdgeCollectionsEditor import synthetic
+
+def main(sizes: list[int]):
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            location = pathlib.Path(directory) / f"collections{size}"
+            synthetic.build_database(location, size, collections=100, image_size=0, thumbnail_size=0, text_size=0)
+            conn, _ = ECE.connect_to_db(location)
+            items = ECE.list_items(conn)
+            start = time.perf_counter()
+            linked = ECE.link_items_to_collections(conn, items)
+            elapsed = time.perf_counter() - start
+            relationships = sum(len(item["collections_items_relationships"]) for item in linked)
+            print(f"{size:>8} items  {relationships:>8} relationships  {elapsed:8.3f}s")
+            conn.close()
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [1_000, 10_000, 100_000])
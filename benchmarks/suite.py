@@ -0,0 +1,348 @@
+""" Times the library, the utils converters, the command line and the GUI's data loading against synthetic databases
+    (see EdgeCollectionsEditor.synthetic), and saves the results as JSON.
+
+    python benchmarks/suite.py [--sizes SIZE ...] [--repeat N] [--output FILE] [--compare FILE] [--databases DIRECTORY]
+
+Each benchmark is run repeat times and its min, median and max are saved under its size and name. With --compare, the
+    minimums are compared with those of an earlier results file and the exit code is 1 if any got more than TOLERANCE slower.
+"""
+import argparse
+import collections
+import datetime
+import inspect
+import json
+import os
+import pathlib
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import typing
+
+import EdgeCollectionsEditor as ECE
+from EdgeCollectionsEditor import decoding, synthetic, utils
+
+## The directory containing the EdgeCollectionsEditor package which is being benchmarked
+PACKAGE_ROOT = pathlib.Path(ECE.__file__).resolve().parent.parent
+GROUPS = ("library", "converters", "cli", "gui")
+## A minimum this much slower than in the compared results is a regression
+TOLERANCE = 0.2
+## Differences smaller than this many seconds are noise, whatever the ratio
+NOISE = 0.001
+## The number of rows the converters are timed on
+CONVERTER_ROWS = 10_000
+
+class Context(typing.NamedTuple):
+    location: pathlib.Path
+    conn: sqlite3.Connection
+    ## The collection with the most items
+    collection: sqlite3.Row
+    item: sqlite3.Row
+    items: list[sqlite3.Row]
+
+def consume(result: typing.Any)-> typing.Any:
+    """ Exhausts iterators, so that streaming functions are timed for all of their rows. """
+    if isinstance(result, typing.Iterator):
+        collections.deque(result, maxlen=0)
+    return result
+
+def rolled_back(function: typing.Callable[[Context], object])-> typing.Callable[[Context], object]:
+    """ Wraps a function which edits the database so that its changes are rolled back after each run. """
+    def run(context: Context):
+        try:
+            return function(context)
+        finally:
+            context.conn.rollback()
+    return run
+
+## The benchmarks of the functions of EdgeCollectionsEditor/__init__.py; functions missing from here are reported when the suite runs
+LIBRARY: dict[str, typing.Callable[[Context], object]] = {
+    "connect_to_db": lambda c: ECE.connect_to_db(c.location)[0].close(),
+    "check_syncable_collections": lambda c: ECE.check_syncable_collections(c.conn),
+    "get_table": lambda c: ECE.get_table(c.conn, ECE.Tables.ITEMS),
+    "get_table(lazy)": lambda c: ECE.get_table(c.conn, ECE.Tables.ITEMS, lazy=True),
+    "iter_table": lambda c: ECE.iter_table(c.conn, ECE.Tables.ITEMS),
+    "iter_table(lazy)": lambda c: ECE.iter_table(c.conn, ECE.Tables.ITEMS, lazy=True),
+    "list_collections": lambda c: ECE.list_collections(c.conn),
+    "get_collection_by_id": lambda c: ECE.get_collection_by_id(c.conn, c.collection["id"]),
+    "get_collections_by_title": lambda c: ECE.get_collections_by_title(c.conn, c.collection["title"]),
+    "get_collections_by_title_like": lambda c: ECE.get_collections_by_title_like(c.conn, "guide"),
+    "delete_collection": rolled_back(lambda c: ECE.delete_collection(c.conn, c.collection["id"])),
+    "edit_collection_title": rolled_back(lambda c: ECE.edit_collection_title(c.conn, c.collection["id"], "Benchmark")),
+    "list_items": lambda c: ECE.list_items(c.conn),
+    "iter_items": lambda c: ECE.iter_items(c.conn),
+    "get_item_by_id": lambda c: ECE.get_item_by_id(c.conn, c.item["id"]),
+    "get_items_by_title": lambda c: ECE.get_items_by_title(c.conn, c.item["title"]),
+    "get_items_by_title_like": lambda c: ECE.get_items_by_title_like(c.conn, "guide"),
+    "iter_items_by_title_like": lambda c: ECE.iter_items_by_title_like(c.conn, "guide"),
+    "get_items_by_collection": lambda c: ECE.get_items_by_collection(c.conn, c.collection["id"]),
+    "iter_items_by_collection": lambda c: ECE.iter_items_by_collection(c.conn, c.collection["id"]),
+    "link_items_to_collections": lambda c: ECE.link_items_to_collections(c.conn, c.items),
+}
+
+## converter -> the table and column it decodes
+CONVERTERS: dict[str, tuple[ECE.Tables, str]] = {
+    "convert_tag": (ECE.Tables.ITEMS, "tag"),
+    "convert_thumbnail": (ECE.Tables.COLLECTIONS, "thumbnail"),
+    "convert_canonical_image_data": (ECE.Tables.ITEMS, "canonical_image_data"),
+    "convert_entity_blob": (ECE.Tables.ITEMS, "entity_blob"),
+    "convert_source": (ECE.Tables.ITEMS, "source"),
+    "convert_third_party_data": (ECE.Tables.ITEMS, "third_party_data"),
+}
+
+## Arguments of python -m EdgeCollectionsEditor -f LOCATION ...; {directory} is a new empty directory for each run
+CLI: dict[str, list[str]] = {
+    "sample": [],
+    "sample(table)": ["-t", "items", "-l", "5"],
+    "sample(like)": ["-t", "items", "-c", "title", "-v", "guide", "--like"],
+    "sample(query)": ["-t", "items", "-w", "title~guide", "--modified", "2020-01-01..", "-o", "date_modified:desc", "-l", "10", "--columns", "id", "title"],
+    "search": ["search", "guide", "--index", "{directory}/index.db"],
+    "export": ["export", "{directory}/export"],
+    "stats": ["stats"],
+    "dedupe(exact)": ["dedupe", "--exact"],
+    "dedupe": ["dedupe"],
+    "blobs": ["blobs"],
+    "profile-size": ["profile-size"],
+    "compact": ["compact", "{directory}/compact.db"],
+    "diff": ["diff", "{location}", "{location}"],
+}
+
+def measure(function: typing.Callable[[], object], repeat: int)-> dict[str, typing.Any]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        consume(function())
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "max": max(times), "repeat": repeat}
+
+def missing_library_functions()-> list[str]:
+    """ Returns the public functions of EdgeCollectionsEditor/__init__.py which have no benchmark in LIBRARY. """
+    benchmarked = {name.split("(")[0] for name in LIBRARY}
+    return [name for name, obj in vars(ECE).items() if inspect.isfunction(obj) and obj.__module__ == ECE.__name__
+            and not name.startswith("_") and name not in benchmarked]
+
+def library_benchmarks(context: Context, repeat: int)-> dict[str, dict]:
+    return {f"library.{name}": measure(lambda: function(context), repeat) for name, function in LIBRARY.items()}
+
+def converter_benchmarks(context: Context, repeat: int)-> dict[str, dict]:
+    """ Times each converter on up to CONVERTER_ROWS rows, clearing the decode cache before each run, and bytes_to_json
+        on the items' blobs.
+    """
+    results = {}
+    for name, (table, column) in CONVERTERS.items():
+        converter = getattr(utils, name)
+        with utils.RowFactory(context.conn):
+            rows = context.conn.execute(f"SELECT id, date_modified, {column} FROM {table.value} LIMIT ?", (CONVERTER_ROWS,)).fetchall()
+        def run():
+            decoding.default_cache.clear()
+            for row in rows:
+                converter(row)
+        results[f"converters.{name}"] = measure(run, repeat) | {"rows": len(rows)}
+    decoding.default_cache.clear()
+
+    ## Serial and parallel decoding of decoding.PARALLEL_THRESHOLD values (if the database has that many): parallel decoding
+    ##  is only worth starting at the threshold if decode_many(processes) is the faster of the two
+    with utils.RowFactory(context.conn):
+        rows = context.conn.execute("SELECT id, date_modified, entity_blob FROM items LIMIT ?", (decoding.PARALLEL_THRESHOLD,)).fetchall()
+    processes = max(2, decoding.available_cpus())
+    results["converters.decode_many"] = measure(lambda: decoding.decode_many(rows, "entity_blob", cache=None, processes=1), repeat) | {"rows": len(rows)}
+    results["converters.decode_many(processes)"] = measure(lambda: decoding.decode_many(rows, "entity_blob", cache=None, processes=processes, threshold=0),
+                                                           repeat) | {"rows": len(rows), "processes": processes}
+
+    with utils.RowFactory(context.conn):
+        rows = context.conn.execute("SELECT id, source, entity_blob, canonical_image_data FROM items LIMIT ?", (CONVERTER_ROWS,)).fetchall()
+    dicts = list(utils.rows_to_dict(*rows))
+    results["converters.bytes_to_json"] = measure(lambda: json.dumps(dicts, default=utils.bytes_to_json), repeat) | {"rows": len(dicts)}
+    return results
+
+def cli_benchmarks(context: Context, repeat: int)-> dict[str, dict]:
+    """ Times each command in a new interpreter, as a user would run it. Failed commands are recorded with their error. """
+    environment = os.environ | {"PYTHONPATH": os.pathsep.join(filter(None, [str(PACKAGE_ROOT), os.environ.get("PYTHONPATH")]))}
+    results = {}
+    for name, arguments in CLI.items():
+        def run():
+            with tempfile.TemporaryDirectory() as directory:
+                command = [sys.executable, "-m", "EdgeCollectionsEditor", "-f", str(context.location),
+                           *(argument.format(directory=directory, location=context.location) for argument in arguments)]
+                subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=environment)
+        try:
+            results[f"cli.{name}"] = measure(run, repeat)
+        except subprocess.CalledProcessError as e:
+            error = e.stderr.decode(errors="replace").strip().splitlines()
+            results[f"cli.{name}"] = {"error": error[-1] if error else f"exit status {e.returncode}"}
+    return results
+
+class HeadlessListbox:
+    """ Stands in for gui.widgets.VirtualListbox, so that CollectionViewer can run without a display. """
+    def __init__(self):
+        self.labels: typing.Sequence[str] = []
+        self.view: typing.Sequence[int] = []
+        self.selection: list[int] = []
+
+    def set_labels(self, labels: typing.Sequence[str]):
+        self.labels = labels
+
+    def set_view(self, view: typing.Sequence[int], keep_offset: bool = False):
+        self.view = view
+
+    def curselection(self)-> list[int]:
+        return self.selection
+
+class HeadlessVar:
+    """ Stands in for tk.StringVar. """
+    def __init__(self, value: str = ""):
+        self.value = value
+
+    def get(self)-> str:
+        return self.value
+
+    def set(self, value: str):
+        self.value = value
+
+class HeadlessPreview:
+    """ Stands in for gui.preview.PreviewPane. """
+    def show(self, row):
+        pass
+
+def headless_viewer(conn: sqlite3.Connection):
+    """ Returns a gui.CollectionViewer whose Tk widgets are replaced by stand-ins (None if tkinter is not installed). """
+    try:
+        from EdgeCollectionsEditor import gui
+    except ImportError:
+        return None
+    viewer = gui.CollectionViewer.__new__(gui.CollectionViewer)
+    viewer.parent = types.SimpleNamespace(db=conn)
+    viewer.library = None
+    viewer.data = {"collections": [], "items": []}
+    viewer.searchkeys = {"collection": [], "item": []}
+    viewer.collectionitems = {}
+    viewer.lastfilter = {}
+    viewer.pendingfilter = {}
+    viewer.positions = {"collection": {}, "item": {}}
+    viewer.removed = {"collection": set(), "item": set()}
+    viewer.collectionlist, viewer.itemlist = HeadlessListbox(), HeadlessListbox()
+    viewer.collectionfilter, viewer.itemfilter = HeadlessVar(), HeadlessVar()
+    viewer.itemselection = set()
+    viewer.preview = HeadlessPreview()
+    return viewer
+
+def gui_benchmarks(context: Context, repeat: int)-> dict[str, dict]:
+    viewer = headless_viewer(context.conn)
+    if viewer is None:
+        return {"gui.load_data": {"error": "tkinter is not installed"}}
+    results = {"gui.load_data": measure(viewer.load_data, repeat)}
+    viewer.itemfilter.set("guide")
+    def applyfilter():
+        viewer.lastfilter = {}
+        viewer.applyfilter("item")
+    results["gui.applyfilter"] = measure(applyfilter, repeat)
+    from EdgeCollectionsEditor.gui import preview
+    ## Reading, decoding and downscaling the images of 100 items (what a preview worker does)
+    ids = [item["id"] for item in context.items[:100]]
+    results["gui.read_preview"] = measure(lambda: [preview.read_preview(context.conn, ECE.Tables.ITEMS, id) for id in ids], repeat)
+    return results
+
+BENCHMARKS = {"library": library_benchmarks, "converters": converter_benchmarks, "cli": cli_benchmarks, "gui": gui_benchmarks}
+
+def load_context(location: pathlib.Path)-> Context:
+    conn, location = ECE.connect_to_db(location)
+    with utils.RowFactory(conn):
+        collection = conn.execute("""SELECT collections.* FROM collections JOIN collections_items_relationship ON collections.id = parent_id
+                                  GROUP BY collections.id ORDER BY count(*) DESC LIMIT 1""").fetchone()
+        item = conn.execute("SELECT * FROM items LIMIT 1").fetchone()
+    return Context(location, conn, collection, item, ECE.list_items(conn))
+
+def database(directory: pathlib.Path, size: int)-> pathlib.Path:
+    """ Returns the synthetic database with size items in directory, building it if it does not exist. """
+    location = directory / f"collections{size}.db"
+    if not location.exists():
+        print(f"Building {location}")
+        synthetic.build_database(location, size)
+    return location
+
+def commit()-> str|None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=PACKAGE_ROOT, capture_output=True, check=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(sizes: list[int], repeat: int, directory: pathlib.Path, groups: typing.Sequence[str] = GROUPS)-> dict[str, typing.Any]:
+    results = {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "sizes": {},
+    }
+    for size in sizes:
+        context = load_context(database(directory, size))
+        try:
+            timings = results["sizes"][str(size)] = {}
+            for group in groups:
+                print(f"{size} items: {group}")
+                timings.update(BENCHMARKS[group](context, repeat))
+        finally:
+            context.conn.close()
+    return results
+
+def compare(previous: dict[str, typing.Any], current: dict[str, typing.Any], tolerance: float = TOLERANCE)-> list[tuple[str, str, float, float]]:
+    """ Prints the minimums of the benchmarks in both results and returns the regressions as (size, name, previous, current). """
+    regressions = []
+    for size, timings in current["sizes"].items():
+        for name, timing in timings.items():
+            before = previous["sizes"].get(size, {}).get(name)
+            if not before or "min" not in before or "min" not in timing:
+                continue
+            ratio = timing["min"] / before["min"] if before["min"] else float("inf")
+            if abs(timing["min"] - before["min"]) < NOISE:
+                flag = ""
+            else:
+                flag = "SLOWER" if ratio > 1 + tolerance else "faster" if ratio < 1 / (1 + tolerance) else ""
+            print(f"{size:>8} {name:<45} {before['min']:10.4f}s {timing['min']:10.4f}s {ratio:6.2f}x {flag}")
+            if flag == "SLOWER":
+                regressions.append((size, name, before["min"], timing["min"]))
+    return regressions
+
+def print_results(results: dict[str, typing.Any]):
+    for size, timings in results["sizes"].items():
+        for name, timing in timings.items():
+            if "error" in timing:
+                print(f"{size:>8} {name:<45} error: {timing['error']}")
+            else:
+                print(f"{size:>8} {name:<45} {timing['min']:10.4f}s (median {timing['median']:.4f}s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark EdgeCollectionsEditor against synthetic databases")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1_000, 10_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--output", type=pathlib.Path, default=None, help="Where to save the results (JSON)")
+    parser.add_argument("--compare", type=pathlib.Path, default=None, help="Earlier results to compare with")
+    parser.add_argument("--databases", type=pathlib.Path, default=None, help="Keep the synthetic databases here, to reuse them between runs")
+    args = parser.parse_args()
+
+    if (missing := missing_library_functions()):
+        print(f"No benchmark for: {', '.join(missing)}")
+    if args.databases is not None:
+        args.databases.mkdir(parents=True, exist_ok=True)
+        results = run_suite(args.sizes, args.repeat, args.databases, args.groups)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results = run_suite(args.sizes, args.repeat, pathlib.Path(directory), args.groups)
+    print_results(results)
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.compare is not None:
+        regressions = compare(json.loads(args.compare.read_text()), results)
+        if regressions:
+            print(f"{len(regressions)} regression(s)")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,11 @@ setuptools.setup(
     install_requires=[
         
     ],
-    python_requires=">=3.8",
-    packages=setuptools.find_packages()
+    extras_require={
+        "analytics": ["numpy"],
+        "preview": ["Pillow"],
+    },
+    python_requires=">=3.11",
+    packages=setuptools.find_packages(exclude=["tests", "tests.*"]),
+    package_data={"EdgeCollectionsEditor": ["tables.sql"]},
 )
\ No newline at end of file
@@ -0,0 +1,49 @@
+""" Fixtures shared by the tests, built on small synthetic databases (see synthetic.build_database). """
+import pathlib
+import shutil
+import sqlite3
+import typing
+
+import pytest
+
+from EdgeCollectionsEditor import connect_to_db, synthetic, utils
+
+## The size of the test databases: large enough for several batches and chunks, small enough to build in well under a second
+ITEMS = 300
+
+@pytest.fixture(scope="session")
+def template(tmp_path_factory: pytest.TempPathFactory)-> pathlib.Path:
+    """ The synthetic database, built once per session. Tests use copies of it (see database). """
+    location = tmp_path_factory.mktemp("template") / "collectionsSQLite"
+    synthetic.build_database(location, items=ITEMS, image_size=256, thumbnail_size=256, text_size=200)
+    return location
+
+@pytest.fixture
+def database(template: pathlib.Path, tmp_path: pathlib.Path)-> pathlib.Path:
+    """ A copy of the synthetic database which the test may change. """
+    location = tmp_path / template.name
+    shutil.copyfile(template, location)
+    return location
+
+@pytest.fixture
+def conn(database: pathlib.Path)-> typing.Iterator[sqlite3.Connection]:
+    conn, _ = connect_to_db(database)
+    yield conn
+    conn.close()
+
+def add_item(conn: sqlite3.Connection, id: str, date_modified: float|None = None, collection: str|None = None, **columns)-> None:
+    """ Inserts (and commits) an item, optionally into collection. date_modified defaults to now. """
+    if date_modified is None:
+        date_modified = utils.edge_timestamp()
+    columns = {"id": id, "date_created": date_modified, "date_modified": date_modified} | columns
+    conn.execute(f"INSERT INTO items ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", list(columns.values()))
+    if collection is not None:
+        conn.execute("""INSERT INTO collections_items_relationship (item_id, parent_id, position)
+                     SELECT ?, ?, coalesce(max(position) + 1, 0) FROM collections_items_relationship WHERE parent_id = ?""", (id, collection, collection))
+    conn.commit()
+
+def delete_item(conn: sqlite3.Connection, id: str)-> None:
+    """ Deletes (and commits) an item and its relationships. """
+    conn.execute("DELETE FROM collections_items_relationship WHERE item_id = ?", (id,))
+    conn.execute("DELETE FROM items WHERE id = ?", (id,))
+    conn.commit()
@@ -0,0 +1,90 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+import EdgeCollectionsEditor as ECE
+from EdgeCollectionsEditor import aio
+from tests.conftest import ITEMS
+
+## Takes seconds unless it is interrupted
+SLOW_QUERY = "WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter WHERE x < 20000000) SELECT count(*) FROM counter"
+
+def test_concurrent_calls(database, conn):
+    async def main():
+        async with aio.Database(database, workers=2) as db:
+            collections, items, item = await asyncio.gather(db.list_collections(), db.list_items(), db.get_item_by_id("missing"))
+            streamed = [tuple(row) async for row in db.iter_items(batch_size=64)]
+        return collections, items, item, streamed
+    collections, items, item, streamed = asyncio.run(main())
+    assert [tuple(row) for row in collections] == [tuple(row) for row in ECE.list_collections(conn)]
+    assert [tuple(row) for row in items] == [tuple(row) for row in ECE.list_items(conn)] and len(items) == ITEMS
+    assert item is None
+    assert sorted(streamed) == sorted(tuple(row) for row in items)
+
+def test_mutation_commits(database, conn):
+    collection = ECE.list_collections(conn)[0]["id"]
+    async def main():
+        async with aio.Database(database, workers=1) as db:
+            await db.edit_collection_title(collection, "Async title")
+    asyncio.run(main())
+    assert ECE.get_collection_by_id(conn, collection)["title"] == "Async title"
+
+def test_stream_closed_early(database):
+    async def main():
+        async with aio.Database(database, workers=1) as db:
+            stream = db.iter_items(batch_size=10)
+            rows = [await stream.__anext__() for _ in range(15)]
+            stream_conn, = db._streams
+            await stream.aclose()
+            ## With one worker, the stream's connection has been closed (by _close_stream) before the next job runs
+            assert len(await db.list_items()) == ITEMS
+            assert not db._streams
+            with pytest.raises(sqlite3.ProgrammingError):
+                stream_conn.execute("SELECT 1")
+        return rows
+    assert len(asyncio.run(main())) == 15
+
+def test_cancel_running_query(database, conn):
+    item = ECE.list_items(conn)[0]["id"]
+    started = threading.Event()
+    errors = []
+    def edit_then_wait(db_conn: sqlite3.Connection):
+        db_conn.execute("UPDATE items SET title = 'Cancelled' WHERE id = ?", (item,))
+        started.set()
+        try:
+            db_conn.execute(SLOW_QUERY).fetchone()
+        except sqlite3.OperationalError as e:
+            errors.append(e)
+            raise
+
+    async def main():
+        async with aio.Database(database, workers=1) as db:
+            task = asyncio.create_task(db.run(edit_then_wait, commit=True))
+            await asyncio.to_thread(started.wait, 10)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            ## The worker is free again once the query has been interrupted
+            return await asyncio.wait_for(db.get_item_by_id(item), 10)
+    row = asyncio.run(main())
+    assert errors and "interrupted" in str(errors[0])
+    assert row["title"] != "Cancelled"
+    assert ECE.get_item_by_id(conn, item)["title"] == row["title"]
+
+def test_cancel_waiting_call(database):
+    release = threading.Event()
+    ran = []
+    async def main():
+        async with aio.Database(database, workers=1) as db:
+            blocker = asyncio.create_task(db.run(lambda _: release.wait(10)))
+            waiting = asyncio.create_task(db.run(lambda _: ran.append(True)))
+            await asyncio.sleep(0.05)
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+            release.set()
+            await blocker
+    asyncio.run(main())
+    assert not ran
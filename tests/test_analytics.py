@@ -0,0 +1,62 @@
+import collections
+import datetime
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from EdgeCollectionsEditor import analytics
+from tests.conftest import ITEMS, add_item
+
+def ms(*date: int)-> float:
+    """ Returns the date_created/date_modified value of a UTC date. """
+    return datetime.datetime(*date, tzinfo=datetime.timezone.utc).timestamp() * 1000
+
+def test_time_histogram():
+    timestamps = np.array([ms(2024, 1, 31, 23), ms(2024, 1, 1), ms(2024, 4, 15), ms(2024, 4, 1)])
+    starts, counts = analytics.time_histogram(timestamps, "month")
+    assert [str(start) for start in starts] == ["2024-01", "2024-02", "2024-03", "2024-04"]
+    assert counts.tolist() == [2, 0, 0, 2]
+    starts, counts = analytics.time_histogram(timestamps, "year")
+    assert ([str(start) for start in starts], counts.tolist()) == (["2024"], [4])
+    assert analytics.time_histogram(timestamps, "day")[1].sum() == 4
+    assert [len(array) for array in analytics.time_histogram(np.empty(0), "week")] == [0, 0]
+    with pytest.raises(ValueError):
+        analytics.time_histogram(timestamps, "fortnight")
+
+def test_growth_curve():
+    starts, totals = analytics.growth_curve(np.array([ms(2023, 12, 5), ms(2024, 2, 1), ms(2024, 2, 2)]))
+    assert [str(start) for start in starts] == ["2023-12", "2024-01", "2024-02"]
+    assert totals.tolist() == [1, 1, 3]
+
+def test_collection_sizes():
+    memberships = analytics.Memberships(["a", "b", "c"], ["A", "B", "C"], np.array([2, 0, 2, -1, 2, 0], dtype="i4"))
+    ## Ties keep the collections' order, and unknown collections are not counted
+    assert analytics.collection_sizes(memberships) == [("c", "C", 3), ("a", "A", 2), ("b", "B", 0)]
+
+def test_stale_items():
+    now = ms(2024, 6, 1)
+    day = 86_400_000
+    items = analytics.ItemColumns(rowid=np.array([10, 11, 12, 13]), date_created=np.zeros(4),
+                                  date_modified=np.array([now - 40 * day, now - day, now - 100 * day, now - 31 * day]),
+                                  type=np.zeros(4, dtype="i4"), is_syncable=np.zeros(4, dtype="i1"), types=["website"])
+    assert analytics.stale_items(items, 30, now).tolist() == [12, 10, 13]
+    assert analytics.stale_items(items, 365, now).tolist() == []
+
+def test_summary(conn):
+    now = ms(2030, 1, 1)
+    add_item(conn, "ancient", ms(2001, 1, 1), type=None, is_syncable=None)
+    result = analytics.summary(conn, period="year", stale_days=365 * 20, now=now)
+    rows = conn.execute("SELECT type, is_syncable, date_created FROM items").fetchall()
+    assert result["items"] == len(rows) == ITEMS + 1
+    assert result["types"] == dict(collections.Counter(type for type, *_ in rows))
+    assert result["syncable"] == sum(1 for _, syncable, _ in rows if syncable == 1)
+    assert result["collections"] == conn.execute("SELECT count(*) FROM collections").fetchone()[0]
+    assert result["relationships"] == conn.execute("SELECT count(*) FROM collections_items_relationship").fetchone()[0]
+    assert result["orphaned_relationships"] == 0
+    assert sum(size for *_, size in result["collection_sizes"]) == result["relationships"]
+    assert result["created_per_period"][0] == ("2001", 1) and result["growth"][-1][1] == ITEMS + 1
+    assert sum(count for _, count in result["created_per_period"]) == ITEMS + 1
+    ## Only the item modified in 2001 is more than 20 years old
+    rowid = conn.execute("SELECT rowid FROM items WHERE id = 'ancient'").fetchone()[0]
+    assert result["stale_items"] == 1 and result["stale_rowids"].tolist() == [rowid]
@@ -0,0 +1,126 @@
+import sqlite3
+import tempfile
+import pathlib
+
+import pytest
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import batch
+
+def dump(conn: sqlite3.Connection)-> dict[str, list[tuple]]:
+    """ Returns every row of the tables a batch can change, in a comparable order. """
+    return {table.value: sorted(map(tuple, conn.execute(f"SELECT * FROM {table.value}")), key=repr) for table in batch.JOURNAL_KEYS}
+
+def memberships(conn: sqlite3.Connection, item_id: str)-> dict[str, int]:
+    return dict(conn.execute("SELECT parent_id, position FROM collections_items_relationship WHERE item_id = ?", (item_id,)))
+
+@pytest.fixture
+def ids(conn):
+    collections = [row[0] for row in conn.execute("SELECT id FROM collections ORDER BY position")]
+    items = [row[0] for row in conn.execute("SELECT id FROM items ORDER BY date_created")]
+    return collections, items
+
+def test_apply_and_undo(conn, ids, tmp_path):
+    collections, items = ids
+    before = dump(conn)
+    editor = batch.BatchEditor(conn)
+    editor.rename_collection(collections[0], "Renamed")
+    editor.set_flag(Tables.ITEMS, items[0], Items.IS_MARKED_FOR_DELETION.value, True)
+    target = next(collection for collection in collections if collection not in memberships(conn, items[1]))
+    editor.move_item(items[1], None, target)
+    editor.delete_item(items[2])
+    editor.delete_collection(collections[1])
+    assert len(editor) == 5
+    journal = editor.apply(tmp_path / "journal")
+    assert journal == tmp_path / "journal" and journal.is_file()
+    assert len(editor) == 0
+
+    assert conn.execute("SELECT title FROM collections WHERE id = ?", (collections[0],)).fetchone()[0] == "Renamed"
+    assert conn.execute("SELECT is_marked_for_deletion FROM items WHERE id = ?", (items[0],)).fetchone()[0] == 1
+    assert target in memberships(conn, items[1])
+    for table, column in (("items", "id"), ("items_sync", "item_id"), ("collections_items_relationship", "item_id"), ("comments", "parent_id")):
+        assert conn.execute(f"SELECT count(*) FROM {table} WHERE {column} = ?", (items[2],)).fetchone()[0] == 0
+    assert conn.execute("SELECT count(*) FROM collections_items_relationship WHERE parent_id = ?", (collections[1],)).fetchone()[0] == 0
+
+    editor.undo()
+    assert dump(conn) == before
+
+def test_undo_journal(conn, ids):
+    _, items = ids
+    before = dump(conn)
+    editor = batch.BatchEditor(conn)
+    editor.delete_item(items[0])
+    journal = editor.apply()
+    try:
+        assert journal.is_file()
+        batch.undo_journal(conn, journal)
+        assert dump(conn) == before
+    finally:
+        journal.unlink()
+
+def test_apply_without_journal(conn, ids, monkeypatch):
+    collections, _ = ids
+    monkeypatch.setattr(tempfile, "mkstemp", lambda *args, **kwargs: pytest.fail("A journal was created"))
+    editor = batch.BatchEditor(conn)
+    editor.rename_collection(collections[0], "No journal")
+    assert editor.apply(journal=False) is None
+    assert conn.execute("SELECT title FROM collections WHERE id = ?", (collections[0],)).fetchone()[0] == "No journal"
+    assert conn.execute("PRAGMA database_list").fetchall()[-1][1] == "main"
+    with pytest.raises(RuntimeError):
+        editor.undo()
+    with pytest.raises(ValueError):
+        editor.apply(pathlib.Path("journal"), journal=False)
+
+def test_moves_keep_their_order(conn, ids):
+    collections, items = ids
+    item = items[0]
+    others = [collection for collection in collections if collection not in memberships(conn, item)]
+    first, second = others[:2]
+    editor = batch.BatchEditor(conn)
+    editor.move_item(item, None, first)
+    editor.move_item(item, first, second)
+    editor.move_item(items[1], None, second, position=-5)
+    editor.apply(journal=False)
+    assert first not in memberships(conn, item)
+    positions = dict(conn.execute("SELECT item_id, position FROM collections_items_relationship WHERE parent_id = ?", (second,)))
+    ## Appended after the last item, and at the given position
+    assert positions[item] == max(position for id, position in positions.items() if id != items[1]) and positions[item] > 0
+    assert positions[items[1]] == -5
+
+def test_failed_apply_rolls_back(conn, ids, tmp_path):
+    collections, items = ids
+    before = dump(conn)
+    editor = batch.BatchEditor(conn)
+    editor.rename_collection(collections[0], "Rolled back")
+    ## The move fails, after the rename has been applied
+    editor.move_item(items[0], None, collections[0])
+    conn.execute("CREATE TRIGGER fail BEFORE INSERT ON collections_items_relationship BEGIN SELECT RAISE(ABORT, 'fail'); END")
+    conn.commit()
+    with pytest.raises(sqlite3.IntegrityError):
+        editor.apply(tmp_path / "journal")
+    assert not (tmp_path / "journal").exists()
+    assert dump(conn) == before
+    assert len(editor) == 2
+
+def test_locked_database(conn, database, ids, tmp_path):
+    collections, _ = ids
+    conn.execute("PRAGMA busy_timeout = 0")
+    isolation_level = conn.isolation_level
+    editor = batch.BatchEditor(conn)
+    editor.rename_collection(collections[0], "Renamed")
+    ## Another connection (e.g. Edge) holds the write lock, so BEGIN IMMEDIATE fails
+    other = sqlite3.connect(database)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        for _ in range(2):
+            with pytest.raises(sqlite3.OperationalError, match="locked"):
+                editor.apply(tmp_path / "journal")
+            assert not (tmp_path / "journal").exists()
+            assert [row[1] for row in conn.execute("PRAGMA database_list")] == ["main"]
+            assert conn.isolation_level == isolation_level
+    finally:
+        other.rollback()
+        other.close()
+    assert len(editor) == 1
+    editor.apply(tmp_path / "journal")
+    assert conn.execute("SELECT title FROM collections WHERE id = ?", (collections[0],)).fetchone()[0] == "Renamed"
@@ -0,0 +1,39 @@
+import sqlite3
+
+import pytest
+
+import EdgeCollectionsEditor as ECE
+
+@pytest.fixture
+def opened(monkeypatch)-> list[sqlite3.Connection]:
+    """ Records the connections connect_to_db opens. """
+    connections = []
+    connect = sqlite3.connect
+    def recording(*args, **kwargs):
+        connections.append(connect(*args, **kwargs))
+        return connections[-1]
+    monkeypatch.setattr(ECE.sqlite3, "connect", recording)
+    return connections
+
+def test_invalid_temp_store_is_rejected_before_connecting(database, opened):
+    with pytest.raises(ValueError, match="temp_store"):
+        ECE.connect_to_db(database, temp_store="disk")
+    assert opened == []
+
+def test_connection_is_closed_if_pragmas_fail(database, opened):
+    with pytest.raises(ValueError):
+        ECE.connect_to_db(database, cache_size="lots")
+    [conn] = opened
+    with pytest.raises(sqlite3.ProgrammingError, match="closed"):
+        conn.execute("SELECT 1")
+
+def test_pragmas(database):
+    conn, location = ECE.connect_to_db(database, temp_store="memory", cache_size=-1024, query_only=True)
+    try:
+        assert location == database
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -1024
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            conn.execute("DELETE FROM items")
+    finally:
+        conn.close()
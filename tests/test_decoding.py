@@ -0,0 +1,29 @@
+import concurrent.futures
+import json
+
+import pytest
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import decoding, utils
+
+@pytest.fixture
+def rows(conn):
+    with utils.RowFactory(conn):
+        return conn.execute("SELECT id, date_modified, entity_blob FROM items").fetchall()
+
+def test_decode_many(rows):
+    cache = decoding.DecodeCache()
+    expected = [json.loads(row["entity_blob"]) for row in rows]
+    assert decoding.decode_many(rows, "entity_blob", Tables.ITEMS, cache=cache, processes=1) == expected
+    assert len(cache) == len(rows) and cache.hits == 0
+    assert decoding.decode_many(rows, "entity_blob", Tables.ITEMS, cache=cache, processes=1) == expected
+    assert cache.hits == len(rows)
+
+def test_decode_many_in_processes(rows):
+    expected = [json.loads(row["entity_blob"]) for row in rows]
+    assert decoding.decode_many(rows, "entity_blob", cache=None, processes=2, threshold=0) == expected
+
+def test_decode_many_is_serial_on_one_cpu(rows, monkeypatch):
+    monkeypatch.setattr(decoding, "available_cpus", lambda: 1)
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", lambda *args, **kwargs: pytest.fail("Started worker processes"))
+    assert decoding.decode_many(rows, "entity_blob", cache=None, threshold=0) == [json.loads(row["entity_blob"]) for row in rows]
@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+from EdgeCollectionsEditor import batch, dedupe, synthetic
+from tests.conftest import add_item
+
+def memberships(conn: sqlite3.Connection)-> set[tuple[str, str]]:
+    return set(conn.execute("SELECT item_id, parent_id FROM collections_items_relationship"))
+
+def test_normalize_url():
+    assert dedupe.normalize_url("http://www.Example.com:80/a/?utm_source=x&b=2&a=1#top") == "https://example.com/a?a=1&b=2"
+    assert dedupe.normalize_url("https://example.com:8443/a") == "https://example.com:8443/a"
+    assert dedupe.normalize_url("  ") is None
+
+def test_normalize_url_malformed():
+    ## Neither may raise: one bad url must not abort a whole run
+    assert dedupe.normalize_url("http://user@www.Host:abc/a/") == "https://host:abc/a"
+    assert dedupe.normalize_url("http://[::1/a") is None
+
+def test_find_duplicates_with_malformed_urls(conn):
+    add_item(conn, "bad port", remote_url="http://host:abc/")
+    add_item(conn, "bad port copy", remote_url="http://host:abc")
+    add_item(conn, "bad ipv6", remote_url="http://[::1/")
+    clusters = dedupe.find_duplicates(conn, near=False)
+    assert ["bad port", "bad port copy"] in [sorted(cluster.items) for cluster in clusters]
+
+def test_clusters_do_not_overlap(conn):
+    ## The synthetic items share paragraphs of text, so there are near-duplicates; copy some urls for exact ones too
+    for index, (url,) in enumerate(conn.execute("SELECT remote_url FROM items LIMIT 10").fetchall()):
+        add_item(conn, f"copy {index}", remote_url=url)
+    clusters = dedupe.find_duplicates(conn)
+    assert {cluster.kind for cluster in clusters} == {"exact", "near"}
+    items = [id for cluster in clusters for id in cluster.items]
+    assert len(items) == len(set(items))
+
+def test_queue_deletes_keeps_every_membership(conn):
+    for index, (url,) in enumerate(conn.execute("SELECT remote_url FROM items LIMIT 10").fetchall()):
+        add_item(conn, f"copy {index}", remote_url=url, collection=conn.execute("SELECT id FROM collections LIMIT 1").fetchone()[0])
+    clusters = dedupe.find_duplicates(conn)
+    editor = batch.BatchEditor(conn)
+    deleted = dedupe.queue_deletes(editor, clusters)
+    assert deleted == sum(len(cluster.items) - 1 for cluster in clusters)
+    before = memberships(conn)
+    survivors = {id: next(kept for kept in cluster.items if kept not in editor.deleted_items) for cluster in clusters for id in cluster.items}
+    editor.apply(journal=False)
+    after = memberships(conn)
+    assert {(survivors.get(item, item), collection) for item, collection in before} == after
+
+@pytest.fixture
+def empty(tmp_path):
+    location = tmp_path / "empty.db"
+    synthetic.build_database(location, items=0, collections=2)
+    conn = sqlite3.connect(location)
+    yield conn
+    conn.close()
+
+def test_exact_and_near_duplicate_of_the_same_item(empty):
+    """ B is an exact duplicate of A and a near-duplicate of C, which is in another collection. """
+    k1, k2 = [row[0] for row in empty.execute("SELECT id FROM collections ORDER BY id")]
+    text = " ".join(f"word{index}" for index in range(60))
+    add_item(empty, "B", 1, k1, date_created=1, remote_url="https://x.example.com/", text_content=text)
+    add_item(empty, "A", 0.5, k1, date_created=0.5, remote_url="https://x.example.com/", text_content="something else entirely")
+    add_item(empty, "C", 2, k2, date_created=2, remote_url="https://c.example.com/", text_content=text.replace("word30", "other"))
+
+    clusters = dedupe.find_duplicates(empty)
+    assert [(cluster.kind, cluster.items) for cluster in clusters] == [("near", ["A", "B", "C"])]
+    editor = batch.BatchEditor(empty)
+    assert dedupe.queue_deletes(editor, clusters) == 2
+    editor.apply(journal=False)
+    assert memberships(empty) == {("A", k1), ("A", k2)}
+
+def test_queue_deletes_skips_deleted_kept_items(empty):
+    """ Overlapping clusters (e.g. from separate runs) never keep an item another cluster deletes. """
+    k1, k2 = [row[0] for row in empty.execute("SELECT id FROM collections ORDER BY id")]
+    for id, created, collection in (("A", 0.5, k1), ("B", 1, k1), ("C", 2, k2)):
+        add_item(empty, id, created, collection, date_created=created)
+    exact = dedupe.DuplicateCluster("exact", ["A", "B"], [None, None], {"A": [k1], "B": [k1]})
+    near = dedupe.DuplicateCluster("near", ["B", "C"], [None, None], {"B": [k1], "C": [k2]})
+    editor = batch.BatchEditor(empty)
+    assert dedupe.queue_deletes(editor, [exact, near]) == 1
+    editor.apply(journal=False)
+    assert memberships(empty) == {("A", k1), ("C", k2)}
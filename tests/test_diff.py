@@ -0,0 +1,77 @@
+import sqlite3
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import diff
+from tests.conftest import add_item, delete_item
+
+def test_identical(template):
+    results = diff.diff_databases(template, template)
+    assert set(results) == set(Tables)
+    assert not any(results.values())
+    assert sum(result.changed_buckets for result in results.values()) == 0
+
+def test_diff_databases(template, database):
+    conn = sqlite3.connect(database)
+    try:
+        removed, modified, touched, unchanged = [row[0] for row in conn.execute("SELECT id FROM items ORDER BY id LIMIT 4")]
+        delete_item(conn, removed)
+        add_item(conn, "added")
+        conn.execute("UPDATE items SET title = 'Modified', date_modified = date_modified + 1 WHERE id = ?", (modified,))
+        ## Only found when every column is compared
+        conn.execute("UPDATE items SET title = 'Touched' WHERE id = ?", (touched,))
+        item, parent = conn.execute("SELECT item_id, parent_id FROM collections_items_relationship WHERE item_id = ?", (unchanged,)).fetchone()
+        conn.execute("UPDATE collections_items_relationship SET position = position + 100 WHERE item_id = ? AND parent_id = ?", (item, parent))
+        conn.commit()
+    finally:
+        conn.close()
+
+    results = diff.diff_databases(template, database, tables=[Tables.ITEMS, Tables.COLLECTIONS_ITEMS_RELATIONSHIP, Tables.COLLECTIONS])
+    items = results[Tables.ITEMS]
+    assert (items.added, items.removed, items.modified) == (["added"], [removed], [modified])
+    assert 0 < items.changed_buckets < items.buckets
+    relationships = results[Tables.COLLECTIONS_ITEMS_RELATIONSHIP]
+    assert relationships.modified == [(parent, item)]
+    assert all(key[1] == removed for key in relationships.removed) and relationships.removed
+    assert not results[Tables.COLLECTIONS]
+
+    items = diff.diff_databases(template, database, tables=[Tables.ITEMS], shortcut=False)[Tables.ITEMS]
+    assert items.modified == sorted([modified, touched])
+    ## Fewer, larger buckets find the same rows
+    assert diff.diff_databases(template, database, tables=[Tables.ITEMS], bits=4)[Tables.ITEMS][:4] == results[Tables.ITEMS][:4]
+
+def test_keys_with_shared_endings_are_spread(template, database):
+    ## Urls all end in "/", so bucketing by their last characters put them all in one bucket
+    conn = sqlite3.connect(database)
+    try:
+        conn.executemany("INSERT INTO favicons (url, data) VALUES (?, ?)", ((f"https://site{i}.example.com/", b"icon") for i in range(500)))
+        conn.commit()
+        old = database.with_name("old")
+        conn.execute("VACUUM INTO ?", (str(old),))
+        conn.execute("UPDATE favicons SET data = x'00' WHERE url = 'https://site7.example.com/'")
+        conn.commit()
+    finally:
+        conn.close()
+    favicons = diff.diff_databases(old, database, tables=[Tables.FAVICONS], shortcut=False)[Tables.FAVICONS]
+    assert favicons.modified == ["https://site7.example.com/"]
+    assert favicons.buckets > 200 and favicons.changed_buckets == 1
+
+def test_missing_table(template, database):
+    conn = sqlite3.connect(database)
+    try:
+        prism = conn.execute("SELECT count(*) FROM collections_prism").fetchone()[0]
+        conn.execute("INSERT INTO collections_prism (id, date_modified, title) VALUES ('prism', 0, 'Prism')")
+        conn.execute("DROP TABLE comments")
+        conn.commit()
+        old = database.with_name("old")
+        conn.execute("VACUUM INTO ?", (str(old),))
+        conn.execute("DROP TABLE collections_prism")
+        conn.commit()
+    finally:
+        conn.close()
+    results = diff.diff_databases(old, database, tables=[Tables.COLLECTIONS_PRISM, Tables.COMMENTS, Tables.ITEMS])
+    prism_diff = results[Tables.COLLECTIONS_PRISM]
+    assert len(prism_diff.removed) == prism + 1 and "prism" in prism_diff.removed and not prism_diff.added
+    assert prism_diff.exists == (True, False)
+    assert not results[Tables.COMMENTS] and results[Tables.COMMENTS].exists == (False, False)
+    assert not results[Tables.ITEMS] and results[Tables.ITEMS].exists == (True, True)
+    assert diff.diff_databases(database, old, tables=[Tables.COLLECTIONS_PRISM])[Tables.COLLECTIONS_PRISM].added == prism_diff.removed
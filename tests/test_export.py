@@ -0,0 +1,47 @@
+import base64
+import json
+import sqlite3
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import export
+from tests.conftest import add_item, delete_item
+
+def read_export(location)-> list[dict]:
+    with open(location, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_export_database(database, conn, tmp_path):
+    results = export.export_database(database, tmp_path / "export", tables=[Tables.ITEMS, Tables.FAVICONS])
+    location, rows = results[Tables.ITEMS]
+    exported = read_export(location)
+    assert rows == len(exported) == conn.execute("SELECT count(*) FROM items").fetchone()[0]
+    first = conn.execute("SELECT id, source FROM items WHERE id = ?", (exported[0]["id"],)).fetchone()
+    assert base64.b64decode(exported[0]["source"]["$base64"]) == first[1]
+
+def test_export_database_is_one_snapshot(database, conn, tmp_path, monkeypatch):
+    """ The database changes while the tables are exported one after another; the export must not see the changes. """
+    collection = conn.execute("SELECT id FROM collections LIMIT 1").fetchone()[0]
+    removed = conn.execute("SELECT item_id FROM collections_items_relationship LIMIT 1").fetchone()[0]
+    export_table = export.export_table
+    def edit_then_export(*args, **kwargs):
+        if not calls:
+            ## On the pool's worker thread, which cannot use conn
+            writer = sqlite3.connect(database)
+            delete_item(writer, removed)
+            add_item(writer, "added", collection=collection)
+            writer.close()
+        calls.append(args[1])
+        return export_table(*args, **kwargs)
+    calls = []
+    monkeypatch.setattr(export, "export_table", edit_then_export)
+
+    tables = [Tables.COLLECTIONS_ITEMS_RELATIONSHIP, Tables.ITEMS]
+    results = export.export_database(database, tmp_path / "export", tables=tables, workers=1)
+    relationships = read_export(results[Tables.COLLECTIONS_ITEMS_RELATIONSHIP][0])
+    items = {row["id"] for row in read_export(results[Tables.ITEMS][0])}
+    assert calls == tables
+    assert removed in items and "added" not in items
+    assert {row["item_id"] for row in relationships} <= items
+    assert any(row["item_id"] == removed for row in relationships)
+    ## The snapshot is deleted
+    assert not list((tmp_path / "export").glob("*.db"))
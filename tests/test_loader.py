@@ -0,0 +1,45 @@
+import gc
+import sqlite3
+
+import pytest
+
+pytest.importorskip("tkinter")
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor.gui import loader
+from tests.conftest import ITEMS, add_item
+
+def run(instance: loader.Loader)-> list[loader.Message]:
+    instance.start()
+    assert instance.finished.wait(30)
+    return list(instance.drain())
+
+def test_load(database):
+    messages = run(loader.Loader(database, backup=False, batch_size=64))
+    library = messages[-1].value
+    assert messages[-1].kind == "library"
+    assert len(library.items) == ITEMS
+    assert sum(len(message.value) for message in messages if message.kind == "items") == ITEMS
+
+def test_load_does_not_freeze(database, monkeypatch):
+    monkeypatch.setattr(gc, "freeze", lambda: pytest.fail("gc.freeze was called on the worker"))
+    assert run(loader.Loader(database, backup=False, batch_size=64))[-1].kind == "library"
+
+def test_watcher_sees_changes_made_while_loading(database, monkeypatch):
+    load = loader.Loader._load
+    def load_then_edit(self):
+        library = load(self)
+        conn = sqlite3.connect(database)
+        add_item(conn, "during load")
+        conn.close()
+        return library
+    monkeypatch.setattr(loader.Loader, "_load", load_then_edit)
+    instance = loader.Loader(database, backup=False, watch_changes=True)
+    try:
+        messages = run(instance)
+        assert messages[-1].kind == "library"
+        assert "during load" not in {item.id for item in messages[-1].value.items}
+        events = {event.table: event for event in instance.watcher.poll(force=True)}
+        assert events[Tables.ITEMS].added == ["during load"]
+    finally:
+        instance.watcher.close()
@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+from EdgeCollectionsEditor import connect_to_db, mirror
+from tests.conftest import add_item
+
+def title(conn: sqlite3.Connection, id: str)-> str|None:
+    row = conn.execute("SELECT title FROM items WHERE id = ?", (id,)).fetchone()
+    return row and row[0]
+
+@pytest.fixture
+def item(conn):
+    return conn.execute("SELECT id FROM items ORDER BY date_created").fetchone()[0]
+
+def test_commit_writes_back(database, conn, item):
+    copy = mirror.open_mirror(database)
+    try:
+        assert {"ece_mirror_relationship_parent", "ece_mirror_items_title"} <= {row[0] for row in copy.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        copy.execute("UPDATE items SET title = 'Mirrored' WHERE id = ?", (item,))
+        copy.execute("DELETE FROM collections_items_relationship WHERE item_id = ?", (item,))
+        ## Nothing reaches the source before commit
+        assert title(conn, item) != "Mirrored"
+        copy.commit()
+        assert copy.pending() == 0
+        assert title(conn, item) == "Mirrored"
+        assert conn.execute("SELECT count(*) FROM collections_items_relationship WHERE item_id = ?", (item,)).fetchone()[0] == 0
+
+        copy.execute("UPDATE items SET title = 'Rolled back' WHERE id = ?", (item,))
+        copy.rollback()
+        assert copy.pending() == 0 and title(copy, item) == "Mirrored"
+
+        with copy:
+            copy.execute("UPDATE items SET title = 'With block' WHERE id = ?", (item,))
+        assert title(conn, item) == "With block"
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    finally:
+        copy.close()
+
+def test_refresh(database, conn, item):
+    copy = mirror.open_mirror(database)
+    try:
+        add_item(conn, "added-to-source")
+        assert title(copy, "added-to-source") is None
+        copy.refresh()
+        assert copy.execute("SELECT count(*) FROM items WHERE id = 'added-to-source'").fetchone()[0] == 1
+        ## Changes are still tracked after a refresh
+        copy.execute("UPDATE items SET title = 'After refresh' WHERE id = ?", (item,))
+        copy.commit_mirror()
+        with pytest.raises(RuntimeError):
+            copy.refresh()
+        copy.write_back()
+        assert title(conn, item) == "After refresh"
+    finally:
+        copy.close()
+
+def test_read_only(database, conn, item):
+    copy, _ = connect_to_db(database, mode="ro", mirror="file")
+    temporary = copy.temporary
+    assert isinstance(copy, mirror.MirrorConnection) and temporary.is_file()
+    try:
+        ## Writes fail at once rather than on commit
+        with pytest.raises(sqlite3.OperationalError):
+            copy.execute("UPDATE items SET title = 'x' WHERE id = ?", (item,))
+        assert copy.pending() == 0
+        add_item(conn, "added-to-source")
+        copy.refresh()
+        assert copy.execute("SELECT count(*) FROM items WHERE id = 'added-to-source'").fetchone()[0] == 1
+        with pytest.raises(sqlite3.OperationalError):
+            copy.execute("DELETE FROM items")
+    finally:
+        copy.close()
+    assert not temporary.exists()
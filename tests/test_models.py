@@ -0,0 +1,82 @@
+import sqlite3
+import tracemalloc
+
+import pytest
+
+import EdgeCollectionsEditor as ECE
+from EdgeCollectionsEditor import models
+from tests.conftest import ITEMS, add_item
+
+def allocated(func)-> tuple[int, object]:
+    """ Returns the bytes allocated (and kept) by func, and its result. """
+    tracemalloc.start()
+    try:
+        result = func()
+        return tracemalloc.get_traced_memory()[0], result
+    finally:
+        tracemalloc.stop()
+
+def test_model_row_access():
+    item = models.Item(id="a", title="Title")
+    assert item["title"] == item.title == "Title" and item.keys() == ["id", "title"] and item.to_dict() == {"id": "a", "title": "Title"}
+    with pytest.raises(KeyError):
+        item["date_modified"]
+    with pytest.raises(KeyError):
+        item["nope"]
+    with pytest.raises(AttributeError):
+        item.nope = 1
+    assert not hasattr(item, "__dict__")
+
+def test_identity(conn):
+    identity = models.IdentityMap(conn)
+    items = list(identity.load(models.Item, columns=["id", "title"]))
+    assert len(items) == len(identity) == ITEMS
+    item = items[0]
+    assert identity.get(models.Item, item.id) is item
+    assert next(identity.load(models.Item, "WHERE id = ?", (item.id,))) is item
+    assert identity.get(models.Item, "missing") is None
+    library = models.Library.load(conn, identity=identity)
+    assert library.items[library.item_index[item.id]] is item
+    ## Relationships have no id, so they are not mapped
+    assert list(identity.load(models.Relationship, "LIMIT 1"))[0] is not list(identity.load(models.Relationship, "LIMIT 1"))[0]
+
+def test_add_updates_in_place(conn):
+    identity = models.IdentityMap(conn)
+    item = identity.add(models.Item, {"id": "a", "title": "Old", "remote_url": "https://example.com"})
+    assert identity.add(models.Item, {"id": "a", "title": "New", "unknown": 1}) is item
+    assert (item.title, item.remote_url) == ("New", "https://example.com") and not hasattr(item, "unknown")
+    ## Loading the row again refreshes the object everyone holds
+    add_item(conn, "reloaded", title="Before")
+    reloaded = identity.get(models.Item, "reloaded")
+    conn.execute("UPDATE items SET title = 'After' WHERE id = 'reloaded'")
+    conn.commit()
+    assert identity.get(models.Item, "reloaded").title == "Before"
+    assert list(identity.load(models.Item, "WHERE id = 'reloaded'")) == [reloaded] and reloaded.title == "After"
+    identity.clear()
+    assert len(identity) == 0 and identity.get(models.Item, "reloaded") is not reloaded
+
+def test_library_matches_link_items_to_collections(conn):
+    library = models.Library.load(conn, collection_columns=["id", "title"], item_columns=["id", "title"])
+    linked = ECE.link_items_to_collections(conn, ECE.list_items(conn))
+    assert len(linked) == len(library.items) == ITEMS
+    for item in linked:
+        model = library.items[library.item_index[item["id"]]]
+        parents = [relationship["parent_id"] for relationship in item["collections_items_relationships"]]
+        assert sorted(collection.id for collection in library.collections_of(model)) == sorted(parents)
+    for collection in library.collections:
+        positions = conn.execute("SELECT item_id FROM collections_items_relationship WHERE parent_id = ? ORDER BY position", (collection.id,))
+        assert [item.id for item in library.items_of(collection)] == [row[0] for row in positions]
+    relationships = sorted((relationship.item_id, relationship.parent_id, relationship.position) for relationship in library.relationships())
+    assert relationships == sorted(conn.execute("SELECT item_id, parent_id, position FROM collections_items_relationship"))
+
+def test_library_memory(conn):
+    ## The rows the GUI used to hold: the collections and the items linked to their collections
+    conn.row_factory = sqlite3.Row
+    old, _ = allocated(lambda: (ECE.list_collections(conn), ECE.link_items_to_collections(conn, ECE.list_items(conn))))
+    new, _ = allocated(lambda: models.Library.load(conn, collection_columns=["id", "title"], item_columns=["id", "title"]))
+    assert new * 2 < old
+    ## A model object alone (without its values, which are shared here) takes well under half of the equivalent dict
+    rows = [dict(zip(models.Item.COLUMNS, range(len(models.Item.COLUMNS)))) for _ in range(1000)]
+    objects, _ = allocated(lambda: [models.Item.from_row(row) for row in rows])
+    dicts, _ = allocated(lambda: [dict(row) for row in rows])
+    assert objects * 2 < dicts
@@ -0,0 +1,73 @@
+import base64
+import json
+import struct
+import zlib
+
+import pytest
+
+pytest.importorskip("tkinter")
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor.gui import preview
+from tests.conftest import add_item
+
+def png(width: int, height: int)-> bytes:
+    """ Returns a valid greyscale PNG of the given size. """
+    def chunk(kind: bytes, data: bytes)-> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    pixels = zlib.compress(b"".join(b"\x00" + bytes(width) for _ in range(height)))
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)) + chunk(b"IDAT", pixels) + chunk(b"IEND", b"")
+
+def gif(width: int, height: int)-> bytes:
+    """ Returns a GIF header (enough for image_size) of the given size. """
+    return b"GIF89a" + struct.pack("<HH", width, height) + b"\x00\x00\x00;"
+
+def wrapped(data: bytes)-> bytes:
+    """ Wraps image data the way Edge stores thumbnails and canonical images. """
+    return json.dumps({"mimeType": "image/png", "data": base64.b64encode(data).decode("ascii")}).encode()
+
+@pytest.fixture
+def no_pillow(monkeypatch):
+    monkeypatch.setattr(preview, "Image", None)
+
+def test_unwrap_image():
+    image = png(4, 3)
+    assert preview.unwrap_image(image) == image
+    assert preview.unwrap_image(gif(1, 1)) == gif(1, 1)
+    assert preview.unwrap_image(wrapped(image)) == image
+    ## Anything else is returned as it is
+    for raw in (b"\xff\xd8\xff\xe0 jpeg", b'{"data": "not base64!"}', b'{"mimeType": "image/png"}', b"[1, 2]"):
+        assert preview.unwrap_image(raw) == raw
+
+def test_image_size():
+    assert preview.image_size(png(300, 20)) == (300, 20)
+    assert preview.image_size(gif(640, 480)) == (640, 480)
+    assert preview.image_size(b"\xff\xd8\xff\xe0 jpeg") is None
+    assert preview.image_size(png(1, 1)[:20]) is None
+
+def test_decode_image_without_pillow(no_pillow):
+    small = preview.decode_image(png(100, 50))
+    assert (small.subsample, small.message) == (1, None) and base64.b64decode(small.data) == png(100, 50)
+    ## Subsampled by the smallest factor which fits both dimensions within size
+    assert preview.decode_image(png(1000, 300), (256, 256)).subsample == 4
+    assert preview.decode_image(gif(200, 513), (256, 256)).subsample == 3
+    assert preview.decode_image(b"\xff\xd8\xff\xe0 jpeg").message == "Only PNG and GIF images can be previewed without Pillow"
+
+def test_read_preview(conn, no_pillow):
+    conn.execute("INSERT INTO favicons (url, data) VALUES ('https://example.com/favicon.gif', ?)", (gif(16, 16),))
+    add_item(conn, "image", canonical_image_data=wrapped(png(512, 256)), favicon_url="https://example.com/favicon.gif")
+    ## An image which cannot be decoded (or none) falls back to the favicon
+    add_item(conn, "favicon", canonical_image_data=b"\xff\xd8\xff\xe0 jpeg", favicon_url="https://example.com/favicon.gif")
+    add_item(conn, "no-image", canonical_image_data=None, favicon_url="https://example.com/favicon.gif")
+    add_item(conn, "nothing", canonical_image_data=None, favicon_url="https://example.com/missing.ico")
+    image = preview.read_preview(conn, Tables.ITEMS, "image")
+    assert base64.b64decode(image.data) == png(512, 256) and image.subsample == 2
+    for id in ("favicon", "no-image"):
+        assert base64.b64decode(preview.read_preview(conn, Tables.ITEMS, id).data) == gif(16, 16)
+    assert preview.read_preview(conn, Tables.ITEMS, "nothing").message == "No image"
+    assert preview.read_preview(conn, Tables.ITEMS, "missing").message == "Not found"
+
+    collection = conn.execute("SELECT id FROM collections LIMIT 1").fetchone()[0]
+    conn.execute("UPDATE collections SET thumbnail = ? WHERE id = ?", (wrapped(png(64, 64)), collection))
+    conn.commit()
+    assert base64.b64decode(preview.read_preview(conn, Tables.COLLECTIONS, collection).data) == png(64, 64)
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+import EdgeCollectionsEditor as ECE
+from EdgeCollectionsEditor import profiling, utils
+from tests.conftest import ITEMS
+
+@pytest.fixture
+def profiler():
+    profiler = profiling.enable()
+    yield profiler
+    profiling.disable()
+
+def test_normalize_sql():
+    assert profiling.normalize_sql("SELECT *\n  FROM items WHERE id = 'a''b' AND date_modified > 1.5e3 AND x = X'00'") == \
+        "SELECT * FROM items WHERE id = ? AND date_modified > ? AND x = ?"
+    ## Lists of any length are grouped together
+    assert profiling.normalize_sql("SELECT * FROM items WHERE id IN ('a', 'b', 'c')") == "SELECT * FROM items WHERE id IN (?, ...)"
+    assert profiling.normalize_sql("SELECT * FROM items WHERE id IN (?,?)") == "SELECT * FROM items WHERE id IN (?, ...)"
+    ## Digits in names are not literals
+    assert profiling.normalize_sql("SELECT * FROM t2 WHERE c1 = 2") == "SELECT * FROM t2 WHERE c1 = ?"
+
+def test_full_scans():
+    plan = ["SCAN items", "SCAN TABLE comments", "SEARCH favicons USING INDEX sqlite_autoindex_favicons_1 (url=?)",
+            "SCAN collections USING COVERING INDEX x", "USE TEMP B-TREE FOR ORDER BY"]
+    assert profiling.full_scans(plan) == ["items", "comments"]
+
+def test_enable_is_idempotent(profiler):
+    assert profiling.enable() is profiler and profiling.profiler is profiler
+    assert profiling.disable() is profiler and profiling.profiler is None and profiling.stats() is None
+
+def test_profiled_calls(profiler, conn):
+    ## connect_to_db attaches connections opened while profiling is enabled
+    profiled, _ = ECE.connect_to_db(conn.execute("PRAGMA database_list").fetchone()[2])
+    try:
+        assert len(ECE.list_items(profiled)) == ITEMS
+        assert len(list(ECE.iter_items(profiled, batch_size=64))) == ITEMS
+        ## A stream closed early counts the rows consumed
+        stream = ECE.iter_items(profiled, batch_size=64)
+        for _ in range(10):
+            next(stream)
+        stream.close()
+        assert ECE.get_item_by_id(profiled, "missing") is None
+        with utils.RowFactory(profiled, "block"):
+            profiled.execute("SELECT count(*) FROM collections").fetchone()
+    finally:
+        profiled.close()
+    stats = profiling.stats()
+    json.dumps(stats)
+
+    calls = stats["calls"]
+    assert (calls["EdgeCollectionsEditor.list_items"]["calls"], calls["EdgeCollectionsEditor.list_items"]["rows"]) == (1, ITEMS)
+    assert (calls["EdgeCollectionsEditor.iter_items"]["calls"], calls["EdgeCollectionsEditor.iter_items"]["rows"]) == (2, ITEMS + 10)
+    assert calls["EdgeCollectionsEditor.get_item_by_id"]["calls"] == 1 and calls["block"]["calls"] == 1
+    assert sum(calls["EdgeCollectionsEditor.iter_items"]["histogram"].values()) == 2
+
+    scans = {statement["sql"]: statement for statement in stats["statements"]}
+    items = scans["SELECT id, title FROM items"]
+    assert items["executions"] == 3 and items["full_scans"] == ["items"]
+    assert items["callers"] == {"EdgeCollectionsEditor.list_items": 1, "EdgeCollectionsEditor.iter_items": 2}
+    ## A lookup by primary key is not flagged
+    by_id = next(statement for sql, statement in scans.items() if sql.endswith("FROM items WHERE id = ?"))
+    assert by_id["plan"] and not by_id["full_scans"]
+    report = profiler.report()
+    assert "EdgeCollectionsEditor.list_items" in report and "FULL SCAN: items" in report
@@ -0,0 +1,72 @@
+import datetime
+import subprocess
+import sys
+
+import pytest
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import query, tags
+from tests.conftest import ITEMS, add_item
+
+def test_parse_filter():
+    assert query.parse_filter("title~python") == query.Filter("title", "~", "python")
+    assert query.parse_filter(" date_modified >=17") == query.Filter("date_modified", ">=", "17")
+    ## The longest operator wins, and the value may contain operators
+    assert query.parse_filter("title!=a=b") == query.Filter("title", "!=", "a=b")
+    assert query.parse_filter("title<=x") == query.Filter("title", "<=", "x")
+    with pytest.raises(ValueError):
+        query.parse_filter("title")
+
+def test_parse_order():
+    assert query.parse_order("title") == query.Order("title")
+    assert query.parse_order("date_modified:DESC") == query.Order("date_modified", True)
+    with pytest.raises(ValueError):
+        query.parse_order("title:up")
+
+def test_date_range():
+    day = datetime.date(2024, 3, 1)
+    start = datetime.datetime(2024, 3, 1).timestamp() * 1000
+    assert query.date_range("date_created", day.isoformat()) == [query.Filter("date_created", ">=", start),
+                                                                  query.Filter("date_created", "<", start + 86_400_000)]
+    assert query.date_range("date_modified", "2024-03-01..") == [query.Filter("date_modified", ">=", start)]
+    assert query.date_range("date_modified", "..1700000000000") == [query.Filter("date_modified", "<", 1700000000000.0)]
+    assert query.date_range("date_modified", "..") == []
+    with pytest.raises(ValueError):
+        query.date_range("title", "2024-03-01")
+    with pytest.raises(ValueError):
+        query.date_range("date_created", "March")
+
+def test_select_clause():
+    q = query.Query(Tables.ITEMS, filters=[query.Filter("title", "~", "py"), query.Filter("date_modified", ">", 5)],
+                    order_by=[query.Order("date_modified", True), query.Order("title")], limit=10, offset=20)
+    assert query.select_clause(q) == ("FROM items WHERE title LIKE ? AND date_modified > ? ORDER BY date_modified DESC, title LIMIT ? OFFSET ?",
+                                      ["%py%", 5, 10, 20])
+    ## An offset alone needs LIMIT -1
+    assert query.select_clause(query.Query(Tables.ITEMS, offset=5)) == ("FROM items LIMIT ? OFFSET ?", [-1, 5])
+    for invalid in (query.Query(Tables.ITEMS, limit=-1), query.Query(Tables.ITEMS, filters=[query.Filter("nope", "=", 1)]),
+                    query.Query(Tables.ITEMS, order_by=[query.Order("nope")]), query.Query(Tables.ITEMS, filters=[query.Filter("title", "==", 1)]),
+                    query.Query(Tables.META, tag_filters=[tags.parse_tag_filter("read")])):
+        with pytest.raises(ValueError):
+            query.select_clause(invalid)
+
+def test_select_and_count(conn):
+    add_item(conn, "first", 1.0, title="Query target one")
+    add_item(conn, "second", 2.0, title="Query target two", tag='{"read": false}')
+    q = query.Query(Tables.ITEMS, columns=["id", "title"], filters=[query.parse_filter("title~query target")],
+                    order_by=[query.parse_order("date_modified:desc")])
+    rows = list(query.select(conn, q, batch_size=1))
+    assert [tuple(row) for row in rows] == [("second", "Query target two"), ("first", "Query target one")]
+    assert rows[0].keys() == ["id", "title"]
+    assert [row["id"] for row in query.select(conn, q._replace(limit=1, offset=1))] == ["first"]
+    assert query.count(conn, q._replace(limit=1)) == 2
+    assert query.count(conn, q._replace(tag_filters=[tags.parse_tag_filter("read=false")])) == 1
+    assert query.count(conn, query.Query(Tables.ITEMS)) == ITEMS + 2
+    with pytest.raises(ValueError):
+        list(query.select(conn, q._replace(columns=["nope"])))
+
+@pytest.mark.parametrize("arguments", [["--where", "nope=1"], ["--order_by", "nope"], ["--columns", "nope"], ["--where", "title"]])
+def test_cli_reports_invalid_arguments(database, arguments):
+    result = subprocess.run([sys.executable, "-m", "EdgeCollectionsEditor", "-f", str(database), "-t", "items", *arguments],
+                            capture_output=True, text=True)
+    assert result.returncode == 2
+    assert "error: Invalid" in result.stderr and "Traceback" not in result.stderr
@@ -0,0 +1,89 @@
+import subprocess
+import sys
+
+import pytest
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import search, utils
+from tests.conftest import ITEMS, add_item, delete_item
+
+def indexed_ids(index, kind: Tables = Tables.ITEMS)-> set[str]:
+    return {row[0] for row in index.execute("SELECT id FROM documents WHERE kind = ?", (kind.value,))}
+
+def test_refresh_index(database, conn):
+    index = search.connect_index(database)
+    try:
+        results = search.refresh_index(index, batch_size=64)
+        assert results[Tables.ITEMS] == (ITEMS, 0)
+        collections = conn.execute("SELECT count(*) FROM collections").fetchone()[0]
+        assert results[Tables.COLLECTIONS] == (collections, 0)
+        ## Nothing has changed
+        assert search.refresh_index(index) == {Tables.ITEMS: (0, 0), Tables.COLLECTIONS: (0, 0)}
+        ## Every row's rowid matches its text
+        for id, title in conn.execute("SELECT id, title FROM items LIMIT 20"):
+            assert index.execute("""SELECT search.title FROM search JOIN documents ON documents.rowid = search.rowid
+                                 WHERE documents.kind = 'items' AND documents.id = ?""", (id,)).fetchone()[0] == title
+    finally:
+        index.close()
+
+def test_refresh_index_finds_older_dated_and_deleted_rows(database, conn):
+    index = search.connect_index(database)
+    try:
+        search.refresh_index(index)
+        high_water = index.execute("SELECT date_modified FROM high_water WHERE kind = 'items'").fetchone()[0]
+        ## A row restored with a date far older than the high-water mark, and one on the boundary
+        add_item(conn, "restored", high_water - 365 * 86_400_000, title="zanzibar restored")
+        add_item(conn, "boundary", high_water, title="boundary quokka")
+        deleted = conn.execute("SELECT id FROM items LIMIT 1").fetchone()[0]
+        delete_item(conn, deleted)
+        ## A change just below the high-water mark (e.g. committed late)
+        late = conn.execute("SELECT id FROM items WHERE id NOT IN ('restored', 'boundary') LIMIT 1").fetchone()[0]
+        conn.execute("UPDATE items SET title = 'late wombat', date_modified = ? WHERE id = ?", (high_water - utils.HIGH_WATER_MARGIN / 2, late))
+        conn.commit()
+
+        assert search.refresh_index(index)[Tables.ITEMS] == (3, 1)
+        assert indexed_ids(index) == {row[0] for row in conn.execute("SELECT id FROM items")}
+        assert [row["id"] for row in search.search(index, "zanzibar")] == ["restored"]
+        assert [row["id"] for row in search.search(index, "quokka")] == ["boundary"]
+        assert [row["id"] for row in search.search(index, "wombat")] == [late]
+        assert search.refresh_index(index)[Tables.ITEMS] == (0, 0)
+    finally:
+        index.close()
+
+def test_refresh_index_compares_ids_only_when_needed(database, conn):
+    index = search.connect_index(database)
+    try:
+        search.refresh_index(index)
+        statements = []
+        index.set_trace_callback(statements.append)
+        assert search.refresh_index(index) == {Tables.ITEMS: (0, 0), Tables.COLLECTIONS: (0, 0)}
+        index.set_trace_callback(None)
+        assert not any("NOT EXISTS" in statement for statement in statements)
+
+        ## A deletion and an older-dated insert cancel out in the counts, so only a full refresh notices them
+        high_water = index.execute("SELECT date_modified FROM high_water WHERE kind = 'items'").fetchone()[0]
+        deleted = conn.execute("SELECT id FROM items LIMIT 1").fetchone()[0]
+        delete_item(conn, deleted)
+        add_item(conn, "restored", high_water - 365 * 86_400_000, title="zanzibar restored")
+        assert search.refresh_index(index)[Tables.ITEMS] == (0, 0)
+        assert search.refresh_index(index, full=True)[Tables.ITEMS] == (1, 1)
+        assert indexed_ids(index) == {row[0] for row in conn.execute("SELECT id FROM items")}
+    finally:
+        index.close()
+
+def test_search_reports_invalid_raw_queries(database):
+    index = search.connect_index(database)
+    try:
+        search.refresh_index(index)
+        assert search.search(index, "title: AND", raw=False) == []
+        for text in ("AND", '"unterminated', "nope: word"):
+            with pytest.raises(ValueError, match="Invalid FTS5 query"):
+                search.search(index, text, raw=True)
+    finally:
+        index.close()
+
+def test_cli_reports_invalid_raw_queries(database):
+    result = subprocess.run([sys.executable, "-m", "EdgeCollectionsEditor", "-f", str(database), "search", "--raw", "AND"],
+                            capture_output=True, text=True)
+    assert result.returncode == 2
+    assert "error: Invalid FTS5 query" in result.stderr and "Traceback" not in result.stderr
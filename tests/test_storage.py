@@ -0,0 +1,99 @@
+import hashlib
+import sqlite3
+
+import pytest
+
+import EdgeCollectionsEditor as ECE
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import storage
+
+IMAGES = (Tables.ITEMS, Items.CANONICAL_IMAGE_DATA.value)
+
+def images(conn: sqlite3.Connection)-> dict[str, bytes|None]:
+    return dict(conn.execute("SELECT id, canonical_image_data FROM items"))
+
+def checksum(database)-> str:
+    return hashlib.sha256(database.read_bytes()).hexdigest()
+
+def test_find_duplicate_blobs(conn):
+    report, = storage.find_duplicate_blobs(conn, [IMAGES])
+    by_id = images(conn)
+    assert report.blobs == len(by_id) and report.total_bytes == sum(map(len, by_id.values()))
+    assert report.duplicates
+    for group in report.duplicates:
+        assert len({by_id[key] for key in group.keys}) == 1
+        assert hashlib.sha256(by_id[group.keys[0]]).hexdigest() == group.sha256 and group.size == len(by_id[group.keys[0]])
+    ## Every set of identical blobs is found, and nothing else
+    identical = {}
+    for id, blob in by_id.items():
+        identical.setdefault(blob, set()).add(id)
+    assert sorted(map(sorted, (ids for ids in identical.values() if len(ids) > 1))) == sorted(sorted(group.keys) for group in report.duplicates)
+    assert report.wasted_bytes == sum(group.size * (len(group.keys) - 1) for group in report.duplicates)
+
+def test_compact_copy_repeated(database, conn, tmp_path):
+    before = checksum(database)
+    original = images(conn)
+    reports = storage.find_duplicate_blobs(conn)
+    destination = tmp_path / "compacted"
+    sizes = storage.compact_copy(conn, destination, "repeated", reports)
+    assert checksum(database) == before
+    copy, _ = ECE.connect_to_db(destination, mode="ro")
+    try:
+        stripped = images(copy)
+        report = next(report for report in reports if (report.table, report.column) == IMAGES)
+        repeats = {key for group in report.duplicates for key in group.keys[1:]}
+        ## Only the first row of each group keeps its image; the others lose it
+        assert {id for id, blob in stripped.items() if blob is None} == repeats
+        assert all(stripped[id] == blob for id, blob in original.items() if id not in repeats)
+        assert copy.execute("SELECT count(*) FROM items").fetchone()[0] == len(original)
+        assert copy.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    finally:
+        copy.close()
+    assert sizes == (storage.database_size(conn), destination.stat().st_size) and sizes[1] < sizes[0]
+    with pytest.raises(FileExistsError):
+        storage.compact_copy(conn, destination, "repeated", reports)
+
+def test_compact_copy_all(database, conn, tmp_path):
+    before = checksum(database)
+    storage.compact_copy(conn, tmp_path / "compacted", "all")
+    assert checksum(database) == before
+    copy, _ = ECE.connect_to_db(tmp_path / "compacted", mode="ro")
+    try:
+        for table, column in storage.IMAGE_COLUMNS:
+            assert copy.execute(f"SELECT count({column}) FROM {table.value}").fetchone()[0] == 0
+    finally:
+        copy.close()
+    with pytest.raises(ValueError):
+        storage.compact_copy(conn, tmp_path / "other", "duplicates")
+
+@pytest.mark.parametrize("dbstat", [False, None])
+def test_profile_size(conn, dbstat):
+    profile = storage.profile_size(conn, dbstat=dbstat)
+    assert profile.file_bytes == storage.database_size(conn)
+    title_bytes = conn.execute("SELECT sum(length(CAST(title AS BLOB))) FROM items").fetchone()[0]
+    assert profile.column_bytes[(Tables.ITEMS, Items.TITLE.value)] == title_bytes
+    if profile.source == "length":
+        assert profile.table_bytes[Tables.ITEMS] == sum(size for (table, _), size in profile.column_bytes.items() if table == Tables.ITEMS)
+    else:
+        assert sum(profile.table_bytes.values()) <= profile.file_bytes
+    collections = profile.collections
+    assert len(collections) == conn.execute("SELECT count(*) FROM collections").fetchone()[0]
+    assert [size for *_, size in collections] == sorted((size for *_, size in collections), reverse=True)
+    id, _, items, _ = collections[0]
+    assert items == conn.execute("SELECT count(*) FROM collections_items_relationship WHERE parent_id = ?", (id,)).fetchone()[0]
+
+def test_compact(database, conn, tmp_path):
+    before = checksum(database)
+    offline = (Tables.ITEMS_OFFLINE_DATA, Items_Offline_Data.OFFLINE_FILE_DATA.value)
+    profile, compacted = storage.compact(conn, tmp_path / "compacted", [IMAGES, offline])
+    assert checksum(database) == before
+    assert compacted.file_bytes < profile.file_bytes and compacted.free_pages == 0
+    copy, _ = ECE.connect_to_db(tmp_path / "compacted", mode="ro")
+    try:
+        assert copy.execute("SELECT count(canonical_image_data), count(*) FROM items").fetchone() == (0, len(images(conn)))
+        assert copy.execute("SELECT count(*) FROM items_offline_data").fetchone()[0] == 0
+        assert copy.execute("SELECT count(*) FROM collections").fetchone() == conn.execute("SELECT count(*) FROM collections").fetchone()
+    finally:
+        copy.close()
+    with pytest.raises(ValueError):
+        storage.compact(conn, tmp_path / "other", [(Tables.ITEMS, Items.DATE_CREATED.value)])
@@ -0,0 +1,34 @@
+import sqlite3
+
+import pytest
+
+from EdgeCollectionsEditor import synthetic
+from tests.conftest import ITEMS
+
+def test_schema_is_package_data():
+    assert "CREATE TABLE items" in synthetic.SCHEMA.read_text()
+
+def test_build_database(template):
+    conn = sqlite3.connect(template)
+    try:
+        assert conn.execute("SELECT count(*) FROM items").fetchone()[0] == ITEMS
+        assert conn.execute("SELECT count(*) FROM items_sync").fetchone()[0] == ITEMS
+        ## Every item is in at least one collection, and every relationship points at real rows
+        assert conn.execute("SELECT count(DISTINCT item_id) FROM collections_items_relationship").fetchone()[0] == ITEMS
+        assert conn.execute("""SELECT count(*) FROM collections_items_relationship
+                            WHERE item_id NOT IN (SELECT id FROM items) OR parent_id NOT IN (SELECT id FROM collections)""").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+def test_build_database_is_reproducible(tmp_path):
+    dumps = []
+    for name in ("a.db", "b.db"):
+        synthetic.build_database(tmp_path / name, items=50, seed=3)
+        conn = sqlite3.connect(tmp_path / name)
+        dumps.append(list(conn.iterdump()))
+        conn.close()
+    assert dumps[0] == dumps[1]
+
+def test_build_database_refuses_existing(database):
+    with pytest.raises(FileExistsError):
+        synthetic.build_database(database)
@@ -0,0 +1,61 @@
+import pytest
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import tags, utils
+from tests.conftest import ITEMS, add_item, delete_item
+
+## Tags with nulls, missing paths, objects and arrays, which the index must agree with the JSON1 queries on
+TAGS = {
+    "null": '{"owner": null}',
+    "string": '{"owner": "me", "meta": {"labels": ["a", "b"]}}',
+    "nested": '{"meta": {"labels": [], "empty": {}}}',
+    "invalid": "{not json",
+}
+FILTERS = ["owner", "owner=null", "owner!=null", "owner=me", "owner!=you", "meta", "meta.labels", "meta.empty",
+           'meta.labels=["a","b"]', "meta.labels=[]", "meta.empty={}", "meta.labels[1]=b", "meta.labels[0]~a"]
+
+@pytest.fixture
+def index(database):
+    index = tags.connect_index(database)
+    yield index
+    index.close()
+
+def test_refresh_index(index, conn):
+    results = tags.refresh_index(index)
+    collections = conn.execute("SELECT count(*) FROM collections").fetchone()[0]
+    assert results == {Tables.ITEMS: (ITEMS, 0), Tables.COLLECTIONS: (collections, 0)}
+    assert tags.refresh_index(index) == {Tables.ITEMS: (0, 0), Tables.COLLECTIONS: (0, 0)}
+    filter = tags.parse_tag_filter("read=true")
+    assert sorted(tags.index_lookup(index, Tables.ITEMS, [filter])) == sorted(row["id"] for row in tags.get_by_tags(conn, Tables.ITEMS, [filter]))
+
+def test_refresh_index_finds_older_dated_and_deleted_rows(index, conn):
+    tags.refresh_index(index)
+    high_water = index.execute("SELECT date_modified FROM high_water WHERE kind = 'items'").fetchone()[0]
+    add_item(conn, "restored", high_water - 365 * 86_400_000, tag='{"restored": true}')
+    deleted = conn.execute("SELECT id FROM items LIMIT 1").fetchone()[0]
+    delete_item(conn, deleted)
+    late = conn.execute("SELECT id FROM items WHERE id != 'restored' LIMIT 1").fetchone()[0]
+    conn.execute("UPDATE items SET tag = '{\"late\": 1}', date_modified = ? WHERE id = ?", (high_water - utils.HIGH_WATER_MARGIN / 2, late))
+    conn.commit()
+
+    assert tags.refresh_index(index)[Tables.ITEMS] == (2, 1)
+    assert sorted(tags.index_lookup(index, Tables.ITEMS, [])) == sorted(row[0] for row in conn.execute("SELECT id FROM items"))
+    assert tags.index_lookup(index, Tables.ITEMS, [tags.parse_tag_filter("restored")]) == ["restored"]
+    assert tags.index_lookup(index, Tables.ITEMS, [tags.parse_tag_filter("late=1")]) == [late]
+    assert deleted not in tags.index_lookup(index, Tables.ITEMS, [tags.parse_tag_filter("read")])
+    assert tags.refresh_index(index)[Tables.ITEMS] == (0, 0)
+
+@pytest.mark.parametrize("text", FILTERS)
+def test_index_lookup_matches_queries(index, conn, text):
+    for id, tag in TAGS.items():
+        add_item(conn, id, tag=tag)
+    tags.refresh_index(index)
+    filters = [tags.parse_tag_filter(text)]
+    expected = {row["id"] for row in tags.get_by_tags(conn, Tables.ITEMS, filters)}
+    assert set(tags.index_lookup(index, Tables.ITEMS, filters)) == expected
+    assert expected and expected <= set(TAGS)
+
+def test_not_null_needs_the_path(conn):
+    add_item(conn, "null", tag=TAGS["null"])
+    add_item(conn, "string", tag=TAGS["string"])
+    assert [row["id"] for row in tags.get_by_tags(conn, Tables.ITEMS, [tags.parse_tag_filter("owner!=null")])] == ["string"]
@@ -0,0 +1,42 @@
+import pytest
+
+from EdgeCollectionsEditor.enums import *
+from EdgeCollectionsEditor import watch
+from tests.conftest import add_item, delete_item
+
+@pytest.fixture
+def watcher(database):
+    watcher = watch.Watcher(database)
+    yield watcher
+    watcher.close()
+
+def events_by_table(events: list[watch.ChangeEvent])-> dict[Tables, watch.ChangeEvent]:
+    return {event.table: event for event in events}
+
+def test_no_changes(watcher):
+    assert watcher.poll(force=True) == []
+
+def test_added_modified_and_removed(watcher, conn):
+    collection = conn.execute("SELECT id FROM collections LIMIT 1").fetchone()[0]
+    removed, modified = [row[0] for row in conn.execute("SELECT id FROM items LIMIT 2")]
+    add_item(conn, "new", collection=collection)
+    delete_item(conn, removed)
+    conn.execute("UPDATE items SET title = 'Modified', date_modified = ? WHERE id = ?", (watcher.high_water[Tables.ITEMS] + 1, modified))
+    conn.commit()
+    events = events_by_table(watcher.poll(force=True))
+    items = events[Tables.ITEMS]
+    assert (items.added, items.modified, items.removed) == (["new"], [modified], [removed])
+    assert items.rows["new"]["id"] == "new" and items.rows[modified]["title"] == "Modified"
+    relationships = events[Tables.COLLECTIONS_ITEMS_RELATIONSHIP]
+    assert ("new", collection) in relationships.added
+    assert all(item_id == removed for item_id, _ in relationships.removed)
+    assert watcher.poll(force=True) == []
+
+def test_older_dated_row_is_added(watcher, conn):
+    """ A row restored or synced with a date_modified far before the high-water mark is still reported, once. """
+    add_item(conn, "restored", 1_000)
+    items = events_by_table(watcher.poll(force=True))[Tables.ITEMS]
+    assert items.added == ["restored"] and items.rows["restored"]["date_modified"] == 1_000
+    assert watcher.known[Tables.ITEMS]["restored"] == 1_000
+    assert conn.execute("SELECT count(*) FROM items").fetchone()[0] == len(watcher.known[Tables.ITEMS])
+    assert watcher.poll(force=True) == []
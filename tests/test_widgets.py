@@ -0,0 +1,60 @@
+import pytest
+
+tk = pytest.importorskip("tkinter")
+
+from EdgeCollectionsEditor.gui.widgets import VirtualListbox
+
+@pytest.fixture
+def root():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("No display")
+    root.withdraw()
+    yield root
+    root.destroy()
+
+def listbox(root, selectmode: str)-> VirtualListbox:
+    widget = VirtualListbox(root, selectmode=selectmode)
+    widget.visible = 10
+    widget.set_labels([f"row {index}" for index in range(100)])
+    return widget
+
+def test_keys_move_the_selection(root):
+    widget = listbox(root, "single")
+    ## Nothing is selected, so Down starts at the first visible row
+    widget._move(1)
+    assert widget.curselection() == [0]
+    widget._move(1)
+    assert widget.curselection() == [1]
+    widget._move(widget.visible)
+    assert widget.curselection() == [11] and widget.offset == 2
+    widget._move(len(widget.view))
+    assert widget.curselection() == [99] and widget.offset == 90
+    widget._move(-len(widget.view))
+    assert widget.curselection() == [0] and widget.offset == 0
+    widget._move(-1)
+    assert widget.curselection() == [0]
+
+def test_keys_move_through_the_view(root):
+    widget = listbox(root, "single")
+    widget.selected = {50}
+    widget.set_view([5, 50, 95])
+    widget._move(1)
+    assert widget.curselection() == [95]
+    widget._move(-1)
+    widget._move(-1)
+    assert widget.curselection() == [5]
+
+def test_keys_move_the_cursor_with_multiple_selection(root):
+    widget = listbox(root, "multiple")
+    widget.selected = {3}
+    widget._move(len(widget.view))
+    ## The cursor is scrolled into view, but only Space selects
+    assert widget.offset == 90 and widget.curselection() == [3]
+    widget._toggle()
+    widget._move(-1)
+    widget._toggle()
+    assert widget.curselection() == [3, 98, 99]
+    widget._toggle()
+    assert widget.curselection() == [3, 99]